@@ -0,0 +1,134 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+
+from metricas import registro as metricas
+
+
+class Sobrecarga(Exception):
+    """A análise não foi feita por falta de capacidade; o cliente pode tentar de novo depois"""
+    status = 503
+
+    def __init__(self, mensagem, retry_after):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class FilaCheia(Sobrecarga):
+    status = 429
+
+
+class PrazoEsgotado(Sobrecarga):
+    status = 503
+
+
+class ExecutorLimitado:
+    """Roda a análise das requisições em um pool de threads de tamanho fixo, com fila limitada.
+
+    Com workers gthread, as threads do gunicorn só recebem e respondem; o trabalho de
+    CPU vai para `threads` threads deste pool. Até `max_fila` análises esperam na fila.
+    Com a fila cheia, ou se a espera estimada pela fila já passa do prazo da
+    requisição, ela é recusada na hora (FilaCheia, 429) em vez de esperar sem limite.
+    Uma análise que ainda não começou quando o prazo da requisição acaba é cancelada
+    (PrazoEsgotado, 503); uma que já começou vai até o fim. As duas exceções trazem
+    um Retry-After estimado pela fila e pelo tempo médio de serviço.
+    """
+
+    def __init__(self, threads=2, max_fila=16, prazo=30.0):
+        self.threads = threads
+        self.max_fila = max_fila
+        self.prazo = prazo
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        # Média móvel exponencial do tempo de execução, para o Retry-After
+        self._tempo_medio = 0.05
+
+    def executar(self, funcao, *args, prazo=None):
+        """Resultado de funcao(*args), rodada no pool; `prazo` (segundos) encurta o padrão"""
+        prazo = min(self.prazo, prazo) if prazo is not None else self.prazo
+        limite = time.perf_counter() + prazo
+        pool = self._garantir_pool()
+        with self._lock:
+            espera_estimada = max(0, self._pendentes - self.threads + 1) * self._tempo_medio / self.threads
+            if self._pendentes >= self.threads + self.max_fila or espera_estimada > prazo:
+                metricas.incrementar('detector_admissao_total', resultado='fila_cheia')
+                raise FilaCheia('Servidor ocupado, fila de análises cheia.', self._retry_after())
+            self._pendentes += 1
+            metricas.definir('detector_analises_pendentes', self._pendentes)
+
+        enviado = time.perf_counter()
+        futuro = pool.submit(self._rodar, funcao, args, enviado, limite)
+        futuro.add_done_callback(self._concluir)
+        try:
+            resultado, tempos = futuro.result(timeout=max(0.0, limite - time.perf_counter()))
+        except TempoEsgotado:
+            if futuro.cancel():
+                metricas.incrementar('detector_admissao_total', resultado='prazo_esgotado')
+                raise PrazoEsgotado('Prazo da requisição esgotado na fila de análises.', self._retry_after())
+            # Já está rodando: não há como interromper a thread, então espera terminar
+            resultado, tempos = futuro.result()
+        metricas.somar_tempos(tempos)
+        return resultado
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'threads': self.threads,
+                'max_fila': self.max_fila,
+                'prazo': self.prazo,
+                'pendentes': self._pendentes,
+                'tempo_medio_ms': round(self._tempo_medio * 1000, 2)
+            }
+
+    def _rodar(self, funcao, args, enviado, limite):
+        inicio = time.perf_counter()
+        metricas.observar('detector_etapa_segundos', inicio - enviado, etapa='fila')
+        if inicio > limite:
+            # O prazo acabou entre o result() da requisição e o cancel(): não vale mais a pena
+            metricas.incrementar('detector_admissao_total', resultado='prazo_esgotado')
+            raise PrazoEsgotado('Prazo da requisição esgotado na fila de análises.', self._retry_after())
+        # Os tempos das etapas são coletados aqui e somados ao Server-Timing da requisição
+        with metricas.coletar_tempos() as tempos:
+            resultado = funcao(*args)
+        duracao = time.perf_counter() - inicio
+        tempos['fila'] = inicio - enviado
+        with self._lock:
+            self._tempo_medio = 0.9 * self._tempo_medio + 0.1 * duracao
+        metricas.incrementar('detector_admissao_total', resultado='executada')
+        return resultado, tempos
+
+    def _concluir(self, futuro):
+        with self._lock:
+            self._pendentes -= 1
+            metricas.definir('detector_analises_pendentes', self._pendentes)
+
+    def _retry_after(self):
+        # Segundos para a fila atual escoar, pelo tempo médio de cada análise
+        return max(1, min(60, math.ceil(self._pendentes * self._tempo_medio / self.threads)))
+
+    def _garantir_pool(self):
+        # Threads não sobrevivem ao fork: cada worker cria o seu pool no primeiro uso
+        if self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='analise')
+                self._pendentes = 0
+                self._pid = os.getpid()
+        return self._pool
+
+
+def executor_do_ambiente():
+    """Pool de análise configurado pelo ambiente, ou None para analisar na thread da requisição"""
+    threads = int(os.environ.get('ANALISE_THREADS', 0))
+    if threads <= 0:
+        return None
+    return ExecutorLimitado(
+        threads=threads,
+        max_fila=int(os.environ.get('ANALISE_FILA_MAX', 16)),
+        prazo=float(os.environ.get('PRAZO_REQUISICAO', 30))
+    )
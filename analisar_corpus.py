@@ -0,0 +1,402 @@
+"""Analisa um corpus inteiro fora do app, em paralelo, com retomada.
+
+Uso:
+    python analisar_corpus.py redacoes/ --saida resultados.jsonl
+    python analisar_corpus.py corpus.jsonl --saida resultados/ --formato colunas --jobs 8
+    python analisar_corpus.py corpus.csv --saida resultados.jsonl --termos
+
+A entrada pode ser um diretório (cada arquivo .txt é um documento), um JSONL ou um CSV
+com o campo text/texto (e, opcionalmente, id). Os documentos são lidos em streaming e
+analisados em blocos por um pool de processos; cada worker carrega o modelo uma vez.
+Os resultados são gravados na ordem da entrada, conforme ficam prontos:
+
+- jsonl: uma linha por documento, com probabilidades e estatísticas (e, com --termos,
+  os termos no formato compacto da API);
+- colunas: um diretório com um arquivo binário por coluna, lido com ler_colunas()
+  (np.memmap) sem carregar o resultado inteiro.
+
+O progresso é salvo em <saida>.checkpoint.json. Rodar de novo o mesmo comando depois
+de uma interrupção descarta o que foi gravado após o último checkpoint e continua dali.
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app import AIDetectorComRelatorio, CAMINHO_MODELO
+from formato_resposta import compactar_resultado, dicionario_tipos
+
+CAMPOS_TEXTO = ('text', 'texto')
+CAMPOS_ID = ('id', 'identificador', 'arquivo')
+VERSAO_CHECKPOINT = 1
+
+_detector_worker = None
+_indice_tipos_worker = None
+
+
+def ler_entrada(caminho, extensao='.txt', documentos=0, offset=None):
+    """Gera (id, texto, offset) a partir do documento de número `documentos`.
+
+    Para JSONL, `offset` é a posição em bytes logo após a linha do documento, e a
+    retomada pula direto para ela; nos outros formatos os documentos já feitos são
+    pulados pela contagem.
+    """
+    if os.path.isdir(caminho):
+        yield from _pular(_ler_diretorio(caminho, extensao), documentos)
+    elif caminho.endswith('.csv'):
+        yield from _pular(_ler_csv(caminho), documentos)
+    else:
+        yield from _ler_jsonl(caminho, documentos, offset)
+
+
+def _pular(documentos_lidos, quantidade):
+    for i, item in enumerate(documentos_lidos):
+        if i >= quantidade:
+            yield item
+
+
+def _ler_diretorio(caminho, extensao):
+    for raiz, subdiretorios, arquivos in os.walk(caminho):
+        # Ordem determinística: a retomada depende de ler os documentos sempre na mesma sequência
+        subdiretorios.sort()
+        for nome in sorted(arquivos):
+            if not nome.endswith(extensao):
+                continue
+            arquivo = os.path.join(raiz, nome)
+            with open(arquivo, encoding='utf-8', errors='replace') as f:
+                yield os.path.relpath(arquivo, caminho), f.read(), None
+
+
+def _ler_csv(caminho):
+    csv.field_size_limit(sys.maxsize)
+    with open(caminho, newline='', encoding='utf-8') as f:
+        for i, registro in enumerate(csv.DictReader(f)):
+            texto = next((registro[c] for c in CAMPOS_TEXTO if registro.get(c) is not None), '')
+            yield next((registro[c] for c in CAMPOS_ID if registro.get(c)), i), texto, None
+
+
+def _ler_jsonl(caminho, documentos, offset):
+    with open(caminho, 'rb') as f:
+        if offset:
+            f.seek(offset)
+            pular, i = 0, documentos
+        else:
+            pular, i = documentos, 0
+        for linha in iter(f.readline, b''):
+            if not linha.strip():
+                continue
+            if i < pular:
+                i += 1
+                continue
+            registro = json.loads(linha)
+            texto = next((registro[c] for c in CAMPOS_TEXTO if registro.get(c) is not None), '')
+            yield next((registro[c] for c in CAMPOS_ID if registro.get(c) is not None), i), texto, f.tell()
+            i += 1
+
+
+def _iniciar_worker(caminho_modelo):
+    # Ctrl+C fica com o processo principal, que salva o checkpoint e encerra o pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _preparar_worker(AIDetectorComRelatorio(caminho_modelo=caminho_modelo))
+
+
+def _preparar_worker(detector):
+    global _detector_worker, _indice_tipos_worker
+    _detector_worker = detector
+    _indice_tipos_worker = {nome: i for i, nome in enumerate(dicionario_tipos(detector)['nome'])}
+
+
+def _analisar_bloco(bloco, incluir_termos):
+    """Analisa um bloco de (id, texto) com uma única chamada ao modelo e monta os registros"""
+    textos = [texto.strip() if isinstance(texto, str) else texto for _, texto in bloco]
+    registros = []
+    for (identificador, _), texto, resultado in zip(bloco, textos, _detector_worker.predict_batch(textos)):
+        registro = {'id': identificador}
+        if 'error' in resultado:
+            registro['error'] = resultado['error']
+        else:
+            registro.update({
+                'ai_probability': resultado['ai_probability'],
+                'human_probability': resultado['human_probability'],
+                'confidence': resultado['confidence'],
+                'comprimento': resultado['text_analyzed_length'],
+                'estatisticas_deteccao': resultado['estatisticas_deteccao']
+            })
+            if incluir_termos:
+                registro['termos'] = compactar_resultado(resultado, _indice_tipos_worker)['termos']
+        registros.append(registro)
+    return registros
+
+
+def _em_blocos(documentos, tamanho):
+    bloco = []
+    for documento in documentos:
+        bloco.append(documento)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+class EscritorJsonl:
+    def __init__(self, caminho, tamanhos=None):
+        self.caminho = caminho
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(pasta, exist_ok=True)
+        self._arquivo = open(caminho, 'ab')
+        # Descarta o que foi gravado depois do último checkpoint
+        self._arquivo.truncate((tamanhos or {}).get(caminho, 0))
+        self._arquivo.seek(0, os.SEEK_END)
+
+    def escrever(self, registros):
+        self._arquivo.write(b''.join(
+            json.dumps(registro, ensure_ascii=False).encode('utf-8') + b'\n' for registro in registros
+        ))
+
+    def tamanhos(self):
+        """Tamanho gravado até aqui (contando o buffer), sem esperar o disco"""
+        return {self.caminho: self._arquivo.tell()}
+
+    def sincronizar(self):
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class EscritorColunas:
+    """Um arquivo binário por coluna (como as matrizes de features do treinar.py) e um colunas.json"""
+
+    def __init__(self, diretorio, tipos, tamanhos=None):
+        self.diretorio = diretorio
+        self.tipos = tipos
+        self.colunas = {
+            'ok': 'i1',
+            'ai_probability': 'f4',
+            'confidence': 'f4',
+            'comprimento': 'i8',
+            'total_termos': 'i4',
+            'densidade_termos': 'f4',
+            **{f'termos_{nome}': 'i4' for nome in tipos['nome']}
+        }
+        os.makedirs(diretorio, exist_ok=True)
+        tamanhos = tamanhos or {}
+        self._arquivos = {}
+        for nome in ['ids', *self.colunas]:
+            caminho = self._caminho(nome)
+            self._arquivos[nome] = open(caminho, 'ab')
+            self._arquivos[nome].truncate(tamanhos.get(caminho, 0))
+            self._arquivos[nome].seek(0, os.SEEK_END)
+        self.linhas = tamanhos.get('linhas', 0)
+
+    def _caminho(self, nome):
+        if nome == 'ids':
+            return os.path.join(self.diretorio, 'ids.jsonl')
+        return os.path.join(self.diretorio, f'{nome}.{self.colunas[nome]}')
+
+    def escrever(self, registros):
+        valores = {nome: [] for nome in self.colunas}
+        for registro in registros:
+            estatisticas = registro.get('estatisticas_deteccao', {})
+            por_tipo = estatisticas.get('termos_por_tipo', {})
+            valores['ok'].append('error' not in registro)
+            valores['ai_probability'].append(registro.get('ai_probability', np.nan))
+            valores['confidence'].append(registro.get('confidence', np.nan))
+            valores['comprimento'].append(registro.get('comprimento', 0))
+            valores['total_termos'].append(estatisticas.get('total_termos', 0))
+            valores['densidade_termos'].append(estatisticas.get('densidade_termos', 0.0))
+            for nome in self.tipos['nome']:
+                valores[f'termos_{nome}'].append(por_tipo.get(nome, 0))
+        for nome, dtype in self.colunas.items():
+            np.asarray(valores[nome], dtype=dtype).tofile(self._arquivos[nome])
+        self._arquivos['ids'].write(b''.join(
+            json.dumps(registro['id'], ensure_ascii=False).encode('utf-8') + b'\n' for registro in registros
+        ))
+        self.linhas += len(registros)
+
+    def tamanhos(self):
+        """Linhas e tamanho de cada arquivo até aqui (contando o buffer), sem esperar o disco"""
+        tamanhos = {'linhas': self.linhas}
+        for nome, arquivo in self._arquivos.items():
+            tamanhos[self._caminho(nome)] = arquivo.tell()
+        return tamanhos
+
+    def sincronizar(self):
+        for arquivo in self._arquivos.values():
+            arquivo.flush()
+            os.fsync(arquivo.fileno())
+        self._gravar_esquema()
+
+    def _gravar_esquema(self):
+        caminho = os.path.join(self.diretorio, 'colunas.json')
+        with open(f'{caminho}.tmp', 'w') as f:
+            json.dump({'linhas': self.linhas, 'colunas': self.colunas, 'tipos': self.tipos}, f, ensure_ascii=False)
+        os.replace(f'{caminho}.tmp', caminho)
+
+    def fechar(self):
+        for arquivo in self._arquivos.values():
+            arquivo.close()
+
+
+def ler_colunas(diretorio):
+    """Colunas gravadas com --formato colunas, como np.memmap (ids em lista)"""
+    with open(os.path.join(diretorio, 'colunas.json')) as f:
+        esquema = json.load(f)
+    linhas = esquema['linhas']
+    colunas = {
+        nome: np.memmap(os.path.join(diretorio, f'{nome}.{dtype}'), dtype=dtype, mode='r', shape=(linhas,))
+        if linhas else np.zeros(0, dtype=dtype)
+        for nome, dtype in esquema['colunas'].items()
+    }
+    with open(os.path.join(diretorio, 'ids.jsonl'), encoding='utf-8') as f:
+        colunas['ids'] = [json.loads(next(f)) for _ in range(linhas)]
+    return colunas
+
+
+def ler_checkpoint(caminho):
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def gravar_checkpoint(caminho, checkpoint):
+    with open(f'{caminho}.tmp', 'w') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(f'{caminho}.tmp', caminho)
+
+
+def analisar(args):
+    caminho_checkpoint = f"{args.saida.rstrip(os.sep)}.checkpoint.json"
+    detector = AIDetectorComRelatorio(caminho_modelo=args.modelo)
+    identidade = {
+        'versao': VERSAO_CHECKPOINT,
+        'entrada': os.path.abspath(args.entrada),
+        'formato': args.formato,
+        'termos': args.termos,
+        'versao_detector': detector.versao
+    }
+
+    checkpoint = None if args.do_zero else ler_checkpoint(caminho_checkpoint)
+    if checkpoint is not None and checkpoint['identidade'] != identidade:
+        raise SystemExit(f'O checkpoint {caminho_checkpoint} é de outra entrada, formato ou modelo; use --do-zero.')
+    if checkpoint is not None and checkpoint.get('concluido'):
+        print(f"✅ Nada a fazer: {checkpoint['documentos']} documentos já analisados em {args.saida}")
+        return
+    checkpoint = checkpoint or {'identidade': identidade, 'documentos': 0, 'offset': None, 'tamanhos': {}, 'erros': 0}
+    if checkpoint['documentos']:
+        print(f"♻️  Retomando depois de {checkpoint['documentos']} documentos")
+
+    if args.formato == 'colunas':
+        escritor = EscritorColunas(args.saida, dicionario_tipos(detector), checkpoint['tamanhos'])
+    else:
+        escritor = EscritorJsonl(args.saida, checkpoint['tamanhos'])
+
+    documentos = ler_entrada(args.entrada, args.extensao, checkpoint['documentos'], checkpoint['offset'])
+    blocos = _em_blocos(documentos, args.bloco)
+    inicio = time.perf_counter()
+    feitos = erros = caracteres = 0
+    ultimo_checkpoint = ultimo_aviso = inicio
+    # Posição na entrada e tamanho da saída que andam juntos; só muda, de uma vez, depois de um bloco gravado
+    progresso = {chave: checkpoint[chave] for chave in ('documentos', 'offset', 'erros')}
+    progresso['tamanhos'] = escritor.tamanhos()
+
+    def salvar(concluido=False):
+        # Um Ctrl+C entre a gravação de um bloco e a troca de `progresso` deixa o bloco fora do
+        # checkpoint: a retomada corta a saída no tamanho anterior a ele e o refaz uma vez só
+        escritor.sincronizar()
+        checkpoint.update(progresso)
+        checkpoint['concluido'] = concluido
+        gravar_checkpoint(caminho_checkpoint, checkpoint)
+
+    def registrar(bloco, registros):
+        nonlocal feitos, erros, caracteres, ultimo_checkpoint, ultimo_aviso, progresso
+        escritor.escrever(registros)
+        progresso = {
+            'documentos': progresso['documentos'] + len(bloco),
+            'offset': bloco[-1][2],
+            'erros': progresso['erros'] + sum('error' in registro for registro in registros),
+            'tamanhos': escritor.tamanhos()
+        }
+        feitos += len(bloco)
+        erros += sum('error' in registro for registro in registros)
+        caracteres += sum(len(texto) for _, texto, _ in bloco if isinstance(texto, str))
+
+        agora = time.perf_counter()
+        if agora - ultimo_checkpoint >= args.checkpoint:
+            salvar()
+            ultimo_checkpoint = agora
+        if agora - ultimo_aviso >= 2:
+            decorrido = agora - inicio
+            print(f"⚙️  {progresso['documentos']} documentos ({feitos / decorrido:.0f}/s, "
+                  f"{caracteres / decorrido / 1e6:.2f} M caracteres/s, {erros} erros)", flush=True)
+            ultimo_aviso = agora
+
+    pool = None
+    try:
+        if args.jobs <= 1:
+            _preparar_worker(detector)
+            for bloco in blocos:
+                registrar(bloco, _analisar_bloco([(i, t) for i, t, _ in bloco], args.termos))
+        else:
+            pool = ProcessPoolExecutor(max_workers=args.jobs, initializer=_iniciar_worker, initargs=(args.modelo,))
+            # Poucos blocos em voo: a memória não cresce com o corpus e a saída sai na ordem da entrada
+            pendentes = deque()
+            for bloco in blocos:
+                pendentes.append((bloco, pool.submit(_analisar_bloco, [(i, t) for i, t, _ in bloco], args.termos)))
+                if len(pendentes) >= args.jobs * 4:
+                    registrar(*_resultado(pendentes.popleft()))
+            while pendentes:
+                registrar(*_resultado(pendentes.popleft()))
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        salvar()
+        escritor.fechar()
+        print(f"\n⏸️  Interrompido; {checkpoint['documentos']} documentos salvos. Rode o mesmo comando para continuar.")
+        raise SystemExit(130)
+
+    if pool is not None:
+        pool.shutdown()
+    salvar(concluido=True)
+    escritor.fechar()
+    decorrido = time.perf_counter() - inicio
+    print(f"✅ {checkpoint['documentos']} documentos em {args.saida} ({feitos} nesta execução, "
+          f"{feitos / decorrido if decorrido else 0:.0f}/s, {checkpoint['erros']} erros)")
+
+
+def _resultado(pendente):
+    bloco, futuro = pendente
+    return bloco, futuro.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analisa um corpus inteiro com o detector, em paralelo')
+    parser.add_argument('entrada', help='diretório de arquivos de texto, JSONL ou CSV')
+    parser.add_argument('--saida', required=True, help='arquivo .jsonl ou diretório (com --formato colunas)')
+    parser.add_argument('--formato', choices=['jsonl', 'colunas'], default='jsonl')
+    parser.add_argument('--termos', action='store_true', help='inclui as posições e tipos dos termos (só jsonl)')
+    parser.add_argument('--modelo', default=CAMINHO_MODELO, help='artefato gerado por treinar.py')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='processos de análise')
+    parser.add_argument('--bloco', type=int, default=64, help='documentos por tarefa (e por chamada ao modelo)')
+    parser.add_argument('--extensao', default='.txt', help='extensão dos arquivos lidos de um diretório')
+    parser.add_argument('--checkpoint', type=float, default=5.0, help='segundos entre checkpoints')
+    parser.add_argument('--do-zero', action='store_true', help='ignora o checkpoint e recomeça')
+    args = parser.parse_args()
+    if args.termos and args.formato == 'colunas':
+        parser.error('--termos só é suportado com --formato jsonl')
+    analisar(args)
+
+
+if __name__ == '__main__':
+    main()
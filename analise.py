@@ -0,0 +1,101 @@
+import re
+from collections import Counter
+from functools import cached_property
+
+import numpy as np
+
+REGEX_PALAVRA = re.compile(r'\b\w+\b')
+REGEX_FIM_FRASE = re.compile(r'[.!?]+(?:\s+|$)')
+REGEX_FIM_PARAGRAFO = re.compile(r'\n[ \t\r\f\v]*\n\s*')
+
+
+def spans_frases(texto):
+    """Posições (inicio, fim) das frases, já sem espaços nas pontas.
+
+    Produz exatamente as mesmas frases que re.split(REGEX_FIM_FRASE) seguido de strip,
+    mas sem copiar o texto e guardando onde cada frase está.
+    """
+    return _spans_separados(texto, REGEX_FIM_FRASE)
+
+
+def spans_paragrafos(texto):
+    """Posições (inicio, fim) dos parágrafos, separados por linhas em branco"""
+    return _spans_separados(texto, REGEX_FIM_PARAGRAFO)
+
+
+def _spans_separados(texto, separador):
+    spans = []
+    inicio = 0
+    for match in separador.finditer(texto):
+        _adicionar_span(texto, inicio, match.start(), spans)
+        inicio = match.end()
+    _adicionar_span(texto, inicio, len(texto), spans)
+    return spans
+
+
+def _adicionar_span(texto, inicio, fim, spans):
+    trecho = texto[inicio:fim]
+    sem_esquerda = trecho.lstrip()
+    if not sem_esquerda:
+        return
+    inicio += len(trecho) - len(sem_esquerda)
+    fim = inicio + len(sem_esquerda.rstrip())
+    spans.append((inicio, fim))
+
+
+class ContextoAnalise:
+    """Visões derivadas de um texto, calculadas sob demanda e memorizadas.
+
+    Criado uma vez por requisição e repassado a todas as etapas do detector,
+    para que o texto seja minusculizado, tokenizado e dividido em frases uma só vez.
+    """
+
+    def __init__(self, texto, lexico=None):
+        self.texto = texto
+        # Léxico do idioma do texto; o detector o escolhe no primeiro uso se vier None
+        self.lexico = lexico
+
+    @cached_property
+    def texto_lower(self):
+        return self.texto.lower()
+
+    @cached_property
+    def palavras(self):
+        return REGEX_PALAVRA.findall(self.texto_lower)
+
+    @cached_property
+    def contagem_palavras(self):
+        return Counter(self.palavras)
+
+    @cached_property
+    def comprimentos_palavras(self):
+        return np.fromiter(map(len, self.palavras), dtype=np.int64, count=len(self.palavras))
+
+    @cached_property
+    def spans_palavras(self):
+        """Arrays (inicios, fins) das palavras em texto_lower, na mesma ordem de `palavras`"""
+        inicios = np.fromiter(map(re.Match.start, REGEX_PALAVRA.finditer(self.texto_lower)), dtype=np.int64, count=len(self.palavras))
+        return inicios, inicios + self.comprimentos_palavras
+
+    @cached_property
+    def ids_palavras(self):
+        """Um inteiro por palavra, igual para palavras iguais (para contar distintas com NumPy)"""
+        indices = {palavra: i for i, palavra in enumerate(self.contagem_palavras)}
+        return np.fromiter(map(indices.__getitem__, self.palavras), dtype=np.int64, count=len(self.palavras))
+
+    @cached_property
+    def spans_paragrafos(self):
+        return spans_paragrafos(self.texto)
+
+    @cached_property
+    def spans_frases(self):
+        return spans_frases(self.texto)
+
+    @cached_property
+    def frases(self):
+        return [self.texto[inicio:fim] for inicio, fim in self.spans_frases]
+
+    @cached_property
+    def palavras_espaco(self):
+        # Equivalente a texto.split(), usado nas contagens de palavras da API
+        return self.texto.split()
@@ -1,139 +1,252 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 import numpy as np
-import re
+import html
 import math
-import joblib
 import os
+import json
+import time
+import hashlib
+import threading
+import functools
+import codecs
+
+from analise import ContextoAnalise
+from floresta import FlorestaCompilada, amostras_de_paridade, verificar_paridade
+from artefato import carregar_artefato, ler_metadados, salvar_artefato
+from memoria import uso_memoria
+from metricas import registro as metricas, server_timing
+from microlote import AgendadorLotes
+from janelas import iterar_janelas
+from cache_resultados import cache_do_ambiente
+from sessoes import sessoes_do_ambiente
+from admissao import Sobrecarga, executor_do_ambiente
+from quase_duplicatas import assinatura_minhash, indice_do_ambiente, reaproveitar_ocorrencias
+from estaticos import AtivosEstaticos
+from perfis import perfilador_do_ambiente
+from lexicos import lexicos_do_ambiente
+from cascata import Cascata, caminho_cascata, features_rapidas
+from ngramas import NOMES_FEATURES_NGRAMAS, TabelasNgramas, tabelas_do_ambiente
+from formato_resposta import codificacoes_aceitas, comprimir, compactar_resultado, dicionario_tipos, serializar, tipos_aceitos, TIPOS_COMPRIMIVEIS
 
 # CORREÇÃO: Importar sklearn ANTES de usar RandomForestClassifier
+import sklearn
 from sklearn.ensemble import RandomForestClassifier
 
-app = Flask(__name__)
+# A interface é servida por estaticos.py, com versão no endereço e cache imutável
+app = Flask(__name__, static_folder=None)
+
+CAMINHO_MODELO = os.environ.get('MODELO_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelo_web.pkl')
+MAX_TEXTOS_LOTE = int(os.environ.get('MAX_TEXTOS_LOTE', 1000))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+MICROLOTE_JANELA_MS = float(os.environ.get('MICROLOTE_JANELA_MS', 0))
+MICROLOTE_MAX = int(os.environ.get('MICROLOTE_MAX', 64))
+TAMANHO_JANELA = int(os.environ.get('TAMANHO_JANELA', 4000))
+COMPRESSAO = os.environ.get('COMPRESSAO', '1') == '1'
+COMPRESSAO_MIN_BYTES = int(os.environ.get('COMPRESSAO_MIN_BYTES', 1024))
+CASCATA = os.environ.get('CASCATA', '1') == '1'
+CASCATA_LIMIAR = float(os.environ['CASCATA_LIMIAR']) if os.environ.get('CASCATA_LIMIAR') else None
+
+# Incrementar quando o formato do resultado mudar, para não servir resultados antigos do cache
+VERSAO_RESULTADO = '3'
+NOMES_FEATURES = ('comprimento', 'num_palavras', 'num_frases', 'comp_medio_palavra', 'palavras_por_frase',
+                  'diversidade_lexical', 'palavras_longas', 'formalidade')
 
 class AIDetectorComRelatorio:
-    def __init__(self):
-        # AGORA o RandomForestClassifier está disponível
-        self.model = RandomForestClassifier(n_estimators=50, random_state=42)
-        self.is_trained = False
-        self.carregar_ou_treinar_modelo()
-        
-        # Padrões linguísticos típicos de IA
-        self.padroes_ia = {
-            'expressoes_formais': [
-                r'é importante destacar', r'convém ressaltar', r'considerando os fatores',
-                r'pode-se inferir', r'é fundamental observar', r'observa-se que',
-                r'conclui-se que', r'de maneira clara e objetiva', r'abordagem sistemática',
-                r'o presente estudo', r'de acordo com', r'vale ressaltar', r'verifica-se que',
-                r'cabe salientar', r'é pertinente mencionar', r'pressupõe-se que'
-            ],
-            'conectivos_complexos': [
-                r'portanto', r'consequentemente', r'adicionalmente', r'notavelmente',
-                r'consideravelmente', r'significativamente', r'efetivamente'
-            ],
-            'estruturas_passivas': [
-                r'é realizado', r'é observado', r'é verificado', r'é constatado',
-                r'é possível identificar', r'pode ser observado', r'deve ser considerado'
-            ],
-            'palavras_superlativas': [
-                r'extremamente', r'altamente', r'profundamente', r'intensamente',
-                r'significativamente', r'consideravelmente', r'notavelmente'
-            ]
+    def __init__(self, caminho_modelo=None, carregar_modelo=True):
+        # Como cada categoria é reportada: tipo, justificativa, margem do contexto e se exige \b
+        self.regras_padroes = {
+            'expressoes_formais': {
+                'tipo': 'expressao_formal',
+                'justificativa': 'Expressão excessivamente formal comum em textos de IA',
+                'margem_contexto': 50,
+                'fronteira_palavra': False
+            },
+            'conectivos_complexos': {
+                'tipo': 'conectivo_complexo',
+                'justificativa': 'Uso frequente de conectivos complexos típico de IA',
+                'margem_contexto': 30,
+                'fronteira_palavra': True
+            },
+            'estruturas_passivas': {
+                'tipo': 'voz_passiva',
+                'justificativa': 'Uso excessivo de voz passiva, comum em textos formais de IA',
+                'margem_contexto': 40,
+                'fronteira_palavra': False
+            },
+            'palavras_superlativas': {
+                'tipo': 'superlativo',
+                'justificativa': 'Uso frequente de intensificadores e superlativos',
+                'margem_contexto': 25,
+                'fronteira_palavra': True
+            }
         }
+        
+        # Padrões de IA e palavras de formalidade vêm de lexicos/<idioma>.json (ver lexicos.py):
+        # o idioma é identificado por texto e os arquivos são recarregados sem reiniciar
+        self.lexicos = lexicos_do_ambiente(self.regras_padroes)
+        
+        # O modelo só é lido do artefato gerado por `python treinar.py`; servir nunca treina
+        self.caminho_modelo = caminho_modelo or CAMINHO_MODELO
+        self.model = None
+        self.floresta = None
+        self.is_trained = False
+        self.versao_modelo = None
+        self.tempo_carga_modelo = None
+        # Primeiro nível barato, calibrado por calibrar_cascata.py (None: todo texto vai à floresta)
+        self.cascata = None
+        # Frequências de n-gramas (ver ngramas.py); com elas, extrair_features ganha NOMES_FEATURES_NGRAMAS
+        self.ngramas = tabelas_do_ambiente()
+        self._lock_modelo = threading.Lock()
+        # Opcional: junta chamadas concorrentes ao modelo (ver microlote.py)
+        self.agendador = None
+        if carregar_modelo:
+            self.carregar_modelo()
+    
+    @property
+    def versao_lexico(self):
+        # Muda com qualquer léxico ou regra: invalida cache, quase duplicatas e a calibração da cascata
+        return self.lexicos.atual().versao
+    
+    # Léxico do idioma padrão, para quem não analisa um texto específico
+    @property
+    def padroes_ia(self):
+        return self.lexico_padrao().padroes_ia
+    
+    @property
+    def palavras_formais(self):
+        return self.lexico_padrao().palavras_formais
+    
+    @property
+    def palavras_informais(self):
+        return self.lexico_padrao().palavras_informais
+    
+    @property
+    def casador(self):
+        return self.lexico_padrao().casador
+    
+    def lexico_padrao(self):
+        atual = self.lexicos.atual()
+        return atual.lexicos[atual.padrao]
+    
+    def lexico_para(self, texto_lower):
+        """Léxico do idioma do texto, na versão atual dos arquivos"""
+        return self.lexicos.atual().identificar(texto_lower)
+    
+    def lexico_de(self, contexto):
+        """Léxico do contexto, escolhido no primeiro uso e mantido até o fim da análise"""
+        if contexto.lexico is None:
+            contexto.lexico = self.lexico_para(contexto.texto_lower)
+        return contexto.lexico
+    
+    @property
+    def nomes_features(self):
+        return NOMES_FEATURES + NOMES_FEATURES_NGRAMAS if self.ngramas is not None else NOMES_FEATURES
+    
+    @property
+    def versao(self):
+        self.garantir_modelo()
+        versao_lexico = self.versao_lexico
+        versao = f'{VERSAO_RESULTADO}-{self.versao_modelo}-{versao_lexico}'
+        cascata = self.cascata_valida(versao_lexico)
+        return versao + (f'-c{cascata.versao}' if cascata is not None else '')
     
     def tokenizacao_simples(self, texto):
-        palavras = re.findall(r'\b\w+\b', texto.lower())
-        return palavras
+        return ContextoAnalise(texto).palavras
     
     def dividir_frases(self, texto):
-        frases = re.split(r'[.!?]+(?:\s+|$)', texto)
-        return [f.strip() for f in frases if f.strip()]
+        return ContextoAnalise(texto).frases
     
-    def analisar_termos_suspeitos(self, texto):
+    def analisar_termos_suspeitos(self, texto, contexto=None):
         """Analisa o texto e identifica termos/expressões suspeitos de IA"""
-        termos_detectados = []
-        texto_lower = texto.lower()
-        
-        # Analisar expressões formais típicas de IA
-        for expressao in self.padroes_ia['expressoes_formais']:
-            matches = list(re.finditer(expressao, texto_lower))
-            for match in matches:
-                start, end = match.span()
-                contexto = texto[max(0, start-50):min(len(texto), end+50)]
-                termos_detectados.append({
-                    'termo': texto[match.start():match.end()],
-                    'tipo': 'expressao_formal',
-                    'justificativa': 'Expressão excessivamente formal comum em textos de IA',
-                    'contexto': contexto,
-                    'posicao': (start, end)
-                })
-        
-        # Analisar conectivos complexos
-        for conectivo in self.padroes_ia['conectivos_complexos']:
-            if re.search(r'\b' + conectivo + r'\b', texto_lower):
-                matches = list(re.finditer(r'\b' + conectivo + r'\b', texto_lower))
-                for match in matches:
-                    termos_detectados.append({
-                        'termo': texto[match.start():match.end()],
-                        'tipo': 'conectivo_complexo',
-                        'justificativa': 'Uso frequente de conectivos complexos típico de IA',
-                        'contexto': texto[max(0, match.start()-30):min(len(texto), match.end()+30)],
-                        'posicao': (match.start(), match.end())
-                    })
-        
-        # Analisar estruturas passivas
-        for estrutura in self.padroes_ia['estruturas_passivas']:
-            matches = list(re.finditer(estrutura, texto_lower))
-            for match in matches:
-                termos_detectados.append({
-                    'termo': texto[match.start():match.end()],
-                    'tipo': 'voz_passiva',
-                    'justificativa': 'Uso excessivo de voz passiva, comum em textos formais de IA',
-                    'contexto': texto[max(0, match.start()-40):min(len(texto), match.end()+40)],
-                    'posicao': (match.start(), match.end())
-                })
+        contexto = contexto or ContextoAnalise(texto)
+        return self.montar_termos(texto, self.lexico_de(contexto).casador.encontrar(contexto.texto_lower))
+    
+    def montar_termos(self, texto, ocorrencias):
+        """Dicts dos termos a partir das ocorrências (inicio, fim, categoria, indice) do casador,
+        ordenados por categoria, padrão e posição"""
+        ordem_categorias = {categoria: i for i, categoria in enumerate(self.regras_padroes)}
+        ocorrencias = sorted(ocorrencias, key=lambda o: (ordem_categorias[o[2]], o[3], o[0]))
         
-        # Analisar palavras superlativas
-        for superlativo in self.padroes_ia['palavras_superlativas']:
-            matches = list(re.finditer(r'\b' + superlativo + r'\b', texto_lower))
-            for match in matches:
-                termos_detectados.append({
-                    'termo': texto[match.start():match.end()],
-                    'tipo': 'superlativo',
-                    'justificativa': 'Uso frequente de intensificadores e superlativos',
-                    'contexto': texto[max(0, match.start()-25):min(len(texto), match.end()+25)],
-                    'posicao': (match.start(), match.end())
-                })
+        termos_detectados = []
+        for start, end, categoria, _ in ocorrencias:
+            regra = self.regras_padroes[categoria]
+            margem = regra['margem_contexto']
+            termos_detectados.append({
+                'termo': texto[start:end],
+                'tipo': regra['tipo'],
+                'justificativa': regra['justificativa'],
+                'contexto': texto[max(0, start-margem):min(len(texto), end+margem)],
+                'posicao': (start, end)
+            })
         
         return termos_detectados
     
+    def ocorrencias_dos_termos(self, texto_lower, termos_detectados, lexico):
+        """Inverso de montar_termos: volta às ocorrências (inicio, fim, categoria, indice) do casador de `lexico`"""
+        categorias = {regra['tipo']: categoria for categoria, regra in self.regras_padroes.items()}
+        ocorrencias = []
+        for termo in termos_detectados:
+            start, end = termo['posicao']
+            categoria = categorias[termo['tipo']]
+            indice = next(i for c, i in lexico.casador.origens[texto_lower[start:end]] if c == categoria)
+            ocorrencias.append((start, end, categoria, indice))
+        return ocorrencias
+    
     def gerar_texto_destacado(self, texto, termos_detectados):
         """Gera versão do texto com termos suspeitos destacados"""
-        if not termos_detectados:
-            return texto
-            
-        texto_destacado = texto
-        # Ordenar termos por posição (do final para o início para evitar problemas com índices)
-        termos_ordenados = sorted(termos_detectados, key=lambda x: x['posicao'][0], reverse=True)
+        return ''.join(self.iterar_texto_destacado(texto, termos_detectados))
+    
+    def iterar_texto_destacado(self, texto, termos_detectados):
+        """Gera o texto destacado em pedaços, numa única passada da esquerda para a direita.
         
+        Termos sobrepostos (ex.: "significativamente" como conectivo e superlativo)
+        viram um único span, com as justificativas distintas unidas no title.
+        O texto fora e dentro dos spans é escapado como HTML.
+        """
+        termos_ordenados = sorted(termos_detectados, key=lambda t: (t['posicao'][0], -t['posicao'][1]))
+        
+        cursor = 0
+        grupo = []
+        grupo_fim = 0
         for termo_info in termos_ordenados:
             start, end = termo_info['posicao']
-            termo_original = texto[start:end]
-            
-            # Criar span com destaque
-            span_destacado = f'<span class="termo-suspeito" data-tipo="{termo_info["tipo"]}" title="{termo_info["justificativa"]}">{termo_original}</span>'
-            
-            # Inserir no texto
-            texto_destacado = texto_destacado[:start] + span_destacado + texto_destacado[end:]
+            if grupo and start < grupo_fim:
+                grupo.append(termo_info)
+                grupo_fim = max(grupo_fim, end)
+                continue
+            if grupo:
+                yield from self._renderizar_grupo(texto, cursor, grupo, grupo_fim)
+                cursor = grupo_fim
+            grupo = [termo_info]
+            grupo_fim = end
+        
+        if grupo:
+            yield from self._renderizar_grupo(texto, cursor, grupo, grupo_fim)
+            cursor = grupo_fim
         
-        return texto_destacado
+        if cursor < len(texto):
+            yield html.escape(texto[cursor:], quote=False)
     
-    def extrair_features(self, texto):
-        texto_analise = texto
+    def _renderizar_grupo(self, texto, cursor, grupo, grupo_fim):
+        start = grupo[0]['posicao'][0]
+        if cursor < start:
+            yield html.escape(texto[cursor:start], quote=False)
+        
+        justificativas = list(dict.fromkeys(t['justificativa'] for t in grupo))
+        tipo = html.escape(grupo[0]['tipo'])
+        titulo = html.escape(' | '.join(justificativas))
+        termo_original = html.escape(texto[start:grupo_fim], quote=False)
+        yield f'<span class="termo-suspeito" data-tipo="{tipo}" title="{titulo}">{termo_original}</span>'
+    
+    def extrair_features(self, texto, contexto=None):
+        contexto = contexto or ContextoAnalise(texto)
+        amostra = contexto
         if len(texto) > 5000:
-            texto_analise = texto[:2000] + texto[len(texto)//2-500:len(texto)//2+500] + texto[-2000:]
+            amostra = ContextoAnalise(texto[:2000] + texto[len(texto)//2-500:len(texto)//2+500] + texto[-2000:],
+                                      self.lexico_de(contexto))
         
-        palavras = self.tokenizacao_simples(texto_analise)
-        frases = self.dividir_frases(texto_analise)
+        palavras = amostra.palavras
+        frases = amostra.spans_frases
         
         features = {}
         features['comprimento'] = len(texto)
@@ -141,41 +254,211 @@ class AIDetectorComRelatorio:
         features['num_frases'] = len(frases)
         
         if palavras:
-            features['comp_medio_palavra'] = float(np.mean([len(p) for p in palavras]))
+            comprimentos = amostra.comprimentos_palavras
+            features['comp_medio_palavra'] = float(np.mean(comprimentos))
             features['palavras_por_frase'] = float(len(palavras) / len(frases)) if frases else 0.0
-            features['diversidade_lexical'] = float(len(set(palavras)) / len(palavras))
+            features['diversidade_lexical'] = float(len(amostra.contagem_palavras) / len(palavras))
+            features['palavras_longas'] = float(np.count_nonzero(comprimentos > 6) / len(palavras))
         else:
             features['comp_medio_palavra'] = 0.0
             features['palavras_por_frase'] = 0.0
             features['diversidade_lexical'] = 0.0
+            features['palavras_longas'] = 0.0
         
-        features['palavras_longas'] = float(len([p for p in palavras if len(p) > 6]) / len(palavras)) if palavras else 0.0
-        features['formalidade'] = float(self.calcular_formalidade(texto_analise))
+        features['formalidade'] = float(self.calcular_formalidade(amostra.texto, amostra))
+        
+        if self.ngramas is not None:
+            if self.lexico_de(amostra).idioma == self.ngramas.idioma:
+                features.update(self.ngramas.features(amostra))
+            else:
+                features.update(self.ngramas.features_neutras)
         
         return features
     
-    def calcular_formalidade(self, texto):
-        palavras_formais = ['portanto', 'consequentemente', 'adicionalmente', 'fundamental']
-        palavras_informais = ['tipo', 'assim', 'ok', 'bem', 'acho', 'tá']
-        
-        texto_lower = texto.lower()
-        formal = sum(1 for p in palavras_formais if p in texto_lower)
-        informal = sum(1 for p in palavras_informais if p in texto_lower)
+    def calcular_formalidade(self, texto, contexto=None):
+        contexto = contexto or ContextoAnalise(texto)
+        # Busca por substring (e não por token), como o modelo foi treinado
+        texto_lower = contexto.texto_lower
+        lexico = self.lexico_de(contexto)
+        formal = sum(1 for p in lexico.palavras_formais if p in texto_lower)
+        informal = sum(1 for p in lexico.palavras_informais if p in texto_lower)
         
-        total = len(self.tokenizacao_simples(texto))
+        total = len(contexto.palavras)
         return (formal - informal) / total if total > 0 else 0.0
     
-    def carregar_ou_treinar_modelo(self):
+    def extrair_features_frases(self, contexto):
+        """Matriz com as features de cada frase do texto, uma linha por frase.
+        
+        Igual a chamar extrair_features em cada frase isolada, mas calculada de uma vez:
+        as palavras do texto inteiro são atribuídas às frases por posição e as contagens
+        saem de np.bincount. Frases com mais de 5000 caracteres (que extrair_features
+        amostra) e textos cujo lower() muda as posições caem no cálculo frase a frase.
+        """
+        spans = contexto.spans_frases
+        matriz = np.zeros((len(spans), len(self.nomes_features)))
+        if not spans:
+            return matriz
+        texto = contexto.texto
+        if len(contexto.texto_lower) != len(texto):
+            for linha, (inicio, fim) in enumerate(spans):
+                frase = texto[inicio:fim]
+                matriz[linha] = list(self.extrair_features(frase, ContextoAnalise(frase, self.lexico_de(contexto))).values())
+            return matriz
+        
+        inicios = np.array([inicio for inicio, _ in spans], dtype=np.int64)
+        fins = np.array([fim for _, fim in spans], dtype=np.int64)
+        
+        def frase_de(posicoes, comprimentos):
+            # Índice da frase que contém cada trecho [pos, pos + comprimento), ou -1
+            frase = np.searchsorted(inicios, posicoes, side='right') - 1
+            dentro = (frase >= 0) & (posicoes + comprimentos <= fins[np.maximum(frase, 0)])
+            return np.where(dentro, frase, -1)
+        
+        n = len(spans)
+        pos_inicio, pos_fim = contexto.spans_palavras
+        comprimentos = pos_fim - pos_inicio
+        frase = frase_de(pos_inicio, comprimentos)
+        validas = frase >= 0
+        frase, comprimentos = frase[validas], comprimentos[validas]
+        
+        num_palavras = np.bincount(frase, minlength=n)
+        soma_comprimentos = np.bincount(frase, weights=comprimentos, minlength=n)
+        longas = np.bincount(frase, weights=comprimentos > 6, minlength=n)
+        ids = contexto.ids_palavras[validas]
+        distintas = np.bincount(np.unique(frase * (int(ids.max(initial=0)) + 1) + ids) // (int(ids.max(initial=0)) + 1), minlength=n)
+        
+        # Formalidade por substring, como calcular_formalidade: cada palavra conta uma vez por frase
+        formalidade = np.zeros(n)
+        lexico = self.lexico_de(contexto)
+        for lista, sinal in ((lexico.palavras_formais, 1), (lexico.palavras_informais, -1)):
+            for palavra in lista:
+                posicoes = []
+                pos = contexto.texto_lower.find(palavra)
+                while pos >= 0:
+                    posicoes.append(pos)
+                    pos = contexto.texto_lower.find(palavra, pos + 1)
+                if posicoes:
+                    presente = frase_de(np.array(posicoes, dtype=np.int64), len(palavra))
+                    formalidade[np.unique(presente[presente >= 0])] += sinal
+        
+        com_palavras = num_palavras > 0
+        divisor = np.maximum(num_palavras, 1)
+        matriz[:, 0] = fins - inicios
+        matriz[:, 1] = num_palavras
+        matriz[:, 2] = 1
+        matriz[:, 3] = np.where(com_palavras, soma_comprimentos / divisor, 0.0)
+        matriz[:, 4] = num_palavras
+        matriz[:, 5] = np.where(com_palavras, distintas / divisor, 0.0)
+        matriz[:, 6] = np.where(com_palavras, longas / divisor, 0.0)
+        matriz[:, 7] = np.where(com_palavras, formalidade / divisor, 0.0)
+        if self.ngramas is not None:
+            if self.lexico_de(contexto).idioma == self.ngramas.idioma:
+                matriz[:, len(NOMES_FEATURES):] = self.ngramas.features_frases(contexto)
+            else:
+                matriz[:, len(NOMES_FEATURES):] = list(self.ngramas.features_neutras.values())
+        
+        for linha in np.flatnonzero(fins - inicios > 5000):
+            frase = texto[inicios[linha]:fins[linha]]
+            matriz[linha] = list(self.extrair_features(frase, ContextoAnalise(frase, self.lexico_de(contexto))).values())
+        return matriz
+    
+    def compilar_floresta(self):
+        """Exporta a floresta para arrays NumPy; só é usada se reproduzir o predict_proba do sklearn"""
+        if not self.is_trained:
+            return None
         try:
-            if os.path.exists('modelo_web.pkl'):
-                self.model = joblib.load('modelo_web.pkl')
-                self.is_trained = True
-                print("✅ Modelo carregado")
+            floresta = FlorestaCompilada(self.model)
+            if not verificar_paridade(self.model, floresta, amostras_de_paridade(floresta)):
+                print("⚠️  Floresta compilada diverge do sklearn, usando predict_proba")
+                return None
+            return floresta
+        except Exception as e:
+            print(f"⚠️  Não foi possível compilar a floresta: {e}")
+            return None
+    
+    def garantir_modelo(self):
+        if self.versao_modelo is None:
+            self.carregar_modelo()
+    
+    def carregar_modelo(self):
+        """Carrega o artefato uma única vez; chamado no master do gunicorn com preload ou no primeiro uso"""
+        with self._lock_modelo:
+            if self.versao_modelo is not None:
                 return
-        except:
-            print("ℹ️  Modelo não encontrado, treinando novo...")
-        
-        self.treinar_modelo()
+            
+            inicio = time.perf_counter()
+            try:
+                self.ajustar_ngramas(ler_metadados(self.caminho_modelo))
+                self.model, self.floresta, versao_modelo = carregar_artefato(self.caminho_modelo)
+                self.is_trained = True
+                if self.floresta is None:
+                    self.floresta = self.compilar_floresta()
+                origem = 'floresta compilada (mmap)' if self.model is None else 'pickle do sklearn'
+                print(f"✅ Modelo carregado de {origem} em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+                self.cascata = self.carregar_cascata(versao_modelo)
+            except FileNotFoundError:
+                print(f"⚠️  Modelo não encontrado em {self.caminho_modelo}; rode `python treinar.py`. Usando heurística.")
+                versao_modelo = 'heuristico'
+            except Exception as e:
+                print(f"❌ Erro ao carregar o modelo: {e}. Usando heurística.")
+                self.model, self.floresta, self.is_trained = None, None, False
+                versao_modelo = 'heuristico'
+            
+            self.tempo_carga_modelo = time.perf_counter() - inicio
+            self.versao_modelo = versao_modelo
+            metricas.definir('detector_modelo_carga_segundos', self.tempo_carga_modelo)
+    
+    def ajustar_ngramas(self, meta):
+        """Liga as features de n-gramas só se o modelo foi treinado com elas, e com as mesmas tabelas"""
+        if not meta or 'features' not in meta:
+            return
+        if meta['features'] == list(NOMES_FEATURES):
+            if self.ngramas is not None:
+                print("⚠️  Modelo treinado sem features de n-gramas; tabelas de NGRAMAS_DIR ignoradas")
+            self.ngramas = None
+            return
+        if meta['features'] != list(NOMES_FEATURES + NOMES_FEATURES_NGRAMAS):
+            raise ValueError('features do modelo diferentes das desta versão')
+        esperado = meta.get('ngramas') or {}
+        if self.ngramas is None and esperado.get('diretorio'):
+            self.ngramas = TabelasNgramas(esperado['diretorio'])
+        if self.ngramas is None or self.ngramas.versao != esperado.get('versao'):
+            self.ngramas = None
+            raise ValueError(f"modelo treinado com as tabelas de n-gramas {esperado.get('versao')}; aponte NGRAMAS_DIR para elas")
+    
+    def carregar_cascata(self, versao_modelo):
+        """Primeiro nível calibrado para este modelo e léxico, se houver e CASCATA estiver ligada"""
+        if not CASCATA:
+            return None
+        try:
+            cascata = Cascata.carregar(caminho_cascata(self.caminho_modelo), CASCATA_LIMIAR)
+        except (ValueError, KeyError) as e:
+            print(f"⚠️  Cascata ignorada: {e}")
+            return None
+        if cascata is None:
+            return None
+        if (cascata.versao_modelo, cascata.versao_lexico) != (versao_modelo, self.versao_lexico):
+            print("⚠️  Cascata calibrada para outro modelo ou léxico; rode `python calibrar_cascata.py`. Ignorada.")
+            return None
+        print(f"✅ Cascata carregada (limiar {cascata.limiar})")
+        return cascata
+    
+    def cascata_valida(self, versao_lexico=None):
+        """A cascata, se calibrada para os léxicos atuais (um léxico recarregado a desliga até recalibrar)"""
+        if self.cascata is None or self.cascata.versao_lexico != (versao_lexico or self.versao_lexico):
+            return None
+        return self.cascata
+    
+    def salvar_modelo(self, caminho=None, metadados=None):
+        meta = salvar_artefato(self.model, caminho or self.caminho_modelo, {
+            'features': list(self.nomes_features),
+            'versao_lexico': self.versao_lexico,
+            'ngramas': {'versao': self.ngramas.versao, 'diretorio': os.path.abspath(self.ngramas.diretorio)} if self.ngramas is not None else None,
+            'sklearn': sklearn.__version__,
+            **(metadados or {})
+        })
+        self.versao_modelo = meta['versao']
+        return meta
     
     def treinar_modelo(self):
         print("🔧 Treinando modelo...")
@@ -205,377 +488,585 @@ class AIDetectorComRelatorio:
             features.append(list(feat.values()))
         
         try:
+            self.model = RandomForestClassifier(n_estimators=50, random_state=42)
             self.model.fit(features, labels)
             self.is_trained = True
-            joblib.dump(self.model, 'modelo_web.pkl')
+            self.floresta = self.compilar_floresta()
+            self.versao_modelo = 'local'
             print("✅ Modelo treinado com sucesso")
         except Exception as e:
             print(f"❌ Erro no treinamento: {e}")
             self.is_trained = False
     
-    def predict(self, texto):
-        if not texto or len(texto.strip()) < 20:
-            return {
-                'ai_probability': 0.5, 
-                'human_probability': 0.5, 
-                'confidence': 0.1,
-                'termos_suspeitos': [],
-                'texto_destacado': texto
+    def resultado_neutro(self, texto):
+        return {
+            'ai_probability': 0.5, 
+            'human_probability': 0.5, 
+            'confidence': 0.1,
+            'termos_suspeitos': [],
+            'texto_destacado': html.escape(texto, quote=False)
+        }
+    
+    def analisar_texto(self, texto, contexto=None, ocorrencias=None, com_features=True):
+        """Etapas por texto que antecedem o modelo: termos, destaque e features.
+        
+        Com `ocorrencias` já conhecidas (ex.: reaproveitadas de uma quase duplicata),
+        o casador não varre o texto. Sem `com_features`, para no destaque (saída
+        antecipada da cascata).
+        """
+        contexto = contexto or ContextoAnalise(texto)
+        with metricas.cronometrar('detector_etapa_segundos', etapa='termos'):
+            if ocorrencias is None:
+                termos_suspeitos = self.analisar_termos_suspeitos(texto, contexto)
+            else:
+                termos_suspeitos = self.montar_termos(texto, ocorrencias)
+        with metricas.cronometrar('detector_etapa_segundos', etapa='destaque'):
+            texto_destacado = self.gerar_texto_destacado(texto, termos_suspeitos)
+        metricas.observar('detector_texto_caracteres', len(texto))
+        metricas.observar('detector_termos_por_texto', len(termos_suspeitos))
+        analise = {
+            'contexto': contexto,
+            'termos_suspeitos': termos_suspeitos,
+            'texto_destacado': texto_destacado
+        }
+        if com_features:
+            with metricas.cronometrar('detector_etapa_segundos', etapa='features'):
+                feat_dict = self.extrair_features(texto, contexto)
+            analise['feat_dict'] = feat_dict
+            analise['features'] = [float(v) for v in feat_dict.values()]
+        return analise
+    
+    def nivel_rapido(self, texto, contexto, ocorrencias=None):
+        """Primeiro nível da cascata: (decisao, ocorrencias), com decisao (prob_ia, confianca) ou None.
+        
+        As ocorrências da varredura voltam junto para que o relatório não varra de novo.
+        """
+        with metricas.cronometrar('detector_etapa_segundos', etapa='cascata'):
+            if ocorrencias is None:
+                ocorrencias = list(self.lexico_de(contexto).casador.encontrar(contexto.texto_lower))
+            decisao = self.cascata.decidir(features_rapidas(self, texto, contexto, len(ocorrencias)))
+        metricas.incrementar('detector_cascata_total', nivel='rapido' if decisao is not None else 'completo')
+        return decisao, ocorrencias
+    
+    def resultado_rapido(self, texto, contexto, ocorrencias, decisao):
+        analise = self.analisar_texto(texto, contexto, ocorrencias, com_features=False)
+        resultado = self.montar_resultado(texto, analise, *decisao)
+        resultado['cascata'] = 'rapido'
+        return resultado
+    
+    def calcular_probabilidades(self, analises):
+        """Retorna (prob_ia, confianca) para cada análise com uma única chamada ao modelo"""
+        if not analises:
+            return []
+        return self.probabilidades_matriz(np.array([analise['features'] for analise in analises], dtype=float))
+    
+    def probabilidades_matriz(self, matriz):
+        """(prob_ia, confianca) para cada linha de uma matriz de features"""
+        self.garantir_modelo()
+        if self.is_trained:
+            with metricas.cronometrar('detector_etapa_segundos', etapa='modelo'):
+                modelo = self.floresta if self.floresta is not None else self.model
+                probas = modelo.predict_proba(matriz)
+            return [(float(proba[1]), float(np.max(proba))) for proba in probas]
+        
+        # Fallback heurístico
+        coluna = NOMES_FEATURES.index('formalidade')
+        return [(0.3 if linha[coluna] > 0.1 else 0.7, 0.6) for linha in matriz]
+    
+    def calcular_probabilidade(self, analise):
+        """(prob_ia, confianca) de uma análise; com micro-lotes, a chamada ao modelo é dividida com requisições concorrentes"""
+        if self.agendador is None:
+            return self.calcular_probabilidades([analise])[0]
+        with metricas.cronometrar('detector_etapa_segundos', etapa='microlote'):
+            return self.agendador.executar(analise)
+    
+    def montar_resultado(self, texto, analise, prob_ia, confianca):
+        termos_suspeitos = analise['termos_suspeitos']
+        palavras_espaco = analise['contexto'].palavras_espaco
+        
+        # Agrupar termos por tipo para relatório
+        termos_por_tipo = {}
+        for termo in termos_suspeitos:
+            if termo['tipo'] not in termos_por_tipo:
+                termos_por_tipo[termo['tipo']] = []
+            termos_por_tipo[termo['tipo']].append(termo)
+        
+        return {
+            'ai_probability': round(prob_ia, 3),
+            'human_probability': round(1 - prob_ia, 3),
+            'confidence': round(confianca, 2),
+            'text_analyzed_length': len(texto),
+            'termos_suspeitos': termos_suspeitos,
+            'texto_destacado': analise['texto_destacado'],
+            'estatisticas_deteccao': {
+                'total_termos': len(termos_suspeitos),
+                'termos_por_tipo': {tipo: len(termos) for tipo, termos in termos_por_tipo.items()},
+                'densidade_termos': len(termos_suspeitos) / len(palavras_espaco) if palavras_espaco else 0
             }
+        }
+    
+    def mapa_de_calor(self, analise, probabilidades):
+        """Listas 'frases' e 'paragrafos' com a probabilidade de IA de cada trecho.
+        
+        `probabilidades` traz uma probabilidade por frase, na ordem de spans_frases; a de
+        cada parágrafo é a média das suas frases ponderada pelo tamanho delas.
+        """
+        contexto = analise['contexto']
+        frases = [
+            {'inicio': inicio, 'fim': fim, 'ai_probability': round(prob_ia, 3)}
+            for (inicio, fim), prob_ia in zip(contexto.spans_frases, probabilidades)
+        ]
+        
+        paragrafos = []
+        inicios_paragrafos = [inicio for inicio, _ in contexto.spans_paragrafos]
+        indices = np.searchsorted(inicios_paragrafos, [f['inicio'] for f in frases], side='right') - 1
+        for p, (inicio, fim) in enumerate(contexto.spans_paragrafos):
+            pesos = [(f['fim'] - f['inicio'], prob_ia) for f, i, prob_ia in zip(frases, indices, probabilidades) if i == p]
+            total = sum(peso for peso, _ in pesos)
+            if total:
+                media = sum(peso * prob_ia for peso, prob_ia in pesos) / total
+                paragrafos.append({'inicio': inicio, 'fim': fim, 'ai_probability': round(media, 3)})
+        return frases, paragrafos
+    
+    def predict(self, texto, contexto=None, por_frase=False, ocorrencias=None):
+        """Analisa um texto; com por_frase, inclui o mapa de calor por frase e parágrafo.
+        
+        O mapa usa a mesma chamada ao modelo do texto inteiro: a linha do documento e as
+        linhas das frases vão juntas em uma única matriz.
+        """
+        if not texto or len(texto.strip()) < 20:
+            return self.resultado_neutro(texto)
         
         try:
-            # Análise de termos suspeitos
-            termos_suspeitos = self.analisar_termos_suspeitos(texto)
-            texto_destacado = self.gerar_texto_destacado(texto, termos_suspeitos)
-            
-            # Análise tradicional
-            feat_dict = self.extrair_features(texto)
-            features = [float(v) for v in feat_dict.values()]
-            
-            if self.is_trained:
-                proba = self.model.predict_proba([features])[0]
-                prob_ia = float(proba[1])
-                confianca = float(np.max(proba))
-            else:
-                # Fallback heurístico
-                prob_ia = 0.3 if feat_dict['formalidade'] > 0.1 else 0.7
-                confianca = 0.6
+            self.garantir_modelo()
+            if self.cascata_valida() is not None and not por_frase:
+                contexto = contexto or ContextoAnalise(texto)
+                decisao, ocorrencias = self.nivel_rapido(texto, contexto, ocorrencias)
+                if decisao is not None:
+                    return self.resultado_rapido(texto, contexto, ocorrencias, decisao)
             
-            # Agrupar termos por tipo para relatório
-            termos_por_tipo = {}
-            for termo in termos_suspeitos:
-                if termo['tipo'] not in termos_por_tipo:
-                    termos_por_tipo[termo['tipo']] = []
-                termos_por_tipo[termo['tipo']].append(termo)
-            
-            resultado = {
-                'ai_probability': round(prob_ia, 3),
-                'human_probability': round(1 - prob_ia, 3),
-                'confidence': round(confianca, 2),
-                'text_analyzed_length': len(texto),
-                'termos_suspeitos': termos_suspeitos,
-                'texto_destacado': texto_destacado,
-                'estatisticas_deteccao': {
-                    'total_termos': len(termos_suspeitos),
-                    'termos_por_tipo': {tipo: len(termos) for tipo, termos in termos_por_tipo.items()},
-                    'densidade_termos': len(termos_suspeitos) / len(texto.split()) if texto.split() else 0
-                }
-            }
+            analise = self.analisar_texto(texto, contexto, ocorrencias)
+            if not por_frase:
+                prob_ia, confianca = self.calcular_probabilidade(analise)
+                return self.montar_resultado(texto, analise, prob_ia, confianca)
             
+            with metricas.cronometrar('detector_etapa_segundos', etapa='features_frases'):
+                matriz_frases = self.extrair_features_frases(analise['contexto'])
+            probabilidades = self.probabilidades_matriz(np.vstack([analise['features'], matriz_frases]))
+            prob_ia, confianca = probabilidades[0]
+            resultado = self.montar_resultado(texto, analise, prob_ia, confianca)
+            resultado['frases'], resultado['paragrafos'] = self.mapa_de_calor(analise, [p for p, _ in probabilidades[1:]])
             return resultado
             
         except Exception as e:
             print(f"❌ Erro na predição: {e}")
-            return {
-                'ai_probability': 0.5, 
-                'human_probability': 0.5, 
-                'confidence': 0.1,
-                'termos_suspeitos': [],
-                'texto_destacado': texto
-            }
-
-# CORREÇÃO: Inicializar DEPOIS da definição da classe
-detector = AIDetectorComRelatorio()
-
-@app.route('/')
-def index():
-    return '''
-    <!DOCTYPE html>
-    <html lang="pt-BR">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Detector de IA - Análise Detalhada</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body { 
-                font-family: -apple-system, BlinkMacSystemFont, sans-serif;
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh; padding: 20px; 
-            }
-            .container { max-width: 1200px; margin: 0 auto; }
-            .header { text-align: center; color: white; margin-bottom: 40px; }
-            .header h1 { font-size: 2.5rem; margin-bottom: 10px; }
-            .app-card { 
-                background: white; border-radius: 15px; 
-                box-shadow: 0 20px 40px rgba(0,0,0,0.1); padding: 40px; 
-                margin-bottom: 20px;
-            }
-            .text-area { 
-                width: 100%; min-height: 200px; padding: 20px; 
-                border: 2px solid #e2e8f0; border-radius: 10px; 
-                font-size: 1rem; resize: vertical; margin-bottom: 20px;
-                font-family: monospace; line-height: 1.6;
-            }
-            .analyze-btn { 
-                background: #2563eb; color: white; border: none; 
-                padding: 15px 30px; border-radius: 10px; font-size: 1.1rem; 
-                cursor: pointer; width: 100%; margin-bottom: 20px;
-            }
-            .analyze-btn:disabled { background: #94a3b8; cursor: not-allowed; }
-            .result { margin-top: 20px; padding: 20px; background: #f8fafc; border-radius: 10px; }
-            .stats { background: #e2e8f0; padding: 10px; border-radius: 5px; margin-bottom: 10px; }
-            
-            /* Estilos para termos suspeitos */
-            .termo-suspeito {
-                background-color: #fef3c7;
-                border: 1px solid #f59e0b;
-                border-radius: 3px;
-                padding: 2px 4px;
-                margin: 0 1px;
-                cursor: help;
-                position: relative;
-            }
-            .termo-suspeito:hover {
-                background-color: #fde68a;
-                z-index: 1000;
-            }
-            .termo-suspeito[data-tipo="expressao_formal"] { border-color: #ef4444; background-color: #fef2f2; }
-            .termo-suspeito[data-tipo="conectivo_complexo"] { border-color: #8b5cf6; background-color: #faf5ff; }
-            .termo-suspeito[data-tipo="voz_passiva"] { border-color: #06b6d4; background-color: #ecfeff; }
-            .termo-suspeito[data-tipo="superlativo"] { border-color: #f59e0b; background-color: #fffbeb; }
-            
-            .texto-destacado {
-                background: white;
-                border: 2px solid #e2e8f0;
-                border-radius: 10px;
-                padding: 20px;
-                margin-top: 20px;
-                line-height: 1.8;
-                max-height: 400px;
-                overflow-y: auto;
-            }
-            
-            .relatorio-termos {
-                margin-top: 20px;
-            }
-            
-            .tipo-termo {
-                background: #f8fafc;
-                border-left: 4px solid #2563eb;
-                padding: 15px;
-                margin-bottom: 10px;
-                border-radius: 5px;
-            }
-            
-            .termo-item {
-                background: white;
-                padding: 10px;
-                margin: 5px 0;
-                border-radius: 5px;
-                border-left: 3px solid #94a3b8;
-            }
+            metricas.incrementar('detector_erros_total', origem='predict')
+            return self.resultado_neutro(texto)
+    
+    def predict_batch(self, textos, contextos=None):
+        """Analisa vários textos com uma única matriz de features e uma chamada a predict_proba.
+        
+        Retorna uma lista na mesma ordem da entrada; itens inválidos ou que falharam
+        trazem {'error': ...} no lugar do resultado, sem afetar os demais.
+        """
+        self.garantir_modelo()
+        resultados = [None] * len(textos)
+        indices = []
+        analises = []
+        
+        usar_cascata = self.cascata_valida() is not None
+        for i, texto in enumerate(textos):
+            if not isinstance(texto, str) or len(texto.strip()) < 20:
+                resultados[i] = {'error': 'Texto muito curto. Mínimo 20 caracteres.', 'min_length': 20}
+                continue
+            try:
+                contexto = contextos[i] if contextos else None
+                ocorrencias = None
+                if usar_cascata:
+                    contexto = contexto or ContextoAnalise(texto)
+                    decisao, ocorrencias = self.nivel_rapido(texto, contexto)
+                    if decisao is not None:
+                        resultados[i] = self.resultado_rapido(texto, contexto, ocorrencias, decisao)
+                        continue
+                analises.append(self.analisar_texto(texto, contexto, ocorrencias))
+                indices.append(i)
+            except Exception as e:
+                print(f"❌ Erro na predição do item {i}: {e}")
+                metricas.incrementar('detector_erros_total', origem='predict_batch')
+                resultados[i] = {'error': f'Erro na análise: {str(e)}'}
+        
+        try:
+            probabilidades = self.calcular_probabilidades(analises)
+        except Exception as e:
+            print(f"❌ Erro na predição em lote: {e}")
+            metricas.incrementar('detector_erros_total', origem='predict_batch')
+            for i in indices:
+                resultados[i] = {'error': f'Erro na análise: {str(e)}'}
+            return resultados
+        
+        for i, analise, (prob_ia, confianca) in zip(indices, analises, probabilidades):
+            resultados[i] = self.montar_resultado(textos[i], analise, prob_ia, confianca)
+        
+        return resultados
+    
+    def analisar_em_janelas(self, pedacos, tamanho_janela=4000):
+        """Analisa um documento longo em janelas sobrepostas, gerando resultados conforme avança.
+        
+        `pedacos` é qualquer iterável de trechos de texto (ex.: o corpo da requisição lido
+        aos poucos). Gera um dict por janela, com termos em posições globais, destaque do
+        trecho da janela e probabilidade própria, e por fim um resumo com a probabilidade
+        combinada (média ponderada pelo tamanho das janelas). A memória não depende do
+        tamanho do documento.
+        """
+        # As features dependem do modelo carregado (com ou sem n-gramas)
+        self.garantir_modelo()
+        margem = max(regra['margem_contexto'] for regra in self.regras_padroes.values())
+        # O idioma só é conhecido na primeira janela: a sobreposição cobre o maior padrão de todos os léxicos
+        maior_padrao = max((len(frase) for lexico in self.lexicos.atual().lexicos.values()
+                            for frases in lexico.padroes_ia.values() for frase in frases), default=0)
+        # A sobreposição cobre o maior padrão, o caractere de fronteira e o contexto à direita
+        sobreposicao = maior_padrao + margem + 1
+        
+        soma_ponderada = 0.0
+        peso_total = 0
+        total_termos = 0
+        termos_por_tipo = {}
+        cursor_destaque = 0
+        indice = 0
+        lexico = None
+        
+        for deslocamento, inicio, fim, texto_janela, ultima in iterar_janelas(pedacos, tamanho_janela, sobreposicao, margem):
+            # O léxico da primeira janela vale para o documento inteiro, mesmo se os arquivos forem recarregados
+            contexto_janela = ContextoAnalise(texto_janela, lexico)
+            lexico = self.lexico_de(contexto_janela)
+            termos = []
+            for termo in self.analisar_termos_suspeitos(texto_janela, contexto_janela):
+                start, end = termo['posicao'][0] + deslocamento, termo['posicao'][1] + deslocamento
+                if inicio <= start < fim:
+                    termos.append({**termo, 'posicao': (start, end)})
             
-            .legenda {
-                display: flex;
-                flex-wrap: wrap;
-                gap: 10px;
-                margin: 15px 0;
-            }
+            # O destaque de um termo que cruza a fronteira fica com a janela onde ele começa
+            limite = max([fim] + [end for _, end in (t['posicao'] for t in termos)])
+            trecho = texto_janela[cursor_destaque - deslocamento:limite - deslocamento] if cursor_destaque < limite else ''
+            termos_trecho = [
+                {**t, 'posicao': (t['posicao'][0] - cursor_destaque, t['posicao'][1] - cursor_destaque)}
+                for t in termos if t['posicao'][0] >= cursor_destaque
+            ]
+            texto_destacado = self.gerar_texto_destacado(trecho, termos_trecho)
+            cursor_destaque = max(cursor_destaque, limite)
             
-            .legenda-item {
-                display: flex;
-                align-items: center;
-                gap: 5px;
-                padding: 5px 10px;
-                background: #f8fafc;
-                border-radius: 5px;
-                font-size: 0.9em;
-            }
+            texto_dono = texto_janela[inicio - deslocamento:fim - deslocamento]
+            prob_ia = confianca = None
+            if len(texto_dono.strip()) >= 20:
+                analise = {'feat_dict': self.extrair_features(texto_dono, ContextoAnalise(texto_dono, lexico))}
+                analise['features'] = [float(v) for v in analise['feat_dict'].values()]
+                prob_ia, confianca = self.calcular_probabilidade(analise)
+                soma_ponderada += prob_ia * len(texto_dono)
+                peso_total += len(texto_dono)
             
-            .legenda-cor {
-                width: 15px;
-                height: 15px;
-                border-radius: 3px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🔍 Detector de IA - Análise Detalhada</h1>
-                <p>Identifique termos e expressões suspeitos de terem sido gerados por IA</p>
-            </div>
+            total_termos += len(termos)
+            for termo in termos:
+                termos_por_tipo[termo['tipo']] = termos_por_tipo.get(termo['tipo'], 0) + 1
             
-            <div class="app-card">
-                <h3>📝 Cole seu texto para análise</h3>
-                <textarea class="text-area" id="textInput" placeholder="Cole o texto que deseja analisar aqui..."></textarea>
-                
-                <div class="stats" id="textStats">
-                    Caracteres: 0 | Palavras: 0 | Frases: 0
-                </div>
-                
-                <button class="analyze-btn" onclick="analyzeText()" id="analyzeBtn">Analisar Texto</button>
-                <div id="result"></div>
-            </div>
-        </div>
-        
-        <script>
-            document.getElementById('textInput').addEventListener('input', function() {
-                const text = this.value;
-                const chars = text.length;
-                const words = text.trim() ? text.trim().split(/\\s+/).length : 0;
-                const sentences = text.split(/[.!?]+/).length - 1;
-                document.getElementById('textStats').innerHTML = 
-                    `Caracteres: ${chars} | Palavras: ${words} | Frases: ${sentences}`;
-            });
-        
-            async function analyzeText() {
-                const text = document.getElementById('textInput').value.trim();
-                const resultDiv = document.getElementById('result');
-                const button = document.getElementById('analyzeBtn');
-                
-                if (text.length < 20) {
-                    resultDiv.innerHTML = '<p style="color: red;">⚠️ Texto muito curto (mínimo 20 caracteres)</p>';
-                    return;
-                }
-                
-                button.disabled = true;
-                button.textContent = 'Analisando...';
-                resultDiv.innerHTML = '<p>⏳ Analisando texto e identificando padrões suspeitos...</p>';
-                
-                try {
-                    const response = await fetch('/api/detect', {
-                        method: 'POST',
-                        headers: {'Content-Type': 'application/json'},
-                        body: JSON.stringify({text: text})
-                    });
-                    
-                    const data = await response.json();
-                    
-                    if (data.success) {
-                        const result = data.result;
-                        const aiProb = Math.round(result.ai_probability * 100);
-                        const humanProb = Math.round(result.human_probability * 100);
-                        const confidence = Math.round(result.confidence * 100);
-                        
-                        let color = '#64748b';
-                        let veredito = 'Indeterminado';
-                        if (aiProb > 70) {
-                            color = '#ef4444';
-                            veredito = 'Provavelmente IA';
-                        } else if (humanProb > 70) {
-                            color = '#10b981';
-                            veredito = 'Provavelmente Humano';
-                        }
-                        
-                        let relatorioHTML = gerarRelatorioDetalhado(result);
-                        
-                        resultDiv.innerHTML = `
-                            <div style="text-align: center; margin-bottom: 20px;">
-                                <h3 style="color: ${color}">${veredito}</h3>
-                                <p>🤖 Probabilidade de IA: <strong style="font-size: 1.2em;">${aiProb}%</strong></p>
-                                <p>👤 Probabilidade Humana: <strong style="font-size: 1.2em;">${humanProb}%</strong></p>
-                                <p>📊 Confiança da análise: ${confidence}%</p>
-                            </div>
-                            ${relatorioHTML}
-                        `;
-                    } else {
-                        resultDiv.innerHTML = `<p style="color: red;">❌ Erro: ${data.error}</p>`;
-                    }
-                } catch (error) {
-                    resultDiv.innerHTML = '<p style="color: red;">❌ Erro de conexão. Tente novamente.</p>';
-                } finally {
-                    button.disabled = false;
-                    button.textContent = 'Analisar Texto';
-                }
+            yield {
+                'tipo': 'janela',
+                'indice': indice,
+                'inicio': inicio,
+                'fim': fim,
+                'ai_probability': round(prob_ia, 3) if prob_ia is not None else None,
+                'confidence': round(confianca, 2) if confianca is not None else None,
+                'termos_suspeitos': termos,
+                'texto_destacado': texto_destacado
             }
-            
-            function gerarRelatorioDetalhado(result) {
-                const termos = result.termos_suspeitos || [];
-                
-                if (termos.length === 0) {
-                    return `
-                        <div class="relatorio-termos">
-                            <h4>✅ Nenhum padrão suspeito detectado</h4>
-                            <p>O texto não apresenta os padrões típicos de IA analisados.</p>
-                        </div>
-                    `;
-                }
-                
-                // Agrupar termos por tipo
-                const termosPorTipo = {};
-                termos.forEach(termo => {
-                    if (!termosPorTipo[termo.tipo]) {
-                        termosPorTipo[termo.tipo] = [];
-                    }
-                    termosPorTipo[termo.tipo].push(termo);
-                });
-                
-                // Gerar HTML para cada tipo
-                let tiposHTML = '';
-                for (const [tipo, termosTipo] of Object.entries(termosPorTipo)) {
-                    let termosHTML = termosTipo.map(termo => `
-                        <div class="termo-item">
-                            <strong>"${termo.termo}"</strong> - ${termo.justificativa}
-                            <br><small>Contexto: "...${termo.contexto}..."</small>
-                        </div>
-                    `).join('');
-                    
-                    const tipoLabel = {
-                        'expressao_formal': 'Expressões Formais',
-                        'conectivo_complexo': 'Conectivos Complexos',
-                        'voz_passiva': 'Voz Passiva',
-                        'superlativo': 'Superlativos'
-                    }[tipo] || tipo;
-                    
-                    tiposHTML += `
-                        <div class="tipo-termo">
-                            <h5>${tipoLabel} (${termosTipo.length} ocorrências)</h5>
-                            ${termosHTML}
-                        </div>
-                    `;
-                }
-                
-                return `
-                    <div class="relatorio-termos">
-                        <h4>🔍 Relatório de Análise Detalhada</h4>
-                        <p><strong>${termos.length} termos/padrões suspeitos detectados</strong></p>
-                        
-                        <div class="legenda">
-                            <div class="legenda-item">
-                                <div class="legenda-cor" style="background-color: #fef2f2; border: 1px solid #ef4444;"></div>
-                                <span>Expressões Formais</span>
-                            </div>
-                            <div class="legenda-item">
-                                <div class="legenda-cor" style="background-color: #faf5ff; border: 1px solid #8b5cf6;"></div>
-                                <span>Conectivos Complexos</span>
-                            </div>
-                            <div class="legenda-item">
-                                <div class="legenda-cor" style="background-color: #ecfeff; border: 1px solid #06b6d4;"></div>
-                                <span>Voz Passiva</span>
-                            </div>
-                            <div class="legenda-item">
-                                <div class="legenda-cor" style="background-color: #fffbeb; border: 1px solid #f59e0b;"></div>
-                                <span>Superlativos</span>
-                            </div>
-                        </div>
-                        
-                        <div class="texto-destacado">
-                            <h5>Texto com termos destacados:</h5>
-                            <div>${result.texto_destacado}</div>
-                        </div>
-                        
-                        <div style="margin-top: 20px;">
-                            <h5>📋 Detalhamento dos padrões detectados:</h5>
-                            ${tiposHTML}
-                        </div>
-                    </div>
-                `;
+            indice += 1
+            comprimento = fim
+        
+        prob_combinada = soma_ponderada / peso_total if peso_total else 0.5
+        yield {
+            'tipo': 'resumo',
+            'janelas': indice,
+            'comprimento': comprimento,
+            'ai_probability': round(prob_combinada, 3),
+            'human_probability': round(1 - prob_combinada, 3),
+            'estatisticas_deteccao': {
+                'total_termos': total_termos,
+                'termos_por_tipo': termos_por_tipo
             }
-            
-            // Exemplo de texto para teste
-            document.getElementById('textInput').value = `É importante destacar que a implementação de estratégias eficazes requer uma abordagem sistemática e coordenada. Considerando os fatores mencionados anteriormente, pode-se inferir que a solução proposta apresenta viabilidade técnica e operacional. Observa-se que os resultados obtidos são extremamente significativos e demonstram claramente a eficácia da metodologia empregada.
+        }
+
+# CORREÇÃO: Inicializar DEPOIS da definição da classe
+detector = AIDetectorComRelatorio(carregar_modelo=False)
+cache = cache_do_ambiente()
+sessoes = sessoes_do_ambiente()
+quase_duplicatas = indice_do_ambiente()
+executor = executor_do_ambiente()
+perfilador = perfilador_do_ambiente()
+tipos_resposta = dicionario_tipos(detector)
+estaticos = AtivosEstaticos(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+indice_tipos = {nome: i for i, nome in enumerate(tipos_resposta['nome'])}
+if MICROLOTE_JANELA_MS > 0:
+    detector.agendador = AgendadorLotes(detector.calcular_probabilidades, MICROLOTE_JANELA_MS / 1000, MICROLOTE_MAX)
+
+# Com preload (gunicorn.conf.py) o modelo é carregado uma vez no master e compartilhado
+# com os workers por copy-on-write; sem preload, cada worker carrega no primeiro uso
+if os.environ.get('PRELOAD_MODELO') == '1':
+    detector.carregar_modelo()
+    cache.limpar_versoes_antigas(detector.versao)
+    quase_duplicatas.limpar_versoes_antigas(lexico.versao for lexico in detector.lexicos.atual().lexicos.values())
+
+def predict_com_cache(texto, contexto=None, por_frase=False):
+    """predict consultando o cache antes"""
+    if not cache.ativo:
+        return predict_com_quase_duplicatas(texto, contexto, por_frase)
+    
+    # O resultado com mapa de calor é outro documento e ocupa outra entrada
+    chave = cache.chave(texto, detector.versao + ('|frases' if por_frase else ''))
+    resultado = cache.obter(chave)
+    metricas.incrementar('detector_cache_consultas_total', resultado='miss' if resultado is None else 'hit')
+    if resultado is None:
+        resultado = predict_com_quase_duplicatas(texto, contexto, por_frase)
+        # Resultados neutros de erro não vão para o cache
+        if 'estatisticas_deteccao' in resultado:
+            cache.guardar(chave, resultado, detector.versao)
+    return resultado
+
+def predict_com_quase_duplicatas(texto, contexto=None, por_frase=False):
+    """predict reaproveitando a análise de um texto quase igual já visto, se houver.
+    
+    Com o índice ativo, o resultado de um texto parecido com outro já analisado traz
+    `quase_duplicata`: o id (sha256) do texto encontrado, a similaridade estimada e a
+    `reanalise`. Com `aproximar` (padrão), a probabilidade do texto encontrado é
+    reaproveitada e só os termos são refeitos, com as posições do texto novo: a
+    reanálise é `aproximada`, sem features nem modelo. Sem ela, ou com por_frase, o
+    resultado é igual ao de predict, e a reanálise é `parcial` (só a janela em volta
+    do que mudou passou pelo casador) ou `completa`.
+    """
+    if not quase_duplicatas.ativo or len(texto.strip()) < 20:
+        return detector.predict(texto, contexto, por_frase)
+    
+    contexto = contexto or ContextoAnalise(texto)
+    # As ocorrências guardadas valem para o léxico de um idioma, e só para a mesma versão dele
+    lexico = detector.lexico_de(contexto)
+    with metricas.cronometrar('detector_etapa_segundos', etapa='quase_duplicatas'):
+        assinatura = assinatura_minhash(contexto)
+        encontrado = quase_duplicatas.buscar(assinatura, lexico.versao) if assinatura is not None else None
+        reaproveitado = None
+        if encontrado is not None:
+            reaproveitado = reaproveitar_ocorrencias(
+                lexico.casador, encontrado['texto'], encontrado['ocorrencias'], texto, contexto.texto_lower
+            )
+    ocorrencias = reaproveitado[0] if reaproveitado is not None else None
+    
+    if encontrado is not None and encontrado['decisao'] is not None and quase_duplicatas.aproximar and not por_frase:
+        # Como no nível rápido da cascata: termos e destaque do texto novo, decisão já tomada
+        analise = detector.analisar_texto(texto, contexto, ocorrencias, com_features=False)
+        resultado = detector.montar_resultado(texto, analise, *encontrado['decisao'])
+        reanalise = 'aproximada'
+    else:
+        resultado = detector.predict(texto, contexto, por_frase, ocorrencias)
+        if 'estatisticas_deteccao' not in resultado or assinatura is None:
+            return resultado
+        reanalise = 'parcial' if reaproveitado is not None else 'completa'
+    
+    if encontrado is None:
+        metricas.incrementar('detector_quase_duplicatas_total', resultado='nenhuma')
+    else:
+        metricas.incrementar('detector_quase_duplicatas_total', resultado=reanalise)
+        resultado['quase_duplicata'] = {
+            'id': encontrado['id'],
+            'similaridade': round(encontrado['similaridade'], 3),
+            'reanalise': reanalise
+        }
+        if reaproveitado is not None:
+            resultado['quase_duplicata']['trecho_reanalisado'] = list(reaproveitado[1])
+        if reanalise == 'aproximada':
+            # O texto novo não entra no índice: a decisão guardada continua sendo a de uma análise completa
+            return resultado
+    
+    # Posições só se reaproveitam se minúsculas e original tiverem o mesmo tamanho
+    if len(contexto.texto_lower) == len(texto):
+        if ocorrencias is None:
+            ocorrencias = detector.ocorrencias_dos_termos(contexto.texto_lower, resultado['termos_suspeitos'], lexico)
+        quase_duplicatas.adicionar(texto, assinatura, ocorrencias, lexico.versao,
+                                   (resultado['ai_probability'], resultado['confidence']))
+    return resultado
+
+def predict_batch_com_cache(textos, contextos=None):
+    """predict_batch consultando o cache antes; só os textos ausentes vão para o modelo"""
+    if not cache.ativo:
+        return detector.predict_batch(textos, contextos)
+    
+    resultados = [None] * len(textos)
+    pendentes = []
+    for i, texto in enumerate(textos):
+        if isinstance(texto, str):
+            chave = cache.chave(texto, detector.versao)
+            resultados[i] = cache.obter(chave)
+            metricas.incrementar('detector_cache_consultas_total', resultado='miss' if resultados[i] is None else 'hit')
+            if resultados[i] is None:
+                pendentes.append((i, chave))
+        else:
+            pendentes.append((i, None))
+    
+    if pendentes:
+        novos = detector.predict_batch(
+            [textos[i] for i, _ in pendentes],
+            [contextos[i] for i, _ in pendentes] if contextos else None
+        )
+        for (i, chave), resultado in zip(pendentes, novos):
+            resultados[i] = resultado
+            if chave is not None and 'estatisticas_deteccao' in resultado:
+                cache.guardar(chave, resultado, detector.versao)
+    
+    return resultados
+
+@app.route('/')
+def index():
+    return estaticos.pagina(request)
+
+@app.route('/static/<nome>')
+def arquivo_estatico(nome):
+    resposta = estaticos.arquivo(request, nome)
+    if resposta is None:
+        return jsonify({'error': 'Arquivo não encontrado.'}), 404
+    return resposta
+
+def instrumentar(view):
+    """Mede a requisição inteira e, com SERVER_TIMING, devolve o tempo de cada etapa no cabeçalho.
+    
+    Com o perfilador ligado, a requisição também pode ser perfilada (X-Perfil ou sorteio)
+    ou vigiada pelo limiar de lentidão; as gravadas trazem o id no cabeçalho X-Perfil-Id.
+    """
+    @functools.wraps(view)
+    def view_instrumentada(*args, **kwargs):
+        inicio = time.perf_counter()
+        perfil = perfilador.iniciar(request.headers.get('X-Perfil')) if perfilador.ativo else None
+        resposta = None
+        try:
+            with metricas.coletar_tempos() as tempos:
+                if perfil is None:
+                    resposta = app.make_response(view(*args, **kwargs))
+                else:
+                    g.perfil = perfil
+                    resposta = app.make_response(perfilador.envolver(perfil, view)(*args, **kwargs))
+        finally:
+            if perfil is not None:
+                identificador = perfilador.finalizar(perfil, {
+                    'endpoint': request.endpoint,
+                    'status': resposta.status_code if resposta is not None else 500,
+                    'bytes_entrada': request.content_length
+                }, time.perf_counter() - inicio, tempos)
+                if identificador is not None and resposta is not None:
+                    resposta.headers['X-Perfil-Id'] = identificador
+        duracao = time.perf_counter() - inicio
+        
+        if resposta.is_streamed:
+            # O corpo ainda vai ser gerado: a latência e o status só são contados quando ele termina
+            resposta.response = medir_stream(resposta.response, inicio, request.endpoint, resposta.status_code, g._get_current_object())
+        else:
+            metricas.observar('detector_requisicao_segundos', duracao, endpoint=request.endpoint)
+            metricas.incrementar('detector_requisicoes_total', endpoint=request.endpoint, status=resposta.status_code)
+        if SERVER_TIMING:
+            tempos['total'] = duracao
+            resposta.headers['Server-Timing'] = server_timing(tempos)
+        return resposta
+    return view_instrumentada
+
+def medir_stream(corpo, inicio, endpoint, status, estado):
+    """Repassa o corpo de uma resposta em streaming e, no fim, registra a duração e o status.
+    
+    Um erro no meio do stream não muda o status já enviado; a view o anota em
+    g.status_stream (`estado` é o g da requisição) para ele entrar nas métricas.
+    """
+    try:
+        yield from corpo
+    finally:
+        metricas.observar('detector_requisicao_segundos', time.perf_counter() - inicio, endpoint=endpoint)
+        metricas.incrementar('detector_requisicoes_total', endpoint=endpoint, status=estado.get('status_stream', status))
 
-Por outro lado, quando fui ao mercado hoje, o padeiro foi muito simpático comigo. Ele me deu um café e a gente conversou um pouco sobre o time de futebol. Achei bem legal isso, sabe?`;
+def formato_compacto(data):
+    return (data.get('formato') or request.args.get('formato')) == 'compacto'
 
-            document.getElementById('textInput').dispatchEvent(new Event('input'));
-        </script>
-    </body>
-    </html>
-    '''
+def tipo_resposta():
+    return request.accept_mimetypes.best_match(tipos_aceitos(), default='application/json')
+
+def responder(dados, status=200):
+    """JSON ou MessagePack, conforme o Accept da requisição"""
+    mimetype = tipo_resposta()
+    if mimetype == 'application/json':
+        return jsonify(dados), status
+    return Response(serializar(dados, mimetype), status=status, mimetype=mimetype)
+
+def etag_analise(texto, por_frase, compacto):
+    """ETag fraco de uma resposta de /api/detect: mesmo texto, opções, formato e versão do modelo.
+    
+    É fraco porque a resposta pode variar em detalhes que não mudam a análise (ex.: a
+    indicação de quase duplicata), e é calculado sem analisar o texto.
+    """
+    h = hashlib.sha256(f'{detector.versao}|{int(por_frase)}|{int(compacto)}|{tipo_resposta()}|'.encode('utf-8'))
+    h.update(texto.encode('utf-8', 'surrogatepass'))
+    return h.hexdigest()[:32]
+
+def com_etag(resposta, etag):
+    resposta = app.make_response(resposta)
+    resposta.set_etag(etag, weak=True)
+    # Respostas de POST não entram no cache HTTP: o cliente guarda o corpo e manda If-None-Match
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    resposta.vary.add('Accept')
+    return resposta
+
+@app.after_request
+def comprimir_resposta(resposta):
+    """Comprime com brotli ou gzip respostas grandes, se o cliente aceitar"""
+    if (not COMPRESSAO or resposta.direct_passthrough or resposta.is_streamed
+            or 'Content-Encoding' in resposta.headers or resposta.mimetype not in TIPOS_COMPRIMIVEIS):
+        return resposta
+    resposta.vary.add('Accept-Encoding')
+    codificacao = request.accept_encodings.best_match(codificacoes_aceitas())
+    if codificacao is None or (resposta.content_length or 0) < COMPRESSAO_MIN_BYTES:
+        return resposta
+    with metricas.cronometrar('detector_etapa_segundos', etapa='compressao'):
+        resposta.set_data(comprimir(resposta.get_data(), codificacao))
+    resposta.headers['Content-Encoding'] = codificacao
+    return resposta
+
+def analisar_com_limite(funcao, *args):
+    """Roda a análise no pool limitado (ANALISE_THREADS), se houver; senão, na thread da requisição.
+    
+    O cabeçalho X-Prazo-Ms encurta o prazo padrão da requisição.
+    """
+    perfil = g.get('perfil') if perfilador.ativo else None
+    if perfil is not None:
+        perfil.anotar_entrada(args[0])
+        if perfil.motivo == 'cabecalho':
+            # Quem pede o perfil quer medir a análise, não a consulta ao cache
+            funcao = {predict_com_cache: predict_com_quase_duplicatas, predict_batch_com_cache: detector.predict_batch}.get(funcao, funcao)
+    if executor is None:
+        return funcao(*args)
+    if perfil is not None:
+        # A análise roda em outra thread, que o perfil da requisição não cobre sozinho
+        funcao = perfilador.envolver(perfil, funcao)
+    prazo = request.headers.get('X-Prazo-Ms', type=float)
+    return executor.executar(funcao, *args, prazo=prazo / 1000 if prazo else None)
+
+def resposta_sobrecarga(erro):
+    resposta = jsonify({'error': str(erro), 'retry_after': erro.retry_after})
+    resposta.status_code = erro.status
+    resposta.headers['Retry-After'] = str(erro.retry_after)
+    return resposta
+
+def estatisticas_texto(text, result, contexto=None):
+    contexto = contexto or ContextoAnalise(text)
+    return {
+        'original_length': len(text),
+        'analyzed_length': result.get('text_analyzed_length', len(text)),
+        'word_count': len(contexto.palavras_espaco),
+        'sentences': len(contexto.spans_frases),
+        'language': detector.lexico_de(contexto).idioma
+    }
 
 @app.route('/api/detect', methods=['POST'])
+@instrumentar
 def detect_ai():
     try:
         data = request.get_json()
@@ -587,30 +1078,336 @@ def detect_ai():
                 'min_length': 20
             }), 400
         
-        result = detector.predict(text)
+        por_frase = bool(data.get('por_frase'))
+        etag = etag_analise(text, por_frase, formato_compacto(data))
+        if request.if_none_match.contains_weak(etag):
+            return com_etag(Response(status=304), etag)
         
-        return jsonify({
+        contexto = ContextoAnalise(text)
+        result = analisar_com_limite(predict_com_cache, text, contexto, por_frase)
+        resposta = {
             'success': True,
             'result': result,
-            'text_stats': {
-                'original_length': len(text),
-                'analyzed_length': result.get('text_analyzed_length', len(text)),
-                'word_count': len(text.split()),
-                'sentences': len(detector.dividir_frases(text))
-            }
-        })
+            'text_stats': estatisticas_texto(text, result, contexto)
+        }
+        if formato_compacto(data):
+            resposta['result'] = compactar_resultado(result, indice_tipos)
+            resposta['tipos'] = tipos_resposta
+        
+        return com_etag(responder(resposta), etag)
+        
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
+    except Exception as e:
+        print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
+        return jsonify({
+            'error': f'Erro na análise: {str(e)}'
+        }), 500
+
+@app.route('/api/detect/batch', methods=['POST'])
+@instrumentar
+def detect_ai_batch():
+    try:
+        data = request.get_json()
+        texts = data.get('texts')
+        
+        if not isinstance(texts, list) or not texts:
+            return jsonify({
+                'error': 'Envie uma lista não vazia em "texts".'
+            }), 400
+        
+        if len(texts) > MAX_TEXTOS_LOTE:
+            return jsonify({
+                'error': f'Lote muito grande. Máximo {MAX_TEXTOS_LOTE} textos.',
+                'max_batch': MAX_TEXTOS_LOTE
+            }), 400
+        
+        textos = [t.strip() if isinstance(t, str) else t for t in texts]
+        contextos = [ContextoAnalise(t) if isinstance(t, str) else None for t in textos]
+        resultados = analisar_com_limite(predict_batch_com_cache, textos, contextos)
+        
+        compacto = formato_compacto(data)
+        itens = []
+        for i, (text, result) in enumerate(zip(textos, resultados)):
+            if 'error' in result:
+                itens.append({'index': i, 'success': False, **result})
+            else:
+                itens.append({
+                    'index': i,
+                    'success': True,
+                    'result': compactar_resultado(result, indice_tipos) if compacto else result,
+                    'text_stats': estatisticas_texto(text, result, contextos[i])
+                })
         
+        resposta = {
+            'success': True,
+            'count': len(itens),
+            'results': itens
+        }
+        if compacto:
+            resposta['tipos'] = tipos_resposta
+        return responder(resposta)
+        
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
+    except Exception as e:
+        print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
+        return jsonify({
+            'error': f'Erro na análise: {str(e)}'
+        }), 500
+
+def ler_corpo_em_pedacos(corpo, tamanho=64 * 1024):
+    """Lê o corpo text/plain aos poucos, decodificando UTF-8 incrementalmente.
+    
+    Recebe o próprio stream (request.stream), e não o proxy da requisição, porque
+    as janelas podem ser lidas nas threads do pool de análise.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    while True:
+        bloco = corpo.read(tamanho)
+        if not bloco:
+            break
+        yield decodificador.decode(bloco)
+    yield decodificador.decode(b'', final=True)
+
+@app.route('/api/detect/stream', methods=['POST'])
+@instrumentar
+def detect_ai_stream():
+    """Análise em janelas para documentos longos, respondida em NDJSON à medida que avança.
+    
+    Aceita JSON {"text": ...} ou o texto puro no corpo (text/plain), que é lido em
+    streaming sem carregar o documento inteiro na memória. Cada janela passa pelo pool
+    limitado com o prazo da requisição: se a primeira não é admitida, a resposta é
+    429/503 como em /api/detect; nas seguintes, a recusa vira uma linha de erro.
+    """
+    if request.is_json:
+        data = request.get_json()
+        pedacos = [data.get('text', '')]
+    else:
+        pedacos = ler_corpo_em_pedacos(request.stream)
+    
+    try:
+        tamanho_janela = int(request.args.get('janela', TAMANHO_JANELA))
+    except ValueError:
+        tamanho_janela = TAMANHO_JANELA
+    tamanho_janela = max(500, min(tamanho_janela, 50000))
+    
+    janelas = detector.analisar_em_janelas(pedacos, tamanho_janela)
+    try:
+        # A primeira janela é analisada antes de responder, para a recusa ainda sair com status próprio
+        item = analisar_com_limite(next, janelas, None)
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
+    except Exception as e:
+        print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
+        return jsonify({
+            'error': f'Erro na análise: {str(e)}'
+        }), 500
+    
+    def gerar(item):
+        try:
+            while item is not None:
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+                item = analisar_com_limite(next, janelas, None)
+        except Sobrecarga as e:
+            g.status_stream = e.status
+            yield json.dumps({'tipo': 'erro', 'error': str(e), 'retry_after': e.retry_after}, ensure_ascii=False) + '\n'
+        except Exception as e:
+            print(f"💥 ERRO NA API: {e}")
+            metricas.incrementar('detector_erros_total', origem='api')
+            g.status_stream = 500
+            yield json.dumps({'tipo': 'erro', 'error': f'Erro na análise: {str(e)}'}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(gerar(item)), mimetype='application/x-ndjson')
+
+# O trabalho de CPU das sessões passa pelo mesmo pool limitado das outras análises
+
+def abrir_sessao(text):
+    identificador, documento = sessoes.criar(detector, text)
+    with documento.lock:
+        return identificador, documento, documento.resultado_completo()
+
+def aplicar_edicoes(documento, edicoes, versao_esperada):
+    """(resultado do trecho, versão nova), ou (None, versão atual) se `versao_esperada` ficou para trás"""
+    with documento.lock:
+        if versao_esperada is not None and versao_esperada != documento.versao:
+            return None, documento.versao
+        with metricas.cronometrar('detector_etapa_segundos', etapa='edicao'):
+            inicio, fim = sessoes.editar(documento, edicoes)
+            result = documento.resultado_trecho(inicio, fim)
+        return result, documento.versao
+
+def ler_sessao(documento):
+    with documento.lock:
+        return documento.texto, documento.versao, documento.resultado_completo()
+
+@app.route('/api/sessoes', methods=['POST'])
+@instrumentar
+def criar_sessao():
+    """Abre uma sessão de edição com o texto inicial; as posições das edições seguintes se referem a ele"""
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    if not isinstance(text, str):
+        return jsonify({'error': 'Envie o texto em "text".'}), 400
+    try:
+        identificador, documento, result = analisar_com_limite(abrir_sessao, text)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
+    except Exception as e:
+        print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
+        return jsonify({
+            'error': f'Erro na análise: {str(e)}'
+        }), 500
+    metricas.definir('detector_sessoes_ativas', sessoes.estatisticas()['sessoes'])
+    return jsonify({
+        'success': True,
+        'sessao': identificador,
+        'versao': documento.versao,
+        'result': result
+    }), 201
+
+@app.route('/api/sessoes/<identificador>/edicoes', methods=['POST'])
+@instrumentar
+def editar_sessao(identificador):
+    """Aplica edições {inicio, fim, texto} e devolve o documento atualizado e o trecho reanalisado.
+    
+    Com "versao" no corpo, a edição só é aceita se o documento ainda estiver nessa
+    versão (409 caso contrário); sessões expiradas respondem 404.
+    """
+    documento = sessoes.obter(identificador)
+    if documento is None:
+        return jsonify({'error': 'Sessão não encontrada ou expirada. Crie outra com o texto completo.'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    edicoes = data.get('edicoes')
+    if not isinstance(edicoes, list):
+        return jsonify({'error': 'Envie uma lista de edições em "edicoes".'}), 400
+    
+    try:
+        result, versao = analisar_com_limite(aplicar_edicoes, documento, edicoes, data.get('versao'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
     except Exception as e:
         print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
         return jsonify({
             'error': f'Erro na análise: {str(e)}'
         }), 500
+    if result is None:
+        return jsonify({'error': 'Versão desatualizada.', 'versao': versao}), 409
+    
+    return jsonify({
+        'success': True,
+        'sessao': identificador,
+        'versao': versao,
+        'result': result
+    })
+
+@app.route('/api/sessoes/<identificador>', methods=['GET'])
+@instrumentar
+def obter_sessao(identificador):
+    documento = sessoes.obter(identificador)
+    if documento is None:
+        return jsonify({'error': 'Sessão não encontrada ou expirada.'}), 404
+    try:
+        texto, versao, result = analisar_com_limite(ler_sessao, documento)
+    except Sobrecarga as e:
+        return resposta_sobrecarga(e)
+    except Exception as e:
+        print(f"💥 ERRO NA API: {e}")
+        metricas.incrementar('detector_erros_total', origem='api')
+        return jsonify({
+            'error': f'Erro na análise: {str(e)}'
+        }), 500
+    return jsonify({
+        'success': True,
+        'sessao': identificador,
+        'versao': versao,
+        'text': texto,
+        'result': result
+    })
+
+@app.route('/api/sessoes/<identificador>', methods=['DELETE'])
+def remover_sessao(identificador):
+    if not sessoes.remover(identificador):
+        return jsonify({'error': 'Sessão não encontrada ou expirada.'}), 404
+    metricas.definir('detector_sessoes_ativas', sessoes.estatisticas()['sessoes'])
+    return jsonify({'success': True})
+
+def acesso_perfis():
+    """None se o cabeçalho X-Perfil traz o token do perfilador; senão, a resposta de erro"""
+    if not perfilador.token:
+        return jsonify({'error': 'Perfis desativados. Defina PERFIL_TOKEN.'}), 404
+    if not perfilador.autorizado(request.headers.get('X-Perfil')):
+        return jsonify({'error': 'Token de perfil inválido.'}), 403
+    return None
+
+@app.route('/api/perfis')
+def listar_perfis():
+    """Requisições perfiladas ou lentas guardadas, da mais recente à mais antiga"""
+    erro = acesso_perfis()
+    if erro is not None:
+        return erro
+    return jsonify({
+        'perfis': perfilador.registro.listar(),
+        'taxa': perfilador.taxa,
+        'limiar_ms': perfilador.limiar * 1000 if perfilador.limiar else None,
+        'max_itens': perfilador.registro.max_itens
+    })
+
+@app.route('/api/perfis/<identificador>')
+def obter_perfil(identificador):
+    erro = acesso_perfis()
+    if erro is not None:
+        return erro
+    registro = perfilador.registro.ler(identificador)
+    if registro is None:
+        return jsonify({'error': 'Perfil não encontrado (o buffer guarda só os mais recentes).'}), 404
+    return jsonify(registro)
+
+@app.route('/api/perfis/<identificador>/download')
+def baixar_perfil(identificador):
+    """O perfil completo: .prof (pstats, snakeviz) ou .folded (flamegraph.pl, speedscope)"""
+    erro = acesso_perfis()
+    if erro is not None:
+        return erro
+    caminho = perfilador.registro.caminho_perfil(identificador)
+    if caminho is None:
+        return jsonify({'error': 'Perfil não encontrado (o buffer guarda só os mais recentes).'}), 404
+    mimetype = 'text/plain' if caminho.endswith('.folded') else 'application/octet-stream'
+    return send_file(caminho, mimetype=mimetype, as_attachment=True, download_name=os.path.basename(caminho))
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify({
+        'versao': detector.versao,
+        **cache.estatisticas(),
+        **({'quase_duplicatas': quase_duplicatas.estatisticas()} if quase_duplicatas.ativo else {})
+    })
+
+@app.route('/metrics')
+def metrics():
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/health')
 def health():
     return jsonify({
         'status': 'online', 
-        'model': 'active',
+        'model': 'active' if detector.is_trained else ('heuristic' if detector.versao_modelo else 'not_loaded'),
+        'model_version': detector.versao_modelo,
+        'model_load_ms': round(detector.tempo_carga_modelo * 1000, 1) if detector.tempo_carga_modelo is not None else None,
+        'pid': os.getpid(),
+        'memory': uso_memoria(),
+        'analise': executor.estatisticas() if executor is not None else None,
+        'lexicos': detector.lexicos.estatisticas(),
         'features': 'relatorio_detalhado',
         'version': '2.0_corrigido'
     })
@@ -618,4 +1415,5 @@ def health():
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"🚀 Detector de IA com Relatório Detalhado - Porta {port}")
+    detector.carregar_modelo()
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,95 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import joblib
+
+from floresta import FlorestaCompilada, amostras_de_paridade, verificar_paridade
+
+
+def caminho_metadados(caminho_modelo):
+    return os.path.splitext(caminho_modelo)[0] + '.json'
+
+
+def hash_arquivo(caminho):
+    with open(caminho, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()[:16]
+
+
+def salvar_artefato(modelo, caminho_modelo, metadados=None):
+    """Grava o modelo, a floresta compilada e os metadados de forma atômica.
+
+    O .pkl e o diretório da floresta (com a versão no nome) são gravados antes;
+    o .json de metadados é trocado por último com os.replace, então um leitor vê
+    sempre a versão antiga completa ou a nova completa.
+    """
+    base = os.path.splitext(caminho_modelo)[0]
+    os.makedirs(os.path.dirname(os.path.abspath(caminho_modelo)), exist_ok=True)
+    temporario = f'{caminho_modelo}.tmp-{os.getpid()}'
+    joblib.dump(modelo, temporario)
+    versao = hash_arquivo(temporario)
+    os.replace(temporario, caminho_modelo)
+
+    diretorio_floresta = None
+    try:
+        floresta = FlorestaCompilada(modelo)
+        if verificar_paridade(modelo, floresta, amostras_de_paridade(floresta)):
+            diretorio_floresta = f'{base}.floresta-{versao}'
+            temporario = f'{diretorio_floresta}.tmp-{os.getpid()}'
+            shutil.rmtree(temporario, ignore_errors=True)
+            floresta.salvar(temporario)
+            shutil.rmtree(diretorio_floresta, ignore_errors=True)
+            os.replace(temporario, diretorio_floresta)
+        else:
+            print("⚠️  Floresta compilada diverge do sklearn, artefato salvo sem ela")
+    except (ValueError, AttributeError) as e:
+        print(f"⚠️  Não foi possível compilar a floresta: {e}")
+
+    meta = {
+        'versao': versao,
+        'modelo': os.path.basename(caminho_modelo),
+        'floresta': os.path.basename(diretorio_floresta) if diretorio_floresta else None,
+        'criado_em': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        **(metadados or {})
+    }
+    temporario = f'{caminho_metadados(caminho_modelo)}.tmp-{os.getpid()}'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho_metadados(caminho_modelo))
+
+    # Florestas de versões anteriores não são mais referenciadas
+    for antigo in glob.glob(f'{glob.escape(base)}.floresta-*'):
+        if antigo != diretorio_floresta and '.tmp-' not in antigo:
+            shutil.rmtree(antigo, ignore_errors=True)
+
+    return meta
+
+
+def ler_metadados(caminho_modelo):
+    try:
+        with open(caminho_metadados(caminho_modelo), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def carregar_artefato(caminho_modelo, mmap=True):
+    """Retorna (modelo, floresta, versao).
+
+    Se houver floresta compilada, ela é aberta por mmap e o .pkl do sklearn não é
+    carregado (modelo volta None). Sem ela, carrega o .pkl e a floresta vem None.
+    """
+    meta = ler_metadados(caminho_modelo)
+    if meta and meta.get('floresta'):
+        diretorio = os.path.join(os.path.dirname(os.path.abspath(caminho_modelo)), meta['floresta'])
+        if os.path.isdir(diretorio):
+            floresta = FlorestaCompilada.carregar(diretorio, mmap_mode='r' if mmap else None)
+            return None, floresta, meta['versao']
+
+    if not os.path.exists(caminho_modelo):
+        raise FileNotFoundError(caminho_modelo)
+    modelo = joblib.load(caminho_modelo)
+    return modelo, None, hash_arquivo(caminho_modelo)
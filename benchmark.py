@@ -0,0 +1,231 @@
+"""Benchmark de cada etapa do detector e da API completa.
+
+Uso:
+    python benchmark.py                                  # imprime a tabela
+    python benchmark.py --salvar bench/baseline.json     # grava um baseline
+    python benchmark.py --comparar bench/baseline.json --limite 0.25
+
+Com --comparar, termina com código 1 se o p50 de alguma etapa piorar mais que o limite.
+Também compara o tamanho das respostas no formato completo e no compacto, sem e com
+compressão.
+Os textos são gerados de forma determinística, então resultados da mesma máquina
+são comparáveis entre execuções.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from itertools import count
+
+# O cache e o índice de quase duplicatas mascarariam o custo real da API
+os.environ.setdefault('CACHE_MAX_ITENS', '0')
+os.environ.pop('CACHE_SQLITE', None)
+os.environ.pop('DUPLICATAS_SQLITE', None)
+
+import app as servidor  # noqa: E402
+from app import app, detector, indice_tipos  # noqa: E402
+from analise import ContextoAnalise  # noqa: E402
+import formato_resposta  # noqa: E402
+from quase_duplicatas import IndiceQuaseDuplicatas  # noqa: E402
+from textos_sinteticos import PALAVRAS_NEUTRAS, gerar_texto  # noqa: E402
+from formato_resposta import compactar_resultado, comprimir, serializar  # noqa: E402
+
+CASOS = {
+    'curto_baixa': {'palavras': 60, 'densidade': 0.01},
+    'curto_alta': {'palavras': 60, 'densidade': 0.15},
+    'longo_baixa': {'palavras': 8000, 'densidade': 0.01},
+    'longo_alta': {'palavras': 8000, 'densidade': 0.15},
+}
+
+
+def medir(funcao, entradas, repeticoes, tempo_minimo):
+    duracoes = []
+    inicio = time.perf_counter()
+    while True:
+        for entrada in entradas:
+            t0 = time.perf_counter_ns()
+            funcao(entrada)
+            duracoes.append(time.perf_counter_ns() - t0)
+        total = time.perf_counter() - inicio
+        if len(duracoes) >= repeticoes and total >= tempo_minimo:
+            break
+    duracoes.sort()
+    return {
+        'chamadas': len(duracoes),
+        'ops_por_s': round(len(duracoes) / (sum(duracoes) / 1e9), 1),
+        'p50_ms': round(duracoes[len(duracoes) // 2] / 1e6, 4),
+        'p99_ms': round(duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.99))] / 1e6, 4)
+    }
+
+
+def etapas(textos):
+    """Funções medidas, cada uma recebendo entradas já preparadas pelas etapas anteriores"""
+    cliente = app.test_client()
+    termos = [(t, detector.analisar_termos_suspeitos(t)) for t in textos]
+    analises = [detector.analisar_texto(t) for t in textos]
+    resultados = [detector.predict(t) for t in textos]
+    medidas = {
+        'analisar_termos_suspeitos': (detector.analisar_termos_suspeitos, textos),
+        'gerar_texto_destacado': (lambda par: detector.gerar_texto_destacado(*par), termos),
+        'extrair_features': (lambda t: detector.extrair_features(t, ContextoAnalise(t)), textos),
+        'modelo': (lambda a: detector.calcular_probabilidades([a]), analises),
+        'predict': (detector.predict, textos),
+        'api_detect': (lambda t: cliente.post('/api/detect', json={'text': t}).get_data(), textos),
+        'json_completo': (app.json.dumps, resultados),
+        'json_compacto': (lambda r: app.json.dumps(compactar_resultado(r, indice_tipos)), resultados),
+    }
+    if formato_resposta.msgpack is not None:
+        medidas['msgpack_compacto'] = (
+            lambda r: serializar(compactar_resultado(r, indice_tipos), 'application/msgpack'), resultados
+        )
+    return medidas
+
+
+def quase_copia(texto, semente):
+    """O texto com uma palavra do meio trocada, como um reenvio com uma correção"""
+    palavras = texto.split(' ')
+    meio = len(palavras) // 2
+    palavras[meio] = random.Random(semente).choice(PALAVRAS_NEUTRAS)
+    return ' '.join(palavras)
+
+
+def etapas_quase_duplicatas(textos, diretorio):
+    """predict passando pelo índice de quase duplicatas, em um SQLite temporário.
+
+    `sem_par` mede o custo do índice para um texto novo: cada chamada leva um sufixo
+    único, então o texto é procurado e gravado, e o limiar acima de 1 impede o
+    reaproveitamento. `quase_copia` mede reenvios com uma palavra trocada.
+    """
+    sem_par = IndiceQuaseDuplicatas(os.path.join(diretorio, f'sem_par-{len(textos[0])}.db'), limiar=1.01)
+    com_par = IndiceQuaseDuplicatas(os.path.join(diretorio, f'com_par-{len(textos[0])}.db'))
+    sufixos = count()
+
+    def com_indice(indice, texto):
+        servidor.quase_duplicatas = indice
+        return servidor.predict_com_quase_duplicatas(texto)
+
+    for texto in textos:
+        com_indice(com_par, texto)
+    return {
+        'predict_duplicatas_sem_par': (lambda t: com_indice(sem_par, f'{t} {next(sufixos)}.'), textos),
+        'predict_duplicatas_quase_copia': (lambda t: com_indice(com_par, t),
+                                           [quase_copia(t, semente=i) for i, t in enumerate(textos)]),
+    }
+
+
+def tamanhos(textos):
+    """Bytes médios da resposta em cada formato, sem compressão e com cada codificação"""
+    resultados = [detector.predict(t) for t in textos]
+    formatos = {
+        'json_completo': [app.json.dumps(r).encode('utf-8') for r in resultados],
+        'json_compacto': [app.json.dumps(compactar_resultado(r, indice_tipos)).encode('utf-8') for r in resultados],
+    }
+    if formato_resposta.msgpack is not None:
+        formatos['msgpack_compacto'] = [
+            serializar(compactar_resultado(r, indice_tipos), 'application/msgpack') for r in resultados
+        ]
+    codificacoes = ['gzip'] + (['br'] if formato_resposta.brotli is not None else [])
+    medidas = {'texto': round(sum(len(t.encode('utf-8')) for t in textos) / len(textos))}
+    for formato, corpos in formatos.items():
+        medidas[formato] = {'bruto': round(sum(map(len, corpos)) / len(corpos))}
+        for codificacao in codificacoes:
+            medidas[formato][codificacao] = round(sum(len(comprimir(c, codificacao)) for c in corpos) / len(corpos))
+    return medidas
+
+
+def executar(args):
+    detector.garantir_modelo()
+    if not detector.is_trained:
+        detector.treinar_modelo()
+
+    resultados = {}
+    bytes_por_caso = {}
+    with tempfile.TemporaryDirectory(prefix='benchmark-duplicatas-') as diretorio:
+        for caso, parametros in CASOS.items():
+            if args.casos and caso not in args.casos:
+                continue
+            textos = [gerar_texto(parametros['palavras'], parametros['densidade'], semente=i) for i in range(args.textos)]
+            for etapa, (funcao, entradas) in {**etapas(textos), **etapas_quase_duplicatas(textos, diretorio)}.items():
+                if args.etapas and etapa not in args.etapas:
+                    continue
+                funcao(entradas[0])
+                resultados[f'{caso}/{etapa}'] = medir(funcao, entradas, args.repeticoes, args.tempo)
+            bytes_por_caso[caso] = tamanhos(textos)
+    return resultados, bytes_por_caso
+
+
+def comparar(resultados, baseline, limite):
+    regressoes = []
+    for nome, atual in resultados.items():
+        anterior = baseline.get('resultados', {}).get(nome)
+        if not anterior:
+            continue
+        variacao = atual['p50_ms'] / anterior['p50_ms'] - 1 if anterior['p50_ms'] else 0.0
+        atual['variacao_p50'] = round(variacao, 3)
+        if variacao > limite:
+            regressoes.append((nome, anterior['p50_ms'], atual['p50_ms'], variacao))
+    return regressoes
+
+
+def imprimir(resultados):
+    print(f"{'caso/etapa':<42} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'Δp50':>8}")
+    for nome, r in resultados.items():
+        variacao = f"{r['variacao_p50']:+.0%}" if 'variacao_p50' in r else ''
+        print(f"{nome:<42} {r['ops_por_s']:>10.1f} {r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} {variacao:>8}")
+
+
+def imprimir_tamanhos(bytes_por_caso):
+    print()
+    print(f"{'caso/formato':<42} {'bytes':>10} {'gzip':>10} {'br':>10} {'× texto':>8}")
+    for caso, medidas in bytes_por_caso.items():
+        for formato, tamanho in medidas.items():
+            if formato == 'texto':
+                continue
+            br = tamanho.get('br')
+            print(f"{caso + '/' + formato:<42} {tamanho['bruto']:>10} {tamanho['gzip']:>10} "
+                  f"{br if br is not None else '-':>10} {tamanho['bruto'] / medidas['texto']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das etapas do detector')
+    parser.add_argument('--textos', type=int, default=8, help='textos distintos por caso')
+    parser.add_argument('--repeticoes', type=int, default=50, help='mínimo de chamadas por etapa')
+    parser.add_argument('--tempo', type=float, default=0.5, help='tempo mínimo, em segundos, por etapa')
+    parser.add_argument('--casos', nargs='*', choices=list(CASOS))
+    parser.add_argument('--etapas', nargs='*')
+    parser.add_argument('--salvar', help='grava os resultados como baseline JSON')
+    parser.add_argument('--comparar', help='baseline JSON para detectar regressões')
+    parser.add_argument('--limite', type=float, default=0.25, help='piora máxima aceita no p50 (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    resultados, bytes_por_caso = executar(args)
+    regressoes = []
+    if args.comparar:
+        with open(args.comparar) as f:
+            regressoes = comparar(resultados, json.load(f), args.limite)
+    imprimir(resultados)
+    imprimir_tamanhos(bytes_por_caso)
+
+    if args.salvar:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salvar)), exist_ok=True)
+        with open(args.salvar, 'w') as f:
+            json.dump({
+                'maquina': {'python': platform.python_version(), 'plataforma': platform.platform(), 'cpus': os.cpu_count()},
+                'versao_detector': detector.versao,
+                'resultados': resultados,
+                'tamanhos': bytes_por_caso
+            }, f, indent=2, ensure_ascii=False)
+        print(f"💾 Baseline salvo em {args.salvar}")
+
+    if regressoes:
+        for nome, antes, depois, variacao in regressoes:
+            print(f"❌ Regressão em {nome}: p50 {antes:.3f} ms → {depois:.3f} ms ({variacao:+.0%})")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Os contadores compartilhados são somados em memória e gravados no SQLite no máximo a cada tanto
+INTERVALO_CONTADORES = 5.0
+# Depois de um erro do SQLite, o cache fica só em memória por este tempo antes de tentar de novo
+ESPERA_APOS_ERRO = 30.0
+
+
+class CacheResultados:
+    """Cache de resultados endereçado pelo conteúdo do texto.
+
+    A chave é o hash do texto junto com a versão do modelo e do léxico, então
+    qualquer mudança em um deles invalida as entradas antigas sem nenhum passo extra.
+    Há sempre um LRU em memória (com TTL e limite de bytes) por processo e,
+    opcionalmente, um arquivo SQLite compartilhado por todos os workers do gunicorn.
+    """
+
+    def __init__(self, max_itens=1024, max_bytes=64 * 1024 * 1024, ttl=3600,
+                 caminho_sqlite=None, max_bytes_sqlite=512 * 1024 * 1024):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.caminho_sqlite = caminho_sqlite
+        self.max_bytes_sqlite = max_bytes_sqlite
+
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._pid = None
+        self._indisponivel_ate = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.hits_compartilhados = 0
+        # Hits e misses ainda não somados aos contadores do arquivo compartilhado
+        self._contadores_pendentes = Counter()
+        self._proxima_gravacao_contadores = 0.0
+
+    @property
+    def ativo(self):
+        return self.max_itens > 0 or self.caminho_sqlite is not None
+
+    @staticmethod
+    def chave(texto, versao):
+        # O texto não é normalizado além do strip feito na API: as posições dos termos dependem dele
+        h = hashlib.sha256()
+        h.update(versao.encode('utf-8'))
+        h.update(b'\0')
+        # surrogatepass: um surrogate solto (JSON aceita "\ud800") não pode derrubar a requisição
+        h.update(texto.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def obter(self, chave):
+        agora = time.time()
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                criado, valor, _ = item
+                if agora - criado <= self.ttl:
+                    self._itens.move_to_end(chave)
+                    self.hits += 1
+                    self._contar('hits', agora)
+                    return json.loads(valor)
+                self._remover(chave)
+
+            valor = self._obter_sqlite(chave, agora)
+            if valor is None:
+                self.misses += 1
+                self._contar('misses', agora)
+                return None
+
+            self.hits += 1
+            self.hits_compartilhados += 1
+            self._contar('hits', agora)
+            self._guardar_memoria(chave, valor, len(valor.encode('utf-8')), agora)
+            return json.loads(valor)
+
+    def guardar(self, chave, resultado, versao=''):
+        valor = json.dumps(resultado, ensure_ascii=False)
+        agora = time.time()
+        try:
+            tamanho, compartilhavel = len(valor.encode('utf-8')), True
+        except UnicodeEncodeError:
+            # Surrogate solto no texto: o SQLite não grava, então o resultado fica só na memória
+            tamanho, compartilhavel = len(valor.encode('utf-8', 'surrogatepass')), False
+        with self._lock:
+            self._guardar_memoria(chave, valor, tamanho, agora)
+            if compartilhavel:
+                self._guardar_sqlite(chave, valor, tamanho, versao, agora)
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'itens_memoria': len(self._itens),
+                'bytes_memoria': self._bytes,
+                'hits_compartilhados': self.hits_compartilhados
+            }
+            self._gravar_contadores(time.time())
+            try:
+                conexao = self._conectar()
+                if conexao is not None:
+                    contadores = dict(conexao.execute('SELECT nome, valor FROM contadores').fetchall())
+                    itens = conexao.execute('SELECT COUNT(*) FROM resultados').fetchone()[0]
+                    stats['compartilhado'] = {
+                        'hits': contadores.get('hits', 0),
+                        'misses': contadores.get('misses', 0),
+                        'itens': itens,
+                        'bytes': contadores.get('bytes', 0)
+                    }
+            except sqlite3.Error as e:
+                self._indisponivel(e)
+            return stats
+
+    def limpar_versoes_antigas(self, versao):
+        """Remove do arquivo compartilhado entradas gravadas por outra versão de modelo/léxico"""
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                if conexao is not None:
+                    with conexao:
+                        self._apagar(conexao, 'versao != ?', (versao,))
+            except sqlite3.Error as e:
+                self._indisponivel(e)
+
+    def _guardar_memoria(self, chave, valor, tamanho, agora):
+        """`tamanho` é o valor em bytes UTF-8, a mesma medida do limite do SQLite"""
+        if self.max_itens <= 0 or tamanho > self.max_bytes:
+            return
+        if chave in self._itens:
+            self._remover(chave)
+        self._itens[chave] = (agora, valor, tamanho)
+        self._bytes += tamanho
+        while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+            self._remover(next(iter(self._itens)))
+
+    def _remover(self, chave):
+        _, _, tamanho = self._itens.pop(chave)
+        self._bytes -= tamanho
+
+    def _conectar(self):
+        """Conexão com o arquivo compartilhado; None sem CACHE_SQLITE ou logo depois de um erro.
+
+        Pode levantar sqlite3.Error (arquivo sem permissão, travado ou corrompido): quem
+        chama trata com _indisponivel e segue só com a memória.
+        """
+        if self.caminho_sqlite is None or time.monotonic() < self._indisponivel_ate:
+            return None
+        # Conexões SQLite não sobrevivem ao fork do gunicorn: reabre uma por processo
+        if self._conexao is None or self._pid != os.getpid():
+            self._conexao = None
+            conexao = sqlite3.connect(self.caminho_sqlite, timeout=5, check_same_thread=False)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            with conexao:
+                conexao.execute(
+                    'CREATE TABLE IF NOT EXISTS resultados ('
+                    'chave TEXT PRIMARY KEY, valor TEXT NOT NULL, versao TEXT NOT NULL, '
+                    'criado REAL NOT NULL, acessado REAL NOT NULL, tamanho INTEGER NOT NULL)'
+                )
+                conexao.execute('CREATE INDEX IF NOT EXISTS idx_resultados_acessado ON resultados (acessado)')
+                conexao.execute('CREATE INDEX IF NOT EXISTS idx_resultados_criado ON resultados (criado)')
+                conexao.execute('CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL)')
+                # Total de bytes mantido a cada escrita; arquivos de versões anteriores são somados uma vez
+                conexao.execute(
+                    "INSERT INTO contadores (nome, valor) SELECT 'bytes', COALESCE(SUM(tamanho), 0) FROM resultados "
+                    "WHERE NOT EXISTS (SELECT 1 FROM contadores WHERE nome = 'bytes')"
+                )
+            self._conexao = conexao
+            self._pid = os.getpid()
+        return self._conexao
+
+    @staticmethod
+    def _apagar(conexao, condicao, parametros):
+        """Apaga as entradas que atendem `condicao` e desconta seus bytes do total, na transação aberta"""
+        conexao.execute(
+            "UPDATE contadores SET valor = valor - "
+            f"(SELECT COALESCE(SUM(tamanho), 0) FROM resultados WHERE {condicao}) WHERE nome = 'bytes'",
+            parametros
+        )
+        conexao.execute(f'DELETE FROM resultados WHERE {condicao}', parametros)
+
+    def _indisponivel(self, erro):
+        print(f"⚠️  Cache compartilhado indisponível, usando só a memória por {ESPERA_APOS_ERRO:.0f} s: {erro}")
+        self._conexao = None
+        self._indisponivel_ate = time.monotonic() + ESPERA_APOS_ERRO
+
+    def _obter_sqlite(self, chave, agora):
+        try:
+            conexao = self._conectar()
+            if conexao is None:
+                return None
+            linha = conexao.execute('SELECT valor, criado FROM resultados WHERE chave = ?', (chave,)).fetchone()
+            if linha is None:
+                return None
+            valor, criado = linha
+            with conexao:
+                if agora - criado > self.ttl:
+                    self._apagar(conexao, 'chave = ?', (chave,))
+                    return None
+                conexao.execute('UPDATE resultados SET acessado = ? WHERE chave = ?', (agora, chave))
+            return valor
+        except sqlite3.Error as e:
+            self._indisponivel(e)
+            return None
+
+    def _guardar_sqlite(self, chave, valor, tamanho, versao, agora):
+        if tamanho > self.max_bytes_sqlite:
+            return
+        try:
+            conexao = self._conectar()
+            if conexao is None:
+                return
+            with conexao:
+                # O UPDATE de _apagar abre a transação de escrita: ninguém mexe no total entre as instruções
+                self._apagar(conexao, 'chave = ?', (chave,))
+                conexao.execute(
+                    'INSERT INTO resultados (chave, valor, versao, criado, acessado, tamanho) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (chave, valor, versao, agora, agora, tamanho)
+                )
+                conexao.execute("UPDATE contadores SET valor = valor + ? WHERE nome = 'bytes'", (tamanho,))
+                self._apagar(conexao, 'criado < ?', (agora - self.ttl,))
+                total = conexao.execute("SELECT valor FROM contadores WHERE nome = 'bytes'").fetchone()[0]
+                excesso = total - self.max_bytes_sqlite
+                # Remove os menos acessados recentemente até caber no limite
+                while excesso > 0:
+                    antigos = conexao.execute(
+                        'SELECT chave, tamanho FROM resultados ORDER BY acessado LIMIT 64'
+                    ).fetchall()
+                    if not antigos:
+                        break
+                    for chave_antiga, tamanho_antigo in antigos:
+                        if excesso <= 0:
+                            break
+                        conexao.execute('DELETE FROM resultados WHERE chave = ?', (chave_antiga,))
+                        conexao.execute("UPDATE contadores SET valor = valor - ? WHERE nome = 'bytes'", (tamanho_antigo,))
+                        excesso -= tamanho_antigo
+        except sqlite3.Error as e:
+            self._indisponivel(e)
+
+    def _contar(self, nome, agora):
+        # Uma transação de escrita por consulta faria o hit em memória esperar pelos outros workers
+        if self.caminho_sqlite is None:
+            return
+        self._contadores_pendentes[nome] += 1
+        if agora >= self._proxima_gravacao_contadores:
+            self._gravar_contadores(agora)
+
+    def _gravar_contadores(self, agora):
+        self._proxima_gravacao_contadores = agora + INTERVALO_CONTADORES
+        if not self._contadores_pendentes:
+            return
+        try:
+            conexao = self._conectar()
+            if conexao is None:
+                return
+            with conexao:
+                conexao.executemany(
+                    'INSERT INTO contadores (nome, valor) VALUES (?, ?) '
+                    'ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor',
+                    list(self._contadores_pendentes.items())
+                )
+            self._contadores_pendentes.clear()
+        except sqlite3.Error as e:
+            self._indisponivel(e)
+
+
+def cache_do_ambiente():
+    caminho = os.environ.get('CACHE_SQLITE') or None
+    return CacheResultados(
+        max_itens=int(os.environ.get('CACHE_MAX_ITENS', 1024)),
+        max_bytes=int(float(os.environ.get('CACHE_MAX_MB', 64)) * 1024 * 1024),
+        ttl=float(os.environ.get('CACHE_TTL', 3600)),
+        caminho_sqlite=caminho,
+        max_bytes_sqlite=int(float(os.environ.get('CACHE_SQLITE_MAX_MB', 512)) * 1024 * 1024)
+    )
@@ -0,0 +1,153 @@
+"""Calibra o primeiro nível da cascata de detecção em um corpus rotulado.
+
+Uso:
+    python calibrar_cascata.py --corpus rotulado.jsonl
+    python calibrar_cascata.py --corpus rotulado.csv --perda-maxima 0.002 --max-textos 20000
+
+Para cada texto, mede o custo do primeiro nível (varredura de padrões e features
+rápidas), o da saída antecipada e o do caminho completo, e guarda a probabilidade
+da floresta. Ajusta uma regressão logística sobre as features rápidas na parte de
+treino e, na validação, imprime para cada limiar a fração de textos que sai cedo, a
+acurácia da cascata e o custo médio por texto. O limiar gravado é o menor (o que
+mais economiza), não menor que --limiar-minimo, cuja acurácia fica até
+--perda-maxima abaixo da floresta sozinha.
+O resultado vai para <modelo>.cascata.json, lido pelo app na carga do modelo.
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from analise import ContextoAnalise
+from app import AIDetectorComRelatorio, CAMINHO_MODELO
+from cascata import Cascata, caminho_cascata, features_rapidas
+from treinar import ler_corpus, separar_validacao
+
+LIMIARES = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999)
+
+
+def medir_corpus(detector, caminho, max_textos):
+    """Features rápidas, rótulo, probabilidade da floresta e custos (s) de cada texto"""
+    linhas = []
+    for texto, rotulo in ler_corpus(caminho):
+        texto = texto.strip()
+        if len(texto) < 20:
+            continue
+        inicio = time.perf_counter()
+        contexto = ContextoAnalise(texto)
+        ocorrencias = list(detector.lexico_de(contexto).casador.encontrar(contexto.texto_lower))
+        varredura = time.perf_counter() - inicio
+        x = features_rapidas(detector, texto, contexto, len(ocorrencias))
+        rapido = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        detector.resultado_rapido(texto, contexto, ocorrencias, (0.5, 0.5))
+        relatorio = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        prob_floresta = detector.predict(texto, ContextoAnalise(texto))['ai_probability']
+        completo = time.perf_counter() - inicio
+
+        # Quem sai cedo paga o nível rápido e o relatório; os demais reaproveitam a varredura
+        linhas.append((x, rotulo, prob_floresta, rapido + relatorio, rapido + completo - varredura, completo))
+        if len(linhas) % 1000 == 0:
+            print(f"⚙️  {len(linhas)} textos medidos", flush=True)
+        if max_textos and len(linhas) >= max_textos:
+            break
+    if not linhas:
+        raise SystemExit('Corpus sem nenhum texto rotulado')
+    X = np.array([linha[0] for linha in linhas])
+    y, prob_floresta, custo_saida, custo_seguir, custo_floresta = (np.array(coluna, dtype=float) for coluna in list(zip(*linhas))[1:])
+    return X, y.astype(int), prob_floresta, custo_saida, custo_seguir, custo_floresta
+
+
+def tabela(cascata, X, y, prob_floresta, custo_saida, custo_seguir):
+    """Uma linha por limiar: fração que sai cedo, acurácias e custo médio por texto"""
+    prob_rapida = cascata.probabilidades(X)
+    confianca = np.maximum(prob_rapida, 1 - prob_rapida)
+    acerto_rapido = (prob_rapida >= 0.5) == y
+    acerto_floresta = (prob_floresta >= 0.5) == y
+    linhas = []
+    for limiar in LIMIARES:
+        sai = confianca >= limiar
+        linhas.append({
+            'limiar': limiar,
+            'saida_antecipada': float(sai.mean()),
+            'acuracia_saidas': float(acerto_rapido[sai].mean()) if sai.any() else None,
+            'acuracia_cascata': float(np.where(sai, acerto_rapido, acerto_floresta).mean()),
+            'custo_medio_ms': float(np.where(sai, custo_saida, custo_seguir).mean() * 1000)
+        })
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibra o primeiro nível da cascata de detecção')
+    parser.add_argument('--corpus', required=True, help='JSONL ou CSV com campos text/texto e label/rotulo (1 = IA, 0 = humano)')
+    parser.add_argument('--modelo', default=CAMINHO_MODELO, help='artefato do modelo; a cascata é gravada ao lado')
+    parser.add_argument('--validacao', type=float, default=0.3, help='fração usada para escolher o limiar')
+    parser.add_argument('--perda-maxima', type=float, default=0.005, help='queda de acurácia aceita em relação à floresta')
+    parser.add_argument('--limiar-minimo', type=float, default=0.9,
+                        help='menor limiar aceito, para que só textos claros saiam cedo mesmo que a validação permita mais')
+    parser.add_argument('--max-textos', type=int, default=0, help='limita os textos lidos do corpus (0 = todos)')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--nao-salvar', action='store_true', help='só imprime a tabela')
+    args = parser.parse_args()
+
+    detector = AIDetectorComRelatorio(caminho_modelo=args.modelo)
+    if not detector.is_trained:
+        raise SystemExit('A cascata é calibrada contra a floresta: rode `python treinar.py` antes')
+    # A referência é o caminho completo, sem a cascata que já estiver gravada
+    detector.cascata = None
+
+    X, y, prob_floresta, custo_saida, custo_seguir, custo_floresta = medir_corpus(detector, args.corpus, args.max_textos)
+    treino, validacao = separar_validacao(len(y), args.validacao, args.semente)
+    if len(validacao) == 0 or len(set(y[treino].tolist())) < 2:
+        raise SystemExit('Corpus pequeno demais: é preciso das duas classes no treino e textos na validação')
+
+    media = X[treino].mean(axis=0)
+    escala = X[treino].std(axis=0)
+    escala[escala == 0] = 1.0
+    regressao = LogisticRegression(max_iter=1000).fit((X[treino] - media) / escala, y[treino])
+    cascata = Cascata(regressao.coef_[0], regressao.intercept_[0], media, escala, 1.0,
+                      detector.versao_modelo, detector.versao_lexico)
+
+    linhas = tabela(cascata, X[validacao], y[validacao], prob_floresta[validacao], custo_saida[validacao], custo_seguir[validacao])
+    acuracia_floresta = float(((prob_floresta[validacao] >= 0.5) == y[validacao]).mean())
+    custo_floresta_ms = float(custo_floresta[validacao].mean() * 1000)
+
+    print(f"\n🌲 Só a floresta: acurácia {acuracia_floresta:.4f}, {custo_floresta_ms:.3f} ms por texto ({len(validacao)} textos de validação)\n")
+    print(f"{'limiar':>7} {'sai cedo':>9} {'acc saídas':>11} {'acc cascata':>12} {'ms/texto':>9} {'economia':>9}")
+    for linha in linhas:
+        acuracia_saidas = f"{linha['acuracia_saidas']:.4f}" if linha['acuracia_saidas'] is not None else '-'
+        economia = 1 - linha['custo_medio_ms'] / custo_floresta_ms
+        print(f"{linha['limiar']:>7} {linha['saida_antecipada']:>8.1%} {acuracia_saidas:>11} "
+              f"{linha['acuracia_cascata']:>12.4f} {linha['custo_medio_ms']:>9.3f} {economia:>8.1%}")
+
+    aceitos = [linha for linha in linhas
+               if linha['limiar'] >= args.limiar_minimo and linha['acuracia_cascata'] >= acuracia_floresta - args.perda_maxima]
+    if not aceitos:
+        print(f"\n⚠️  Nenhum limiar fica dentro de {args.perda_maxima} da floresta; a cascata não é gravada")
+        raise SystemExit(1)
+    escolhido = aceitos[0]
+    cascata = Cascata(cascata.coeficientes, cascata.intercepto, media, escala, escolhido['limiar'],
+                      detector.versao_modelo, detector.versao_lexico)
+    print(f"\n🎯 Limiar {cascata.limiar}: {escolhido['saida_antecipada']:.1%} dos textos saem cedo, "
+          f"acurácia {escolhido['acuracia_cascata']:.4f}, {escolhido['custo_medio_ms']:.3f} ms por texto")
+
+    if not args.nao_salvar:
+        caminho = caminho_cascata(args.modelo)
+        cascata.salvar(caminho, {'calibracao': {
+            'corpus': args.corpus,
+            'textos': int(len(y)),
+            'validacao': int(len(validacao)),
+            'perda_maxima': args.perda_maxima,
+            'acuracia_floresta': acuracia_floresta,
+            'custo_floresta_ms': custo_floresta_ms,
+            'tabela': linhas
+        }})
+        print(f"💾 Cascata salva em {caminho}")
+
+
+if __name__ == '__main__':
+    main()
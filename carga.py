@@ -0,0 +1,390 @@
+"""Teste de carga do /api/detect, contra um servidor no ar ou contra gunicorns subidos aqui.
+
+Uso:
+    gunicorn app:app &
+    python carga.py --taxa 40 --duracao 20
+    python carga.py --servidor sync:2 --servidor gthread:1x32 --taxa 40 --longos 0.02 --json carga.json
+    python carga.py --servidor sync:4 --concorrencia 8 --corpus corpus.jsonl
+    python carga.py --servidor gthread:2x16 --comparar carga.json --limite 0.2
+
+Com --taxa (malha aberta), as requisições saem em horários fixos, estejam as
+anteriores respondidas ou não, e a latência conta a partir do horário previsto. Assim
+a fila que se forma quando o servidor não dá conta aparece nos percentis, em vez de
+desacelerar o próprio teste. Com --concorrencia (malha fechada), N clientes mandam
+a próxima requisição assim que recebem a anterior, e o resultado é a vazão máxima.
+
+Os textos variam em tamanho e em densidade de padrões; com --longos, uma fração
+leva textos grandes (--palavras-longos 400000 dá cerca de 3 MB), que seguram o
+worker e mostram o efeito na cauda das demais. Com --corpus, os textos de um
+arquivo (.txt com um texto por linha, ou JSONL com text/texto) são repetidos em ordem.
+
+Cada --servidor classe:workers[xthreads] sobe um gunicorn com gunicorn.conf.py em
+uma porta livre, espera o /health, roda a carga e derruba o servidor. Para cada
+configuração, imprime vazão, p50/p95/p99, taxa de erros e a memória (pico de RSS
+e PSS) de cada worker. Os caches ficam desligados, a menos que --env os ligue. Com
+--comparar, termina com código 1 se a vazão cair ou o p99 subir além de --limite
+em alguma configuração presente no arquivo.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from memoria import uso_memoria
+from textos_sinteticos import gerar_texto
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+# Tamanhos e densidades dos textos curtos, em proporção a --palavras
+MISTURA_CURTOS = ((0.2, 0.01), (0.2, 0.15), (1, 0.01), (1, 0.05), (1, 0.15), (3, 0.05))
+LIMITE_CURTO = 20000
+
+
+def corpos(args):
+    """Listas (curtos, longos) de corpos JSON já codificados"""
+    if args.corpus:
+        curtos, longos = [], []
+        for texto in ler_textos(args.corpus):
+            corpo = json.dumps({'text': texto}).encode('utf-8')
+            (longos if len(texto) > LIMITE_CURTO else curtos).append(corpo)
+        if not curtos and not longos:
+            raise SystemExit('Corpus sem nenhum texto')
+        return curtos, longos
+    curtos = [
+        json.dumps({'text': gerar_texto(max(5, int(args.palavras * escala)), densidade, s)}).encode('utf-8')
+        for s, (escala, densidade) in zip(range(32), itertools.cycle(MISTURA_CURTOS))
+    ]
+    longos = [json.dumps({'text': gerar_texto(args.palavras_longos, 0.1, 100 + s)}).encode('utf-8') for s in range(4)] \
+        if args.longos > 0 else []
+    return curtos, longos
+
+
+def ler_textos(caminho):
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            if caminho.endswith('.txt'):
+                yield linha.strip()
+                continue
+            registro = json.loads(linha)
+            texto = registro.get('text') or registro.get('texto')
+            if texto:
+                yield texto
+
+
+def enviar(conexao, partes, corpo, timeout):
+    """(status, conexão para reusar); status 'erro' se a conexão falhou"""
+    try:
+        if conexao is None:
+            conexao = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=timeout)
+        conexao.request('POST', partes.path or '/', body=corpo, headers={'Content-Type': 'application/json'})
+        resposta = conexao.getresponse()
+        resposta.read()
+        if resposta.getheader('Connection', '').lower() == 'close':
+            conexao.close()
+            conexao = None
+        return resposta.status, conexao
+    except (OSError, http.client.HTTPException):
+        if conexao is not None:
+            conexao.close()
+        return 'erro', None
+
+
+def cliente_aberto(url, fila, resultados, timeout):
+    partes = urlsplit(url)
+    conexao = None
+    while True:
+        item = fila.get()
+        if item is None:
+            return
+        previsto, corpo, longo = item
+        espera = previsto - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        status, conexao = enviar(conexao, partes, corpo, timeout)
+        resultados.append((longo, status, time.perf_counter() - previsto))
+
+
+def cliente_fechado(url, proximo, limite, resultados, timeout):
+    partes = urlsplit(url)
+    conexao = None
+    while time.perf_counter() < limite:
+        corpo, longo = proximo()
+        inicio = time.perf_counter()
+        status, conexao = enviar(conexao, partes, corpo, timeout)
+        resultados.append((longo, status, time.perf_counter() - inicio))
+
+
+def executar(args, url, curtos, longos):
+    resultados = []
+    aleatorio = np.random.RandomState(0)
+
+    def sortear(i):
+        longo = bool(longos) and (not curtos or aleatorio.random_sample() < args.longos)
+        return (longos[i % len(longos)], True) if longo else (curtos[i % len(curtos)], False)
+
+    if args.concorrencia:
+        contador = itertools.count()
+        lock = threading.Lock()
+
+        def proximo():
+            with lock:
+                return sortear(next(contador))
+
+        inicio = time.perf_counter()
+        threads = [
+            threading.Thread(target=cliente_fechado, args=(url, proximo, inicio + args.duracao, resultados, args.timeout), daemon=True)
+            for _ in range(args.concorrencia)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return resultados, time.perf_counter() - inicio
+
+    fila = queue.Queue()
+    threads = [
+        threading.Thread(target=cliente_aberto, args=(url, fila, resultados, args.timeout), daemon=True)
+        for _ in range(args.conexoes)
+    ]
+    for thread in threads:
+        thread.start()
+    total = int(args.taxa * args.duracao)
+    inicio = time.perf_counter() + 0.5
+    for i in range(total):
+        corpo, longo = sortear(i)
+        fila.put((inicio + i / args.taxa, corpo, longo))
+    for _ in threads:
+        fila.put(None)
+    for thread in threads:
+        thread.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def percentis(latencias):
+    if not len(latencias):
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    p50, p95, p99 = np.percentile(np.asarray(latencias) * 1000, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+
+def resumo(resultados, duracao):
+    """Vazão, taxa de erros e percentis, no total e separados por textos curtos e longos"""
+    dados = {
+        'duracao_s': round(duracao, 1),
+        'requisicoes': len(resultados),
+        'vazao_200': round(sum(1 for _, s, _ in resultados if s == 200) / duracao, 1),
+        'taxa_erros': round(sum(1 for _, s, _ in resultados if s != 200) / len(resultados), 4) if resultados else 0.0,
+        **percentis([latencia for _, _, latencia in resultados])
+    }
+    for nome, filtro in (('curtos', lambda longo: not longo), ('longos', lambda longo: longo)):
+        selecionados = [(status, latencia) for longo, status, latencia in resultados if filtro(longo)]
+        if not selecionados:
+            continue
+        status = {}
+        for s, _ in selecionados:
+            status[str(s)] = status.get(str(s), 0) + 1
+        dados[nome] = {
+            'requisicoes': len(selecionados),
+            'status': status,
+            **percentis([latencia for _, latencia in selecionados]),
+            'p99_200_ms': percentis([latencia for s, latencia in selecionados if s == 200])['p99_ms']
+        }
+    return dados
+
+
+def interpretar_servidor(texto):
+    """'gthread:2x16' -> ('gthread', 2, 16); 'sync:4' -> ('sync', 4, 1)"""
+    try:
+        classe, tamanho = texto.split(':')
+        workers, _, threads = tamanho.partition('x')
+        return classe, int(workers), int(threads or 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'configuração inválida: {texto!r} (use classe:workers ou classe:workersxthreads)')
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def pids_workers(pid_master):
+    """Processos filhos do master do gunicorn"""
+    pids = []
+    for entrada in os.listdir('/proc'):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entrada}/stat') as f:
+                # O nome do processo pode ter espaços; os campos seguintes vêm depois do ')'
+                campos = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(campos[1]) == pid_master:
+            pids.append(int(entrada))
+    return sorted(pids)
+
+
+def subir_servidor(config, args, log):
+    classe, workers, threads = config
+    porta = porta_livre()
+    ambiente = dict(os.environ)
+    # Textos repetidos cairiam no cache: a medida seria do cache, não do servidor
+    ambiente['CACHE_MAX_ITENS'] = '0'
+    for variavel in ('CACHE_SQLITE', 'DUPLICATAS_SQLITE', 'MODO_SERVIDOR', 'GUNICORN_CMD_ARGS'):
+        ambiente.pop(variavel, None)
+    ambiente['METRICAS_DIR'] = tempfile.mkdtemp(prefix='carga-metricas-')
+    comando = [sys.executable, '-m', 'gunicorn', 'app:app', '--config', os.path.join(DIRETORIO, 'gunicorn.conf.py'),
+               '--workers', str(workers), '--bind', f'127.0.0.1:{porta}', '--timeout', str(int(args.timeout) + 30)]
+    if classe == 'gthread':
+        # gunicorn.conf.py liga o pool limitado de análise junto com as threads
+        ambiente['MODO_SERVIDOR'] = 'gthread'
+        ambiente['GUNICORN_THREADS'] = str(threads)
+    else:
+        comando += ['--worker-class', classe, '--threads', str(threads)]
+    for par in args.env:
+        chave, _, valor = par.partition('=')
+        ambiente[chave] = valor
+
+    processo = subprocess.Popen(comando, cwd=DIRETORIO, env=ambiente, stdout=log, stderr=subprocess.STDOUT)
+    limite = time.perf_counter() + args.espera_servidor
+    while time.perf_counter() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f'gunicorn terminou com código {processo.returncode} (log em {log.name})')
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=5)
+            conexao.request('GET', '/health')
+            pronto = conexao.getresponse().status == 200
+            conexao.close()
+            if pronto and len(pids_workers(processo.pid)) >= workers:
+                return processo, f'http://127.0.0.1:{porta}/api/detect'
+        except OSError:
+            pass
+        time.sleep(0.2)
+    derrubar_servidor(processo)
+    raise RuntimeError(f'gunicorn não respondeu em {args.espera_servidor} s (log em {log.name})')
+
+
+def derrubar_servidor(processo):
+    processo.send_signal(signal.SIGTERM)
+    try:
+        processo.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        processo.kill()
+        processo.wait()
+
+
+def medir_configuracao(config, args, curtos, longos):
+    nome = f'{config[0]}:{config[1]}' + (f'x{config[2]}' if config[2] > 1 else '')
+    with tempfile.NamedTemporaryFile('w', prefix='carga-gunicorn-', suffix='.log', delete=False) as log:
+        print(f"🚀 {nome}: subindo gunicorn (log em {log.name})", flush=True)
+        processo, url = subir_servidor(config, args, log)
+        try:
+            iniciais = pids_workers(processo.pid)
+            resultados, duracao = executar(args, url, curtos, longos)
+            workers = pids_workers(processo.pid)
+            # O pico de RSS de cada worker sai do /proc antes de derrubar o servidor
+            memoria = {
+                'master': uso_memoria(processo.pid),
+                'workers': [uso_memoria(pid) for pid in workers],
+                'workers_reiniciados': len(set(iniciais) - set(workers))
+            }
+        finally:
+            derrubar_servidor(processo)
+    return nome, {**resumo(resultados, duracao), 'memoria': memoria}
+
+
+def imprimir(dados):
+    print(f"\n{'configuração':<16} {'req':>6} {'200/s':>8} {'erros':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'RSS máx/worker MB':>18} {'PSS total MB':>13}")
+    for nome, linha in dados.items():
+        memoria = linha.get('memoria')
+        rss = f"{max(w.get('rss_max_mb', 0) for w in memoria['workers']):.1f}" if memoria and memoria['workers'] else '-'
+        pss = f"{sum(w.get('pss_mb', 0) for w in [memoria['master'], *memoria['workers']]):.1f}" if memoria else '-'
+        print(f"{nome:<16} {linha['requisicoes']:>6} {linha['vazao_200']:>8.1f} {linha['taxa_erros']:>6.1%} "
+              f"{linha['p50_ms'] or 0:>9.1f} {linha['p95_ms'] or 0:>9.1f} {linha['p99_ms'] or 0:>9.1f} {rss:>18} {pss:>13}")
+        for classe in ('curtos', 'longos'):
+            if classe in linha:
+                parte = linha[classe]
+                status = ' '.join(f'{s}={n}' for s, n in sorted(parte['status'].items()))
+                print(f"   {classe:<7} {status:<28} p50={parte['p50_ms']:>8.1f} ms  p99={parte['p99_ms']:>8.1f} ms  "
+                      f"p99(200)={parte['p99_200_ms'] if parte['p99_200_ms'] is not None else '-'} ms")
+
+
+def comparar(atual, anterior, limite):
+    """Configurações em que a vazão caiu ou o p99 subiu mais que `limite`"""
+    regressoes = []
+    for nome, linha in atual.items():
+        base = anterior.get(nome)
+        if not base:
+            continue
+        if base['vazao_200'] and linha['vazao_200'] < base['vazao_200'] * (1 - limite):
+            regressoes.append((nome, 'vazao_200', base['vazao_200'], linha['vazao_200']))
+        if base.get('p99_ms') and linha.get('p99_ms') and linha['p99_ms'] > base['p99_ms'] * (1 + limite):
+            regressoes.append((nome, 'p99_ms', base['p99_ms'], linha['p99_ms']))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga contra /api/detect')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/api/detect', help='servidor já no ar (sem --servidor)')
+    parser.add_argument('--servidor', action='append', type=interpretar_servidor, default=[],
+                        help='sobe um gunicorn classe:workers[xthreads], ex.: sync:4 ou gthread:2x16 (repetível)')
+    parser.add_argument('--env', action='append', default=[], help='CHAVE=VALOR no ambiente dos servidores (repetível)')
+    parser.add_argument('--taxa', type=float, default=20, help='requisições por segundo (malha aberta)')
+    parser.add_argument('--concorrencia', type=int, default=0, help='clientes em malha fechada; substitui --taxa')
+    parser.add_argument('--duracao', type=float, default=15, help='segundos')
+    parser.add_argument('--conexoes', type=int, default=64, help='conexões simultâneas do cliente em malha aberta')
+    parser.add_argument('--corpus', help='textos a repetir, no lugar dos gerados')
+    parser.add_argument('--palavras', type=int, default=300)
+    parser.add_argument('--longos', type=float, default=0.0, help='fração de requisições com texto longo')
+    parser.add_argument('--palavras-longos', type=int, default=100000)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--espera-servidor', type=float, default=120, help='segundos para o gunicorn ficar pronto')
+    parser.add_argument('--json', help='grava o resumo neste arquivo')
+    parser.add_argument('--comparar', help='resumo JSON anterior; termina com erro em regressão')
+    parser.add_argument('--limite', type=float, default=0.2, help='piora aceita em vazão e p99 com --comparar')
+    args = parser.parse_args()
+
+    curtos, longos = corpos(args)
+    if args.servidor:
+        dados = {}
+        for config in args.servidor:
+            try:
+                nome, linha = medir_configuracao(config, args, curtos, longos)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                continue
+            dados[nome] = linha
+    else:
+        resultados, duracao = executar(args, args.url, curtos, longos)
+        dados = {args.url: resumo(resultados, duracao)}
+    imprimir(dados)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dados, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            regressoes = comparar(dados, json.load(f), args.limite)
+        for nome, medida, antes, depois in regressoes:
+            print(f"❌ {nome}: {medida} foi de {antes} para {depois}")
+        if regressoes:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
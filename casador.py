@@ -0,0 +1,78 @@
+import re
+
+_CARACTERE_PALAVRA = re.compile(r'\w')
+
+
+def eh_caractere_palavra(texto, i):
+    """Equivalente a testar se texto[i] casa com \\w (fora do texto é falso)"""
+    return 0 <= i < len(texto) and _CARACTERE_PALAVRA.match(texto, i) is not None
+
+
+def _montar_trie(frases):
+    raiz = {}
+    for frase in frases:
+        no = raiz
+        for ch in frase:
+            no = no.setdefault(ch, {})
+        no[''] = True
+    return raiz
+
+
+def _trie_para_regex(no):
+    # Os ramos vêm antes do fim opcional: o regex sempre prefere a frase mais longa
+    ramos = [re.escape(ch) + _trie_para_regex(filho)
+             for ch, filho in sorted(no.items()) if ch]
+    terminal = '' in no
+    if not ramos:
+        return ''
+    if len(ramos) == 1 and not terminal:
+        return ramos[0]
+    corpo = '(?:' + '|'.join(ramos) + ')'
+    return corpo + '?' if terminal else corpo
+
+
+class CasadorPadroes:
+    """Encontra todas as frases do léxico, de todas as categorias, em uma única varredura.
+
+    As frases são compiladas em um único regex em forma de trie, então o custo por
+    posição depende do comprimento das frases e não da quantidade delas. Um lookahead
+    permite sobreposições entre posições diferentes; frases que são prefixo da frase
+    mais longa encontrada na mesma posição são recuperadas por uma tabela pré-calculada.
+    Ocorrências de um mesmo padrão não se sobrepõem, como em re.finditer por padrão.
+    """
+
+    def __init__(self, padroes, categorias_com_fronteira=()):
+        # padroes: {categoria: [frase, ...]} com frases literais em minúsculas
+        self.categorias_com_fronteira = frozenset(categorias_com_fronteira)
+        self.origens = {}
+        for categoria, frases in padroes.items():
+            for indice, frase in enumerate(frases):
+                self.origens.setdefault(frase, []).append((categoria, indice))
+
+        frases = list(self.origens)
+        self.prefixos = {
+            frase: [outra for outra in frases if outra != frase and frase.startswith(outra)]
+            for frase in frases
+        }
+        self.regex = re.compile('(?=(' + _trie_para_regex(_montar_trie(frases)) + '))') if frases else None
+
+    def encontrar(self, texto_lower):
+        """Gera (inicio, fim, categoria, indice_padrao) para cada ocorrência, em ordem de posição"""
+        if self.regex is None:
+            return
+        # Fim da última ocorrência aceita de cada (categoria, indice)
+        ultimo_fim = {}
+        for match in self.regex.finditer(texto_lower):
+            inicio = match.start()
+            mais_longa = match.group(1)
+            inicio_fronteira = not eh_caractere_palavra(texto_lower, inicio - 1)
+            for frase in [mais_longa] + self.prefixos[mais_longa]:
+                fim = inicio + len(frase)
+                fim_fronteira = not eh_caractere_palavra(texto_lower, fim)
+                for categoria, indice in self.origens[frase]:
+                    if categoria in self.categorias_com_fronteira and not (inicio_fronteira and fim_fronteira):
+                        continue
+                    if ultimo_fim.get((categoria, indice), 0) > inicio:
+                        continue
+                    ultimo_fim[categoria, indice] = fim
+                    yield inicio, fim, categoria, indice
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+NOMES_FEATURES_RAPIDAS = ('log_comprimento', 'densidade_termos', 'formais', 'informais', 'formalidade')
+
+
+def caminho_cascata(caminho_modelo):
+    return os.path.splitext(caminho_modelo)[0] + '.cascata.json'
+
+
+def features_rapidas(detector, texto, contexto, n_ocorrencias):
+    """Features do primeiro nível: só o que sai da varredura de padrões e de buscas por substring.
+
+    Não tokeniza nem amostra o texto; `n_ocorrencias` vem da varredura do casador, que
+    o relatório reaproveita se o texto sair cedo.
+    """
+    palavras = len(contexto.palavras_espaco)
+    texto_lower = contexto.texto_lower
+    lexico = detector.lexico_de(contexto)
+    formais = sum(1 for p in lexico.palavras_formais if p in texto_lower)
+    informais = sum(1 for p in lexico.palavras_informais if p in texto_lower)
+    return np.array([
+        math.log1p(len(texto)),
+        n_ocorrencias / palavras if palavras else 0.0,
+        formais,
+        informais,
+        (formais - informais) / palavras if palavras else 0.0
+    ], dtype=float)
+
+
+class Cascata:
+    """Primeiro nível da detecção: regressão logística sobre features_rapidas.
+
+    Quando a confiança (a maior das duas probabilidades) passa de `limiar`, o texto
+    sai com essa probabilidade, sem features completas nem floresta. Os demais seguem
+    o caminho normal. Coeficientes e limiar vêm de `python calibrar_cascata.py`, que
+    escolhe o limiar pela perda de acurácia aceita em um corpus rotulado.
+    """
+
+    def __init__(self, coeficientes, intercepto, media, escala, limiar, versao_modelo=None, versao_lexico=None):
+        self.coeficientes = np.asarray(coeficientes, dtype=float)
+        self.intercepto = float(intercepto)
+        self.media = np.asarray(media, dtype=float)
+        self.escala = np.asarray(escala, dtype=float)
+        self.limiar = float(limiar)
+        self.versao_modelo = versao_modelo
+        self.versao_lexico = versao_lexico
+        self.versao = hashlib.sha256(json.dumps(self.parametros(), sort_keys=True).encode('utf-8')).hexdigest()[:8]
+
+    def parametros(self):
+        return {
+            'features': list(NOMES_FEATURES_RAPIDAS),
+            'coeficientes': self.coeficientes.tolist(),
+            'intercepto': self.intercepto,
+            'media': self.media.tolist(),
+            'escala': self.escala.tolist(),
+            'limiar': self.limiar,
+            'versao_modelo': self.versao_modelo,
+            'versao_lexico': self.versao_lexico
+        }
+
+    def probabilidades(self, X):
+        """Probabilidade de IA para cada linha de features_rapidas"""
+        z = ((np.atleast_2d(X) - self.media) / self.escala) @ self.coeficientes + self.intercepto
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def decidir(self, x):
+        """(prob_ia, confianca) se o primeiro nível basta para este texto, senão None"""
+        prob_ia = float(self.probabilidades(x)[0])
+        confianca = max(prob_ia, 1.0 - prob_ia)
+        return (prob_ia, confianca) if confianca >= self.limiar else None
+
+    def salvar(self, caminho, metadados=None):
+        temporario = f'{caminho}.tmp-{os.getpid()}'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({**self.parametros(), **(metadados or {})}, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho, limiar=None):
+        """Cascata calibrada em `caminho`, ou None se não houver; `limiar` sobrescreve o calibrado"""
+        try:
+            with open(caminho, encoding='utf-8') as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            return None
+        if dados.get('features') != list(NOMES_FEATURES_RAPIDAS):
+            raise ValueError('features da cascata diferentes das desta versão')
+        return cls(dados['coeficientes'], dados['intercepto'], dados['media'], dados['escala'],
+                   dados['limiar'] if limiar is None else limiar,
+                   dados.get('versao_modelo'), dados.get('versao_lexico'))
@@ -0,0 +1,149 @@
+"""Constrói as tabelas de frequência de unigramas e bigramas usadas nas features de n-gramas.
+
+Uso:
+    python construir_ngramas.py --corpus textos_pt.txt --saida ngramas/
+    python construir_ngramas.py --corpus corpus.jsonl --saida ngramas/ --min-contagem 2 --jobs 8
+
+O corpus (um texto por linha em .txt, ou JSONL/CSV com o campo text/texto, rótulo
+opcional) é lido em streaming, tokenizado como no app e contado em blocos; cada
+bloco vira chaves ordenadas que são mescladas às acumuladas, então a memória depende
+do vocabulário e não do tamanho do corpus. As tabelas são gravadas em um diretório
+temporário e trocadas de uma vez. Depois, treine com `NGRAMAS_DIR=ngramas/ python
+treinar.py --corpus ...` e sirva com a mesma NGRAMAS_DIR.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from analise import ContextoAnalise
+from ngramas import ARQUIVOS, chaves_bigramas, palavras_por_frase
+from treinar import CAMPOS_TEXTO, _em_blocos
+
+
+def ler_textos(caminho):
+    """Gera os textos de um .txt (um por linha), JSONL ou CSV sem carregá-lo inteiro"""
+    if caminho.endswith('.csv'):
+        csv.field_size_limit(sys.maxsize)
+        with open(caminho, newline='', encoding='utf-8') as f:
+            for registro in csv.DictReader(f):
+                texto = next((registro[c] for c in CAMPOS_TEXTO if registro.get(c)), None)
+                if texto:
+                    yield texto
+    elif caminho.endswith(('.jsonl', '.json')):
+        with open(caminho, encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    registro = json.loads(linha)
+                    texto = next((registro[c] for c in CAMPOS_TEXTO if registro.get(c)), None)
+                    if texto:
+                        yield texto
+    else:
+        with open(caminho, encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    yield linha
+
+
+def _contar_unicos(chaves):
+    chaves, contagens = np.unique(chaves, return_counts=True)
+    return chaves, contagens.astype(np.int64)
+
+
+def contar_bloco(textos):
+    """(chaves, contagens) de unigramas e de bigramas de um bloco de textos"""
+    unigramas, bigramas = [], []
+    for texto in textos:
+        hashes, frases = palavras_por_frase(ContextoAnalise(texto))
+        unigramas.append(hashes)
+        # Como nas features, bigramas não atravessam frases
+        mesma_frase = frases[1:] == frases[:-1]
+        bigramas.append(chaves_bigramas(hashes[:-1][mesma_frase], hashes[1:][mesma_frase]))
+    vazio = np.zeros(0, dtype=np.uint64)
+    return (_contar_unicos(np.concatenate(unigramas or [vazio])),
+            _contar_unicos(np.concatenate(bigramas or [vazio])))
+
+
+def mesclar(acumulado, bloco):
+    """Soma duas tabelas (chaves ordenadas, contagens) em uma"""
+    chaves = np.concatenate([acumulado[0], bloco[0]])
+    contagens = np.concatenate([acumulado[1], bloco[1]])
+    unicas, inverso = np.unique(chaves, return_inverse=True)
+    return unicas, np.bincount(inverso, weights=contagens, minlength=len(unicas)).astype(np.int64)
+
+
+def podar(tabela, min_contagem):
+    chaves, contagens = tabela
+    manter = contagens >= min_contagem
+    return chaves[manter], np.minimum(contagens[manter], np.iinfo(np.uint32).max).astype(np.uint32)
+
+
+def salvar_tabelas(diretorio, tabelas, metadados):
+    """Grava os arrays e o ngramas.json em um diretório temporário e o troca pelo destino"""
+    temporario = f'{diretorio.rstrip(os.sep)}.tmp-{os.getpid()}'
+    shutil.rmtree(temporario, ignore_errors=True)
+    os.makedirs(temporario)
+    h = hashlib.sha256()
+    for nome, array in zip(ARQUIVOS, tabelas):
+        np.save(os.path.join(temporario, f'{nome}.npy'), array)
+        h.update(array.tobytes())
+    metadados = {'versao': h.hexdigest()[:16], **metadados}
+    with open(os.path.join(temporario, 'ngramas.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadados, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(diretorio, ignore_errors=True)
+    os.replace(temporario, diretorio)
+    return metadados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Constrói as tabelas de n-gramas a partir de um corpus local')
+    parser.add_argument('--corpus', required=True, help='.txt (um texto por linha), JSONL ou CSV com campo text/texto')
+    parser.add_argument('--saida', default='ngramas', help='diretório das tabelas (NGRAMAS_DIR)')
+    parser.add_argument('--idioma', default='pt', help='idioma do corpus; textos de outros idiomas recebem features neutras')
+    parser.add_argument('--min-contagem', type=int, default=1, help='descarta unigramas e bigramas mais raros que isto')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--bloco', type=int, default=20000, help='textos contados por vez')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    vazio = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
+    unigramas, bigramas = vazio, vazio
+    textos = 0
+    tamanho_tarefa = max(1, args.bloco // (args.jobs * 4))
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for bloco in _em_blocos(ler_textos(args.corpus), args.bloco):
+            for bloco_unigramas, bloco_bigramas in pool.map(contar_bloco, list(_em_blocos(bloco, tamanho_tarefa))):
+                unigramas = mesclar(unigramas, bloco_unigramas)
+                bigramas = mesclar(bigramas, bloco_bigramas)
+            textos += len(bloco)
+            print(f"⚙️  {textos} textos, {len(unigramas[0])} unigramas, {len(bigramas[0])} bigramas "
+                  f"({textos / (time.perf_counter() - inicio):.0f}/s)", flush=True)
+    if not textos:
+        raise SystemExit('Corpus sem nenhum texto')
+
+    total_unigramas = int(unigramas[1].sum())
+    unigramas = podar(unigramas, args.min_contagem)
+    bigramas = podar(bigramas, args.min_contagem)
+    meta = salvar_tabelas(args.saida, (*unigramas, *bigramas), {
+        'corpus': os.path.abspath(args.corpus),
+        'idioma': args.idioma,
+        'textos': textos,
+        'total_unigramas': total_unigramas,
+        'min_contagem': args.min_contagem,
+        'criado_em': datetime.now(timezone.utc).isoformat(timespec='seconds')
+    })
+    tamanho = sum(os.path.getsize(os.path.join(args.saida, f'{nome}.npy')) for nome in ARQUIVOS)
+    print(f"💾 Tabelas {meta['versao']} salvas em {args.saida}: {len(unigramas[0])} unigramas, "
+          f"{len(bigramas[0])} bigramas, {tamanho / 2**20:.1f} MB ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
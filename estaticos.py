@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response
+
+from formato_resposta import brotli
+
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+# A página não tem versão no endereço: o navegador sempre revalida, e recebe 304 se nada mudou
+CACHE_REVALIDAR = 'no-cache'
+REGEX_REFERENCIA = re.compile(r'\{\{\s*([\w.-]+)\s*\}\}')
+PAGINAS = ('index.html',)
+
+
+class Ativo:
+    """Conteúdo de um arquivo estático, já comprimido em cada codificação aceita"""
+
+    def __init__(self, conteudo, mimetype):
+        self.mimetype = mimetype
+        self.hash = hashlib.sha256(conteudo).hexdigest()[:16]
+        self.corpos = {'identity': conteudo, 'gzip': gzip.compress(conteudo, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.corpos['br'] = brotli.compress(conteudo, quality=11)
+        # Compressão que não diminui o arquivo só custaria a descompressão no cliente
+        for codificacao in [c for c in self.corpos if len(self.corpos[c]) >= len(conteudo)]:
+            if codificacao != 'identity':
+                del self.corpos[codificacao]
+
+    def etag(self, codificacao):
+        # ETag forte: cada codificação é uma representação diferente, com bytes diferentes
+        return self.hash if codificacao == 'identity' else f'{self.hash}-{codificacao}'
+
+
+class AtivosEstaticos:
+    """Interface web servida a partir de `diretorio`, comprimida uma vez na carga.
+
+    Cada arquivo ganha um endereço com o hash do conteúdo (app.js vira
+    /static/app.<hash>.js), servido com cache imutável de um ano: um deploy que muda o
+    arquivo muda o endereço. As páginas (index.html) trocam as referências {{ app.js }}
+    por esses endereços e são revalidadas a cada acesso. Tudo responde a If-None-Match
+    com 304 e sai em brotli ou gzip pré-comprimidos, conforme o Accept-Encoding.
+    """
+
+    def __init__(self, diretorio, prefixo='/static/'):
+        self.diretorio = diretorio
+        self.prefixo = prefixo
+        self.ativos = {}
+        self.enderecos = {}
+        for nome in sorted(os.listdir(diretorio)):
+            caminho = os.path.join(diretorio, nome)
+            if nome in PAGINAS or not os.path.isfile(caminho):
+                continue
+            with open(caminho, 'rb') as f:
+                ativo = Ativo(f.read(), mimetypes.guess_type(nome)[0] or 'application/octet-stream')
+            base, extensao = os.path.splitext(nome)
+            versionado = f'{base}.{ativo.hash[:10]}{extensao}'
+            self.ativos[versionado] = ativo
+            self.enderecos[nome] = prefixo + versionado
+        self.paginas = {}
+        for nome in PAGINAS:
+            with open(os.path.join(diretorio, nome), encoding='utf-8') as f:
+                html = REGEX_REFERENCIA.sub(lambda m: self.enderecos[m.group(1)], f.read())
+            self.paginas[nome] = Ativo(html.encode('utf-8'), 'text/html')
+
+    def pagina(self, requisicao, nome='index.html'):
+        return responder_ativo(requisicao, self.paginas[nome], CACHE_REVALIDAR)
+
+    def arquivo(self, requisicao, nome):
+        """Resposta de um arquivo versionado, ou None se o nome não existe"""
+        ativo = self.ativos.get(nome)
+        return responder_ativo(requisicao, ativo, CACHE_IMUTAVEL) if ativo is not None else None
+
+    def estatisticas(self):
+        return {
+            nome: {codificacao: len(corpo) for codificacao, corpo in self.ativos[endereco[len(self.prefixo):]].corpos.items()}
+            for nome, endereco in self.enderecos.items()
+        }
+
+
+def responder_ativo(requisicao, ativo, cache_control):
+    codificacao = requisicao.accept_encodings.best_match([c for c in ('br', 'gzip') if c in ativo.corpos]) or 'identity'
+    etags = [ativo.etag(c) for c in ativo.corpos]
+    # If-None-Match usa comparação fraca: qualquer codificação do mesmo conteúdo vale
+    if requisicao.if_none_match and any(requisicao.if_none_match.contains_weak(etag) for etag in etags):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(ativo.corpos[codificacao], mimetype=ativo.mimetype)
+        if codificacao != 'identity':
+            resposta.headers['Content-Encoding'] = codificacao
+    resposta.set_etag(ativo.etag(codificacao))
+    resposta.headers['Cache-Control'] = cache_control
+    resposta.vary.add('Accept-Encoding')
+    return resposta
@@ -0,0 +1,142 @@
+import json
+import os
+
+import numpy as np
+
+
+class FlorestaCompilada:
+    """Inferência de uma RandomForestClassifier treinada usando apenas arrays NumPy.
+
+    As árvores são exportadas uma vez para vetores planos (feature, threshold, filhos
+    e probabilidades das folhas) e percorridas nível a nível para todas as linhas e
+    árvores ao mesmo tempo, sem a validação e o despacho por árvore do sklearn.
+    O resultado é o mesmo de modelo.predict_proba: X é convertido para float32 como
+    o sklearn faz, e as árvores são somadas na mesma ordem antes da média.
+    """
+
+    def __init__(self, modelo):
+        if getattr(modelo, 'n_outputs_', 1) != 1:
+            raise ValueError('Apenas florestas com uma única saída são suportadas')
+
+        arvores = [estimador.tree_ for estimador in modelo.estimators_]
+        n_classes = len(modelo.classes_)
+
+        features, thresholds, esquerdas, direitas, valores, raizes = [], [], [], [], [], []
+        deslocamento = 0
+        for arvore in arvores:
+            n_nos = arvore.node_count
+            indices = np.arange(deslocamento, deslocamento + n_nos, dtype=np.int64)
+            folha = arvore.children_left == -1
+
+            # Folhas apontam para si mesmas: depois de alcançadas, o percurso fica parado nelas
+            esquerda = np.where(folha, indices, arvore.children_left + deslocamento)
+            direita = np.where(folha, indices, arvore.children_right + deslocamento)
+            feature = np.where(folha, 0, arvore.feature)
+            threshold = np.where(folha, 0.0, arvore.threshold)
+
+            valor = arvore.value[:, 0, :n_classes].astype(np.float64)
+            normalizador = valor.sum(axis=1, keepdims=True)
+            normalizador[normalizador == 0.0] = 1.0
+
+            raizes.append(deslocamento)
+            features.append(feature)
+            thresholds.append(threshold)
+            esquerdas.append(esquerda)
+            direitas.append(direita)
+            valores.append(valor / normalizador)
+            deslocamento += n_nos
+
+        self.feature = np.ascontiguousarray(np.concatenate(features), dtype=np.int64)
+        self.threshold = np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64)
+        self.esquerda = np.ascontiguousarray(np.concatenate(esquerdas), dtype=np.int64)
+        self.direita = np.ascontiguousarray(np.concatenate(direitas), dtype=np.int64)
+        self.valores = np.ascontiguousarray(np.concatenate(valores), dtype=np.float64)
+        self.raizes = np.asarray(raizes, dtype=np.int64)
+        self.profundidade = max(arvore.max_depth for arvore in arvores)
+        self.classes_ = modelo.classes_
+        self.n_features_in_ = modelo.n_features_in_
+
+    ARRAYS = ('feature', 'threshold', 'esquerda', 'direita', 'valores', 'raizes', 'classes_')
+
+    def salvar(self, diretorio):
+        os.makedirs(diretorio, exist_ok=True)
+        for nome in self.ARRAYS:
+            np.save(os.path.join(diretorio, f'{nome}.npy'), getattr(self, nome))
+        with open(os.path.join(diretorio, 'floresta.json'), 'w') as f:
+            json.dump({'profundidade': int(self.profundidade), 'n_features_in_': int(self.n_features_in_)}, f)
+
+    @classmethod
+    def carregar(cls, diretorio, mmap_mode='r'):
+        """Abre uma floresta salva; com mmap os workers compartilham as páginas pelo cache do SO"""
+        floresta = cls.__new__(cls)
+        for nome in cls.ARRAYS:
+            setattr(floresta, nome, np.load(os.path.join(diretorio, f'{nome}.npy'), mmap_mode=mmap_mode))
+        with open(os.path.join(diretorio, 'floresta.json')) as f:
+            escalares = json.load(f)
+        floresta.profundidade = escalares['profundidade']
+        floresta.n_features_in_ = escalares['n_features_in_']
+        return floresta
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f'Esperadas {self.n_features_in_} features, recebidas {X.shape[1]}')
+
+        n_linhas = X.shape[0]
+        X_plano = np.ascontiguousarray(X).ravel()
+        base = (np.arange(n_linhas) * self.n_features_in_)[:, np.newaxis]
+        nos = np.repeat(self.raizes[np.newaxis, :], n_linhas, axis=0)
+        for _ in range(self.profundidade):
+            vai_esquerda = X_plano[base + self.feature[nos]] <= self.threshold[nos]
+            nos = np.where(vai_esquerda, self.esquerda[nos], self.direita[nos])
+
+        folhas = self.valores[nos]
+        proba = np.zeros((n_linhas, folhas.shape[2]), dtype=np.float64)
+        for i in range(folhas.shape[1]):
+            proba += folhas[:, i, :]
+        return proba / folhas.shape[1]
+
+
+def verificar_paridade(modelo, floresta, X):
+    """Confere se a floresta compilada reproduz modelo.predict_proba para as linhas de X"""
+    return np.array_equal(floresta.predict_proba(X), modelo.predict_proba(np.asarray(X, dtype=np.float64)))
+
+
+def amostras_de_paridade(floresta, n=256, semente=0):
+    """Linhas sintéticas que cruzam os thresholds do modelo, para a checagem de paridade"""
+    gerador = np.random.default_rng(semente)
+    internos = floresta.esquerda != np.arange(len(floresta.esquerda))
+    X = gerador.normal(size=(n, floresta.n_features_in_)) * 10
+    for coluna in range(floresta.n_features_in_):
+        limites = floresta.threshold[internos & (floresta.feature == coluna)]
+        if len(limites):
+            X[:, coluna] = gerador.choice(limites, size=n) + gerador.choice([-1e-3, 0.0, 1e-3], size=n)
+    return X
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    import joblib
+
+    caminho = sys.argv[1] if len(sys.argv) > 1 else 'modelo_web.pkl'
+    modelo = joblib.load(caminho)
+    floresta = FlorestaCompilada(modelo)
+    X = amostras_de_paridade(floresta, n=2048)
+
+    print(f"Paridade com predict_proba: {'ok' if verificar_paridade(modelo, floresta, X) else 'FALHOU'}")
+
+    def medir(funcao, repeticoes):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        return (time.perf_counter() - inicio) / repeticoes
+
+    for n in (1, 32, 1024):
+        lote = X[:n]
+        sk = medir(lambda: modelo.predict_proba(lote), 50)
+        np_ = medir(lambda: floresta.predict_proba(lote), 50)
+        print(f"{n:>5} linhas: sklearn {sk * 1e3:8.3f} ms | compilada {np_ * 1e3:8.3f} ms | {sk / np_:6.1f}x")
@@ -0,0 +1,79 @@
+import gzip
+import json
+
+try:
+    import msgpack
+except ImportError:  # opcional: sem ele, só JSON
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele, só gzip
+    brotli = None
+
+TIPOS_MSGPACK = ('application/msgpack', 'application/x-msgpack')
+TIPOS_COMPRIMIVEIS = {'application/json', 'application/msgpack', 'application/x-msgpack', 'text/html', 'text/plain'}
+NIVEL_GZIP = 6
+# Qualidades altas do brotli comprimem pouco mais e custam dezenas de vezes o tempo
+QUALIDADE_BROTLI = 4
+
+
+def dicionario_tipos(detector):
+    """Tipos de termo em ordem fixa; no formato compacto cada termo traz só o índice do seu tipo"""
+    # As regras são as mesmas em todos os idiomas; só as listas de padrões mudam por léxico
+    regras = list(detector.regras_padroes.values())
+    return {
+        'nome': [regra['tipo'] for regra in regras],
+        'justificativa': [regra['justificativa'] for regra in regras],
+        'margem_contexto': [regra['margem_contexto'] for regra in regras]
+    }
+
+
+def compactar_resultado(resultado, indice_tipos):
+    """Converte um resultado do predict para o formato compacto.
+
+    Os termos viram colunas de posições e índices de tipo (`indice_tipos` mapeia o nome
+    do tipo para a posição em dicionario_tipos). `contexto`, o texto do termo e
+    `texto_destacado` saem da resposta: o cliente os reconstrói a partir do texto que
+    enviou, das posições e das margens do dicionário.
+    """
+    compacto = {
+        chave: valor for chave, valor in resultado.items()
+        if chave not in ('termos_suspeitos', 'texto_destacado', 'frases', 'paragrafos')
+    }
+    termos = resultado.get('termos_suspeitos', [])
+    compacto['termos'] = {
+        'inicio': [termo['posicao'][0] for termo in termos],
+        'fim': [termo['posicao'][1] for termo in termos],
+        'tipo': [indice_tipos[termo['tipo']] for termo in termos]
+    }
+    for chave in ('frases', 'paragrafos'):
+        if chave in resultado:
+            trechos = resultado[chave]
+            compacto[chave] = {
+                'inicio': [trecho['inicio'] for trecho in trechos],
+                'fim': [trecho['fim'] for trecho in trechos],
+                'ai_probability': [trecho['ai_probability'] for trecho in trechos]
+            }
+    return compacto
+
+
+def serializar(dados, mimetype):
+    if mimetype in TIPOS_MSGPACK:
+        return msgpack.packb(dados, use_bin_type=True)
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def tipos_aceitos():
+    """Mimetypes de resposta disponíveis, em ordem de preferência do servidor"""
+    return ['application/json'] + (list(TIPOS_MSGPACK) if msgpack is not None else [])
+
+
+def codificacoes_aceitas():
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def comprimir(dados, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=QUALIDADE_BROTLI)
+    return gzip.compress(dados, compresslevel=NIVEL_GZIP, mtime=0)
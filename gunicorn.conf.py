@@ -0,0 +1,45 @@
+import gc
+import os
+import shutil
+import tempfile
+import time
+
+from memoria import uso_memoria
+
+# Carrega o app (e o modelo) uma vez no master; os workers herdam as páginas por copy-on-write
+preload_app = os.environ.get('PRELOAD_MODELO', '1') == '1'
+os.environ['PRELOAD_MODELO'] = '1' if preload_app else '0'
+
+# Cada worker grava suas métricas aqui; /metrics soma todas (o diretório é limpo ao subir o master)
+os.environ.setdefault('METRICAS_DIR', os.path.join(tempfile.gettempdir(), 'detector-ia-metricas'))
+
+# MODO_SERVIDOR=gthread: cada worker recebe as conexões em várias threads, e a análise roda
+# em um pool limitado, com fila e prazo (ver admissao.py); sobrecarga vira 429 em vez de fila sem fim
+if os.environ.get('MODO_SERVIDOR') == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 64))
+    # Sem folga de threads além do pool e da fila, a espera ficaria no gunicorn, antes da admissão
+    worker_connections = threads
+    os.environ.setdefault('ANALISE_THREADS', '2')
+    os.environ.setdefault('ANALISE_FILA_MAX', str(max(1, threads // 2)))
+
+_inicio = time.perf_counter()
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['METRICAS_DIR'], ignore_errors=True)
+
+
+def when_ready(server):
+    server.log.info(f"Master pronto em {time.perf_counter() - _inicio:.2f} s (preload={preload_app}) memória={uso_memoria()}")
+
+
+def pre_fork(server, worker):
+    # Objetos já criados saem da coleta de lixo, que senão tocaria nas páginas compartilhadas
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from app import detector
+    detector.carregar_modelo()
+    worker.log.info(f"Worker {worker.pid} pronto em {time.perf_counter() - _inicio:.2f} s memória={uso_memoria()}")
@@ -0,0 +1,14 @@
+import numpy as np
+
+
+def misturar(x):
+    """Finalizador do splitmix64 sobre um array uint64: espalha os bits de cada valor.
+
+    Usado nas assinaturas MinHash (os bits altos escolhem o balde) e nas chaves de
+    bigramas das tabelas de n-gramas; mudar a função invalida as tabelas já construídas.
+    """
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
@@ -0,0 +1,41 @@
+def iterar_janelas(pedacos, tamanho, sobreposicao, margem):
+    """Divide um texto recebido em pedaços em janelas de tamanho fixo, sem guardá-lo inteiro.
+
+    Cada janela "possui" o trecho [inicio, fim) e é entregue com `margem` caracteres
+    antes e `sobreposicao` depois, para que padrões que cruzam a fronteira sejam
+    encontrados pela janela onde começam e tenham contexto completo. O fim de cada
+    janela recua até o último espaço próximo, para não cortar palavras ao meio.
+
+    Gera (deslocamento, inicio, fim, texto, ultima): `texto` começa na posição global
+    `deslocamento`, e inicio/fim também são posições globais. A memória usada fica
+    limitada a tamanho + sobreposicao + margem mais o maior pedaço recebido.
+    """
+    buffer = ''
+    base = 0
+    inicio = 0
+    emitiu = False
+
+    for pedaco in pedacos:
+        if not pedaco:
+            continue
+        buffer += pedaco
+        while base + len(buffer) - inicio >= tamanho + sobreposicao:
+            fim = _recuar_ate_espaco(buffer, base, inicio, inicio + tamanho)
+            deslocamento = max(base, inicio - margem)
+            yield deslocamento, inicio, fim, buffer[deslocamento - base:fim + sobreposicao - base], False
+            emitiu = True
+            inicio = fim
+            corte = max(base, inicio - margem)
+            buffer = buffer[corte - base:]
+            base = corte
+
+    fim = base + len(buffer)
+    if fim > inicio or not emitiu:
+        deslocamento = max(base, inicio - margem)
+        yield deslocamento, inicio, fim, buffer[deslocamento - base:], True
+
+
+def _recuar_ate_espaco(buffer, base, inicio, fim, recuo_maximo=200):
+    limite = max(inicio + 1, fim - recuo_maximo)
+    espaco = max(buffer.rfind(' ', limite - base, fim - base), buffer.rfind('\n', limite - base, fim - base))
+    return base + espaco + 1 if espaco >= 0 else fim
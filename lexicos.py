@@ -0,0 +1,181 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+from analise import REGEX_PALAVRA
+from casador import CasadorPadroes
+
+# Só o começo do texto é olhado para escolher o idioma
+CARACTERES_IDENTIFICACAO = 2000
+# Abaixo disso o texto não tem palavras funcionais suficientes e fica com o idioma padrão
+MINIMO_EVIDENCIA = 2.0
+
+
+class Lexico:
+    """Léxico de um idioma, lido de lexicos/<idioma>.json; imutável depois de criado.
+
+    O casador só é compilado no primeiro uso, então idiomas que não aparecem não
+    custam nada na subida do worker.
+    """
+
+    def __init__(self, dados, regras_padroes):
+        self.idioma = dados['idioma']
+        self.padroes_ia = {categoria: [frase.lower() for frase in frases] for categoria, frases in dados['padroes_ia'].items()}
+        self.palavras_formais = list(dados['palavras_formais'])
+        self.palavras_informais = list(dados['palavras_informais'])
+        self.palavras_funcionais = frozenset(dados.get('palavras_funcionais', ()))
+        desconhecidas = set(self.padroes_ia) - set(regras_padroes)
+        if desconhecidas:
+            raise ValueError(f"léxico {self.idioma}: categorias sem regra {sorted(desconhecidas)}")
+        self.categorias_com_fronteira = [c for c in self.padroes_ia if regras_padroes[c]['fronteira_palavra']]
+        # As regras de fronteira mudam as ocorrências, então entram na versão junto com as listas
+        self.versao = hashlib.sha256(json.dumps(
+            [self.idioma, self.padroes_ia, self.categorias_com_fronteira, self.palavras_formais, self.palavras_informais],
+            sort_keys=True, ensure_ascii=False
+        ).encode('utf-8')).hexdigest()[:16]
+        self._casador = None
+        self._lock = threading.Lock()
+
+    @property
+    def casador(self):
+        if self._casador is None:
+            with self._lock:
+                if self._casador is None:
+                    self._casador = CasadorPadroes(self.padroes_ia, self.categorias_com_fronteira)
+        return self._casador
+
+    @property
+    def compilado(self):
+        return self._casador is not None
+
+
+class VersaoLexicos:
+    """Todos os léxicos lidos de uma vez; uma requisição usa sempre a mesma versão do começo ao fim"""
+
+    def __init__(self, lexicos, padrao, regras_padroes, assinatura=None):
+        if padrao not in lexicos:
+            raise ValueError(f'léxico do idioma padrão ({padrao}) não encontrado')
+        self.lexicos = lexicos
+        self.padrao = padrao
+        self.assinatura = assinatura
+        self.versao = hashlib.sha256(json.dumps(
+            [regras_padroes, sorted((idioma, lexico.versao) for idioma, lexico in lexicos.items())],
+            sort_keys=True, ensure_ascii=False
+        ).encode('utf-8')).hexdigest()[:16]
+        # Peso de cada palavra funcional: 1 se só um idioma a usa, 1/n se n idiomas a usam
+        usos = {}
+        for lexico in lexicos.values():
+            for palavra in lexico.palavras_funcionais:
+                usos[palavra] = usos.get(palavra, 0) + 1
+        self._pesos = {
+            idioma: {palavra: 1 / usos[palavra] for palavra in lexico.palavras_funcionais}
+            for idioma, lexico in lexicos.items()
+        }
+
+    def identificar(self, texto_lower):
+        """Léxico do idioma do texto, pelas palavras funcionais do começo dele"""
+        if len(self.lexicos) == 1:
+            return self.lexicos[self.padrao]
+        palavras = REGEX_PALAVRA.findall(texto_lower[:CARACTERES_IDENTIFICACAO])
+        melhor, pontos_melhor = self.padrao, MINIMO_EVIDENCIA
+        for idioma, pesos in self._pesos.items():
+            pontos = sum(pesos.get(palavra, 0.0) for palavra in palavras)
+            if pontos > pontos_melhor or (pontos == pontos_melhor and idioma == self.padrao):
+                melhor, pontos_melhor = idioma, pontos
+        return self.lexicos[melhor]
+
+
+class ColecaoLexicos:
+    """Léxicos de `diretorio` (um <idioma>.json por idioma), recarregados quando os arquivos mudam.
+
+    A cada `intervalo` segundos, no máximo, uma requisição confere tamanho e mtime dos
+    arquivos. Se mudaram, lê todos de novo e troca a versão atual de uma vez só: quem já
+    pegou a versão anterior termina com ela. Arquivos inválidos são ignorados e a versão
+    anterior continua valendo. Léxicos que não mudaram mantêm o casador já compilado.
+    Para trocar um arquivo sem que um worker leia metade dele, grave em um temporário
+    e renomeie.
+    """
+
+    def __init__(self, diretorio, regras_padroes, padrao='pt', intervalo=2.0):
+        self.diretorio = diretorio
+        self.regras_padroes = regras_padroes
+        self.padrao = padrao
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._proxima_verificacao = time.monotonic() + intervalo
+        self._atual = self._ler(None)
+        # Arquivos que já falharam não são lidos (nem avisados) de novo até mudarem
+        self._assinatura_invalida = None
+        self.recargas = 0
+
+    def atual(self):
+        if self.intervalo > 0 and time.monotonic() >= self._proxima_verificacao:
+            self._verificar()
+        return self._atual
+
+    def estatisticas(self):
+        atual = self._atual
+        return {
+            'versao': atual.versao,
+            'padrao': atual.padrao,
+            'idiomas': {idioma: {'versao': lexico.versao, 'compilado': lexico.compilado} for idioma, lexico in atual.lexicos.items()},
+            'recargas': self.recargas
+        }
+
+    def _assinatura(self):
+        arquivos = []
+        for caminho in sorted(glob.glob(os.path.join(glob.escape(self.diretorio), '*.json'))):
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((os.path.basename(caminho), estado.st_size, estado.st_mtime_ns))
+        return tuple(arquivos)
+
+    def _verificar(self):
+        # Uma thread confere; as outras seguem com a versão atual em vez de esperar
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._proxima_verificacao = time.monotonic() + self.intervalo
+            assinatura = self._assinatura()
+            if assinatura in (self._atual.assinatura, self._assinatura_invalida):
+                return
+            try:
+                nova = self._ler(self._atual)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self._assinatura_invalida = assinatura
+                print(f"⚠️  Léxicos em {self.diretorio} não recarregados: {e}")
+                return
+            self._atual = nova
+            self.recargas += 1
+            print(f"🔄 Léxicos recarregados (versão {nova.versao}, idiomas {', '.join(sorted(nova.lexicos))})")
+        finally:
+            self._lock.release()
+
+    def _ler(self, anterior):
+        assinatura = self._assinatura()
+        lexicos = {}
+        for nome, _, _ in assinatura:
+            with open(os.path.join(self.diretorio, nome), encoding='utf-8') as f:
+                lexico = Lexico(json.load(f), self.regras_padroes)
+            if lexico.idioma in lexicos:
+                raise ValueError(f'idioma {lexico.idioma} repetido em {nome}')
+            # Léxico igual ao anterior: reaproveita o objeto e o casador já compilado
+            if anterior is not None and anterior.lexicos.get(lexico.idioma) is not None \
+                    and anterior.lexicos[lexico.idioma].versao == lexico.versao:
+                lexico = anterior.lexicos[lexico.idioma]
+            lexicos[lexico.idioma] = lexico
+        return VersaoLexicos(lexicos, self.padrao, self.regras_padroes, assinatura)
+
+
+def lexicos_do_ambiente(regras_padroes):
+    return ColecaoLexicos(
+        os.environ.get('LEXICOS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicos'),
+        regras_padroes,
+        padrao=os.environ.get('LEXICO_PADRAO', 'pt'),
+        intervalo=float(os.environ.get('LEXICOS_RECARGA_S', 2))
+    )
@@ -0,0 +1,35 @@
+import os
+import resource
+
+
+def uso_memoria(pid=None):
+    """Memória de um processo (por padrão, o atual) em MB.
+
+    No Linux, além do RSS, informa PSS e memória privada: páginas do modelo
+    compartilhadas por copy-on-write com o master do gunicorn não entram no privado.
+    """
+    uso = {}
+    if pid is None:
+        uso['rss_max_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        if pid is not None:
+            # Pico de RSS do processo, como o ru_maxrss do processo atual
+            uso['rss_max_mb'] = round(_campos_proc(f'/proc/{pid}/status').get('VmHWM', 0) / 1024, 1)
+        campos = _campos_proc(f'/proc/{pid or os.getpid()}/smaps_rollup')
+        uso['rss_mb'] = round(campos.get('Rss', 0) / 1024, 1)
+        uso['pss_mb'] = round(campos.get('Pss', 0) / 1024, 1)
+        uso['privado_mb'] = round((campos.get('Private_Clean', 0) + campos.get('Private_Dirty', 0)) / 1024, 1)
+    except OSError:
+        pass
+    return uso
+
+
+def _campos_proc(caminho):
+    # Linhas "Campo:   123 kB" de /proc/<pid>/status ou smaps_rollup, em kB
+    campos = {}
+    with open(caminho) as f:
+        for linha in f:
+            partes = linha.split()
+            if len(partes) >= 2 and partes[0].endswith(':') and partes[1].isdigit():
+                campos[partes[0][:-1]] = int(partes[1])
+    return campos
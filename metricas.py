@@ -0,0 +1,240 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_LATENCIA = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CARACTERES = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+BUCKETS_TERMOS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+BUCKETS_LOTE = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Registro:
+    """Contadores, gauges e histogramas no formato de texto do Prometheus.
+
+    Cada processo acumula em memória. Com um diretório configurado, uma thread de
+    cada worker grava um snapshot próprio a cada `intervalo` segundos (se algo mudou)
+    e ao sair; a exportação soma os snapshots de todos, então /metrics mostra o total
+    do servidor seja qual for o worker que atender.
+    """
+
+    def __init__(self, diretorio=None, intervalo=1.0):
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._definicoes = {}
+        self._valores = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sujo = False
+        self._pid_gravador = None
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+            atexit.register(self.gravar)
+
+    def contador(self, nome, ajuda):
+        self._definicoes[nome] = {'tipo': 'counter', 'ajuda': ajuda}
+
+    def gauge(self, nome, ajuda):
+        self._definicoes[nome] = {'tipo': 'gauge', 'ajuda': ajuda}
+
+    def histograma(self, nome, ajuda, buckets=BUCKETS_LATENCIA):
+        self._definicoes[nome] = {'tipo': 'histogram', 'ajuda': ajuda, 'buckets': list(buckets)}
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+        self._talvez_gravar()
+
+    def definir(self, nome, valor, **rotulos):
+        with self._lock:
+            self._valores[(nome, _rotulos(rotulos))] = valor
+        self._talvez_gravar()
+
+    def observar(self, nome, valor, **rotulos):
+        buckets = self._definicoes[nome]['buckets']
+        chave = (nome, _rotulos(rotulos))
+        with self._lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                # Uma posição por bucket, mais +Inf, soma e contagem
+                estado = self._valores[chave] = [0] * (len(buckets) + 1) + [0.0, 0]
+            estado[bisect.bisect_left(buckets, valor)] += 1
+            estado[-2] += valor
+            estado[-1] += 1
+        self._talvez_gravar()
+
+    @contextmanager
+    def cronometrar(self, nome, **rotulos):
+        """Observa a duração do bloco e, se houver coleta ativa na thread, registra para o Server-Timing"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.observar(nome, duracao, **rotulos)
+            tempos = getattr(self._local, 'tempos', None)
+            if tempos is not None:
+                etapa = rotulos.get('etapa', nome)
+                tempos[etapa] = tempos.get(etapa, 0.0) + duracao
+
+    @contextmanager
+    def coletar_tempos(self):
+        """Junta as durações cronometradas nesta thread durante o bloco (usado no Server-Timing)"""
+        anterior = getattr(self._local, 'tempos', None)
+        tempos = self._local.tempos = {}
+        try:
+            yield tempos
+        finally:
+            self._local.tempos = anterior
+
+    def somar_tempos(self, tempos):
+        """Acrescenta à coleta desta thread durações medidas em outra (ex.: no pool de análise)"""
+        atual = getattr(self._local, 'tempos', None)
+        if atual is not None:
+            for etapa, duracao in tempos.items():
+                atual[etapa] = atual.get(etapa, 0.0) + duracao
+
+    def gravar(self):
+        if not self.diretorio:
+            return
+        with self._lock:
+            snapshot = {
+                'pid': os.getpid(),
+                'valores': [[nome, list(rotulos), valor] for (nome, rotulos), valor in self._valores.items()]
+            }
+            self._sujo = False
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = os.path.join(self.diretorio, f'{os.getpid()}.json')
+        temporario = f'{caminho}.tmp'
+        with open(temporario, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporario, caminho)
+
+    def _talvez_gravar(self):
+        if not self.diretorio:
+            return
+        self._sujo = True
+        # Threads não sobrevivem ao fork: cada worker inicia o seu gravador no primeiro uso
+        if self._pid_gravador != os.getpid():
+            self._pid_gravador = os.getpid()
+            threading.Thread(target=self._gravar_periodicamente, daemon=True).start()
+
+    def _gravar_periodicamente(self):
+        while True:
+            time.sleep(self.intervalo)
+            if self._sujo:
+                try:
+                    self.gravar()
+                except OSError as e:
+                    print(f"⚠️  Não foi possível gravar métricas: {e}")
+
+    def _snapshots(self):
+        with self._lock:
+            proprio = dict(self._valores)
+        if not self.diretorio:
+            yield os.getpid(), proprio
+            return
+        yield os.getpid(), proprio
+        for caminho in glob.glob(os.path.join(self.diretorio, '*.json')):
+            try:
+                with open(caminho) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot['pid'] == os.getpid():
+                continue
+            yield snapshot['pid'], {(nome, tuple(map(tuple, rotulos))): valor for nome, rotulos, valor in snapshot['valores']}
+
+    def exportar(self):
+        agregados = {}
+        for pid, valores in self._snapshots():
+            vivo = _processo_vivo(pid)
+            for (nome, rotulos), valor in valores.items():
+                definicao = self._definicoes.get(nome)
+                if definicao is None:
+                    continue
+                if definicao['tipo'] == 'gauge':
+                    # Gauges são por worker; os de workers encerrados são descartados
+                    if not vivo:
+                        continue
+                    agregados[(nome, rotulos + (('pid', str(pid)),))] = valor
+                elif definicao['tipo'] == 'histogram':
+                    atual = agregados.setdefault((nome, rotulos), [0] * len(valor))
+                    for i, v in enumerate(valor):
+                        atual[i] += v
+                else:
+                    agregados[(nome, rotulos)] = agregados.get((nome, rotulos), 0) + valor
+
+        linhas = []
+        for nome, definicao in self._definicoes.items():
+            series = sorted((rotulos, valor) for (n, rotulos), valor in agregados.items() if n == nome)
+            linhas.append(f"# HELP {nome} {definicao['ajuda']}")
+            linhas.append(f"# TYPE {nome} {definicao['tipo']}")
+            for rotulos, valor in series:
+                if definicao['tipo'] == 'histogram':
+                    acumulado = 0
+                    for limite, quantidade in zip(definicao['buckets'] + ['+Inf'], valor[:-2]):
+                        acumulado += quantidade
+                        linhas.append(f"{nome}_bucket{_formatar(rotulos + (('le', str(limite)),))} {acumulado}")
+                    linhas.append(f"{nome}_sum{_formatar(rotulos)} {valor[-2]}")
+                    linhas.append(f"{nome}_count{_formatar(rotulos)} {valor[-1]}")
+                else:
+                    linhas.append(f"{nome}{_formatar(rotulos)} {valor}")
+        return '\n'.join(linhas) + '\n'
+
+
+def _rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _formatar(rotulos):
+    if not rotulos:
+        return ''
+    pares = ','.join(f'{k}="{_escapar(v)}"' for k, v in rotulos)
+    return '{' + pares + '}'
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _processo_vivo(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def server_timing(tempos):
+    """Cabeçalho Server-Timing a partir das durações coletadas (em segundos)"""
+    return ', '.join(f'{etapa};dur={duracao * 1000:.2f}' for etapa, duracao in tempos.items())
+
+
+registro = Registro(os.environ.get('METRICAS_DIR') or None)
+
+registro.histograma('detector_etapa_segundos', 'Duração de cada etapa da análise')
+registro.histograma('detector_requisicao_segundos', 'Duração das requisições da API')
+registro.histograma('detector_texto_caracteres', 'Tamanho dos textos analisados', BUCKETS_CARACTERES)
+registro.histograma('detector_termos_por_texto', 'Termos suspeitos encontrados por texto', BUCKETS_TERMOS)
+registro.contador('detector_requisicoes_total', 'Requisições atendidas pela API')
+registro.contador('detector_erros_total', 'Erros durante a análise')
+registro.contador('detector_cache_consultas_total', 'Consultas ao cache de resultados')
+registro.contador('detector_quase_duplicatas_total', 'Consultas ao índice de quase duplicatas, por resultado')
+registro.histograma('detector_microlote_tamanho', 'Itens por chamada agrupada ao modelo', BUCKETS_LOTE)
+registro.histograma('detector_microlote_espera_segundos', 'Tempo na fila antes da chamada agrupada ao modelo')
+registro.gauge('detector_modelo_carga_segundos', 'Tempo para carregar o modelo neste worker')
+registro.gauge('detector_sessoes_ativas', 'Sessões de edição abertas neste worker')
+registro.contador('detector_cascata_total', 'Textos por nível da cascata em que a detecção terminou')
+registro.contador('detector_admissao_total', 'Análises executadas ou recusadas pelo pool limitado, por resultado')
+registro.gauge('detector_analises_pendentes', 'Análises na fila ou rodando no pool deste worker')
+registro.contador('detector_perfis_total', 'Requisições gravadas pelo perfilador, por motivo')
@@ -0,0 +1,74 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metricas import registro as metricas
+
+
+class AgendadorLotes:
+    """Junta chamadas concorrentes ao modelo em uma única chamada vetorizada.
+
+    Cada requisição entrega sua análise e espera o resultado. Uma thread do
+    processo pega o primeiro item da fila, aguarda até `janela` segundos ou até
+    completar `max_lote` itens, chama `funcao_lote` uma vez com todos e devolve
+    a cada requisição o seu resultado. Só faz sentido com workers que atendem
+    várias requisições ao mesmo tempo (gthread); com workers sync o lote é sempre 1.
+    """
+
+    def __init__(self, funcao_lote, janela=0.002, max_lote=64):
+        self.funcao_lote = funcao_lote
+        self.janela = janela
+        self.max_lote = max_lote
+        self._fila = queue.Queue()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executar(self, item):
+        return self.submeter(item).result()
+
+    def submeter(self, item):
+        self._garantir_thread()
+        futuro = Future()
+        self._fila.put((time.perf_counter(), item, futuro))
+        return futuro
+
+    def _garantir_thread(self):
+        # A thread do master não existe nos workers depois do fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._fila = queue.Queue()
+                threading.Thread(target=self._laco, daemon=True, name='microlote').start()
+                self._pid = os.getpid()
+
+    def _laco(self):
+        while True:
+            lote = [self._fila.get()]
+            prazo = time.perf_counter() + self.janela
+            while len(lote) < self.max_lote:
+                restante = prazo - time.perf_counter()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._processar(lote)
+
+    def _processar(self, lote):
+        inicio = time.perf_counter()
+        metricas.observar('detector_microlote_tamanho', len(lote))
+        for enviado, _, _ in lote:
+            metricas.observar('detector_microlote_espera_segundos', inicio - enviado)
+
+        try:
+            resultados = self.funcao_lote([item for _, item, _ in lote])
+        except Exception as e:
+            for _, _, futuro in lote:
+                futuro.set_exception(e)
+            return
+        for (_, _, futuro), resultado in zip(lote, resultados):
+            futuro.set_result(resultado)
@@ -0,0 +1,161 @@
+import json
+import os
+import zlib
+from functools import cached_property
+from itertools import repeat
+
+import numpy as np
+
+from analise import REGEX_PALAVRA
+from hashes import misturar
+
+NOMES_FEATURES_NGRAMAS = ('log_perplexidade', 'explosividade', 'fracao_desconhecidas')
+# Peso do bigrama na interpolação com o unigrama suavizado
+LAMBDA_BIGRAMA = 0.6
+# Surpresas são guardadas em milésimos de nat inteiros: somas por frase e por
+# documento dão o mesmo valor em qualquer ordem (e iguais às das sessões)
+ESCALA_SURPRESA = 1000
+_SEMENTE_HASH = 0x9E3779B9
+_PESO_BIGRAMA = np.uint64(0x9E3779B97F4A7C15)
+ARQUIVOS = ('unigramas_chaves', 'unigramas_contagens', 'bigramas_chaves', 'bigramas_contagens')
+
+
+def hashes_palavras(palavras):
+    """Hash estável de 64 bits de cada palavra (dois crc32 com sementes diferentes)"""
+    codificadas = list(map(str.encode, palavras))
+    alto = np.fromiter(map(zlib.crc32, codificadas), dtype=np.uint64, count=len(codificadas))
+    baixo = np.fromiter(map(zlib.crc32, codificadas, repeat(_SEMENTE_HASH)), dtype=np.uint64, count=len(codificadas))
+    return (alto << np.uint64(32)) | baixo
+
+
+def chaves_bigramas(anteriores, atuais):
+    with np.errstate(over='ignore'):
+        return misturar(anteriores * _PESO_BIGRAMA + atuais)
+
+
+def palavras_por_frase(contexto):
+    """(hashes, frase) de cada palavra do texto, na ordem do texto.
+
+    `frase` é o índice, em contexto.spans_frases, da frase que contém a palavra. Se o
+    lower() muda as posições do texto, cada frase é tokenizada à parte.
+    """
+    spans = contexto.spans_frases
+    if len(contexto.texto_lower) == len(contexto.texto):
+        if not contexto.palavras:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        distintas = hashes_palavras(list(contexto.contagem_palavras))
+        inicios = np.array([inicio for inicio, _ in spans], dtype=np.int64)
+        posicoes, _ = contexto.spans_palavras
+        return distintas[contexto.ids_palavras], np.searchsorted(inicios, posicoes, side='right') - 1
+    palavras, frases = [], []
+    for k, frase in enumerate(contexto.frases):
+        tokens = REGEX_PALAVRA.findall(frase.lower())
+        palavras += tokens
+        frases += [k] * len(tokens)
+    return hashes_palavras(palavras), np.array(frases, dtype=np.int64)
+
+
+def features_de_frases(num_palavras, surpresas, desconhecidas):
+    """Features de n-gramas de um texto a partir das somas por frase.
+
+    log_perplexidade é a surpresa média por palavra (log da perplexidade), explosividade
+    o desvio padrão da surpresa média entre frases e fracao_desconhecidas a fração de
+    palavras fora das tabelas.
+    """
+    total = int(np.sum(num_palavras))
+    if not total:
+        return [0.0, 0.0, 0.0]
+    com_palavras = num_palavras > 0
+    medias = surpresas[com_palavras] / num_palavras[com_palavras] / ESCALA_SURPRESA
+    return [
+        float(np.sum(surpresas) / total / ESCALA_SURPRESA),
+        float(np.std(medias)),
+        float(np.sum(desconhecidas) / total)
+    ]
+
+
+class TabelasNgramas:
+    """Frequências de unigramas e bigramas de um idioma (`idioma`), abertas por mmap.
+
+    Cada tabela são dois arrays .npy: chaves (hash de 64 bits, ordenadas) e contagens.
+    Os workers do gunicorn compartilham as páginas pelo cache do SO em vez de cada um
+    montar um dicionário, e a busca das palavras de um texto inteiro é um searchsorted.
+    Geradas por `python construir_ngramas.py`. Textos de outro idioma não são medidos
+    pelas tabelas e recebem `features_neutras`.
+    """
+
+    def __init__(self, diretorio, mmap_mode='r'):
+        self.diretorio = diretorio
+        for nome in ARQUIVOS:
+            setattr(self, nome, np.load(os.path.join(diretorio, f'{nome}.npy'), mmap_mode=mmap_mode))
+        with open(os.path.join(diretorio, 'ngramas.json'), encoding='utf-8') as f:
+            self.metadados = json.load(f)
+        self.versao = self.metadados['versao']
+        # Tabelas anteriores ao campo foram todas construídas com corpus em português
+        self.idioma = self.metadados.get('idioma', 'pt')
+        self.total_unigramas = self.metadados['total_unigramas']
+        self.vocabulario = len(self.unigramas_chaves)
+
+    @staticmethod
+    def _contar(chaves, contagens, consultas):
+        if not len(chaves):
+            return np.zeros(len(consultas), dtype=np.int64)
+        posicoes = np.minimum(np.searchsorted(chaves, consultas), len(chaves) - 1)
+        return np.where(chaves[posicoes] == consultas, contagens[posicoes], 0).astype(np.int64)
+
+    def surpresas(self, hashes, frases):
+        """(surpresa, desconhecida) de cada palavra.
+
+        A surpresa é -log P(palavra | anterior), em milésimos de nat, com o bigrama
+        interpolado ao unigrama suavizado por add-one. Bigramas não atravessam frases,
+        então a surpresa de uma palavra só depende da sua frase.
+        """
+        unigramas = self._contar(self.unigramas_chaves, self.unigramas_contagens, hashes)
+        probabilidade = (unigramas + 1) / (self.total_unigramas + self.vocabulario + 1)
+        if len(hashes) > 1:
+            anteriores = unigramas[:-1]
+            com_historia = (frases[1:] == frases[:-1]) & (anteriores > 0)
+            bigramas = self._contar(self.bigramas_chaves, self.bigramas_contagens,
+                                    chaves_bigramas(hashes[:-1][com_historia], hashes[1:][com_historia]))
+            seguintes = probabilidade[1:]
+            seguintes[com_historia] = (LAMBDA_BIGRAMA * bigramas / anteriores[com_historia]
+                                       + (1 - LAMBDA_BIGRAMA) * seguintes[com_historia])
+        return np.rint(-np.log(probabilidade) * ESCALA_SURPRESA).astype(np.int64), unigramas == 0
+
+    def estatisticas_frases(self, contexto):
+        """Arrays (palavras, soma das surpresas, desconhecidas) de cada frase do texto"""
+        n = len(contexto.spans_frases)
+        hashes, frases = palavras_por_frase(contexto)
+        surpresas, desconhecidas = self.surpresas(hashes, frases)
+        return (np.bincount(frases, minlength=n),
+                np.bincount(frases, weights=surpresas, minlength=n),
+                np.bincount(frases, weights=desconhecidas, minlength=n))
+
+    @cached_property
+    def features_neutras(self):
+        """Features de um texto típico das tabelas, para textos de outro idioma.
+
+        log_perplexidade é a surpresa esperada de uma palavra sorteada pelos unigramas
+        (com a mesma suavização de surpresas), sem explosividade e sem desconhecidas.
+        """
+        frequencias = self.unigramas_contagens / self.total_unigramas
+        probabilidades = (self.unigramas_contagens + 1) / (self.total_unigramas + self.vocabulario + 1)
+        return dict(zip(NOMES_FEATURES_NGRAMAS, [float(-np.sum(frequencias * np.log(probabilidades))), 0.0, 0.0]))
+
+    def features(self, contexto):
+        return dict(zip(NOMES_FEATURES_NGRAMAS, features_de_frases(*self.estatisticas_frases(contexto))))
+
+    def features_frases(self, contexto):
+        """Matriz (frases x NOMES_FEATURES_NGRAMAS), cada linha igual a features() da frase isolada"""
+        num_palavras, surpresas, desconhecidas = self.estatisticas_frases(contexto)
+        divisor = np.maximum(num_palavras, 1)
+        matriz = np.zeros((len(num_palavras), len(NOMES_FEATURES_NGRAMAS)))
+        matriz[:, 0] = surpresas / divisor / ESCALA_SURPRESA
+        matriz[:, 2] = desconhecidas / divisor
+        return matriz
+
+
+def tabelas_do_ambiente():
+    """Tabelas em NGRAMAS_DIR, ou None se não configurado"""
+    diretorio = os.environ.get('NGRAMAS_DIR')
+    return TabelasNgramas(diretorio) if diretorio else None
@@ -0,0 +1,327 @@
+import cProfile
+import glob
+import hmac
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from metricas import registro as metricas
+
+REGEX_ID = re.compile(r'^[0-9a-f]{16}-\d+$')
+# Funções mostradas no resumo de cada perfil; o arquivo baixado tem todas
+LINHAS_RESUMO = 40
+PROFUNDIDADE_MAXIMA = 128
+
+
+class PerfilRequisicao:
+    """Estado de perfil de uma requisição: motivo, threads vigiadas e o que foi coletado"""
+
+    def __init__(self, motivo, inicio):
+        # 'cabecalho' ou 'amostra' ligam o cProfile; None só vigia a latência
+        self.motivo = motivo
+        self.inicio = inicio
+        self.threads = set()
+        self.perfis = []
+        self.pilhas = Counter()
+        self.caracteres = None
+        self._lock = threading.Lock()
+
+    def anotar_entrada(self, entrada):
+        """Guarda o tamanho, em caracteres, do texto (ou da lista de textos) analisado"""
+        if isinstance(entrada, str):
+            self.caracteres = len(entrada)
+        elif isinstance(entrada, (list, tuple)):
+            self.caracteres = sum(len(item) for item in entrada if isinstance(item, str))
+
+
+class Amostrador:
+    """Amostra as pilhas das requisições que passam do limiar de latência.
+
+    Uma thread dorme até a requisição vigiada mais antiga completar `limiar` segundos;
+    a partir daí lê a pilha das threads dela a cada `intervalo` com sys._current_frames,
+    até a requisição terminar. As que terminam antes do limiar só custam um registro
+    em um dict.
+    """
+
+    def __init__(self, limiar, intervalo=0.005):
+        self.limiar = limiar
+        self.intervalo = intervalo
+        self._vigiados = {}
+        self._condicao = threading.Condition()
+        self._proximo = float('inf')
+        self._pid = None
+
+    def vigiar(self, perfil):
+        prazo = perfil.inicio + self.limiar
+        with self._condicao:
+            # Threads não sobrevivem ao fork: cada worker inicia a sua no primeiro uso
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._vigiados = {}
+                self._proximo = float('inf')
+                threading.Thread(target=self._amostrar, daemon=True).start()
+            self._vigiados[id(perfil)] = perfil
+            # Só acorda a thread se ela estiver dormindo até depois deste prazo
+            if prazo < self._proximo:
+                self._proximo = prazo
+                self._condicao.notify()
+
+    def liberar(self, perfil):
+        with self._condicao:
+            self._vigiados.pop(id(perfil), None)
+
+    def _amostrar(self):
+        while True:
+            with self._condicao:
+                agora = time.perf_counter()
+                vencidos = [p for p in self._vigiados.values() if p.inicio + self.limiar <= agora]
+                if not vencidos:
+                    self._proximo = min((p.inicio + self.limiar for p in self._vigiados.values()), default=float('inf'))
+                    self._condicao.wait(self._proximo - agora if self._proximo != float('inf') else None)
+                    continue
+            quadros = sys._current_frames()
+            with self._condicao:
+                # Uma requisição liberada depois da leitura pode já ter cedido a thread a outra
+                vencidos = [p for p in vencidos if id(p) in self._vigiados]
+            for perfil in vencidos:
+                for thread in list(perfil.threads):
+                    quadro = quadros.get(thread)
+                    if quadro is not None:
+                        perfil.pilhas[_pilha(quadro)] += 1
+            del quadros
+            time.sleep(self.intervalo)
+
+
+def _pilha(quadro):
+    # Formato "folded" (raiz;...;folha) do flamegraph.pl e do speedscope
+    funcoes = []
+    while quadro is not None and len(funcoes) < PROFUNDIDADE_MAXIMA:
+        codigo = quadro.f_code
+        funcoes.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{codigo.co_firstlineno}')
+        quadro = quadro.f_back
+    return ';'.join(reversed(funcoes))
+
+
+class RegistroPerfis:
+    """Requisições perfiladas ou lentas, gravadas em `diretorio` como um buffer circular.
+
+    Cada registro é um <id>.json com os metadados e o resumo, mais o perfil completo
+    (<id>.prof do cProfile, ou <id>.folded com as pilhas amostradas). Os ids começam
+    pelo horário em nanossegundos, então a ordem dos nomes é a ordem de gravação; acima
+    de `max_itens`, os mais antigos são apagados. Workers diferentes podem dividir o
+    mesmo diretório.
+    """
+
+    def __init__(self, diretorio, max_itens=50):
+        self.diretorio = diretorio
+        self.max_itens = max_itens
+        os.makedirs(diretorio, exist_ok=True)
+
+    def gravar(self, metadados, conteudo=None, extensao=None):
+        identificador = f'{time.time_ns():016x}-{os.getpid()}'
+        metadados = {'id': identificador, **metadados}
+        if conteudo is not None:
+            metadados['arquivo'] = f'{identificador}.{extensao}'
+            self._gravar_atomico(os.path.join(self.diretorio, metadados['arquivo']), conteudo)
+        # O .json por último: quem lista nunca vê um registro sem o perfil
+        self._gravar_atomico(os.path.join(self.diretorio, f'{identificador}.json'),
+                             json.dumps(metadados, ensure_ascii=False).encode('utf-8'))
+        self._limitar()
+        return identificador
+
+    def listar(self):
+        """Metadados de todos os registros (sem o resumo), do mais recente ao mais antigo"""
+        registros = []
+        for caminho in sorted(glob.glob(os.path.join(glob.escape(self.diretorio), '*.json')), reverse=True):
+            try:
+                with open(caminho, encoding='utf-8') as f:
+                    registro = json.load(f)
+            except (OSError, ValueError):
+                continue
+            registro.pop('resumo', None)
+            registros.append(registro)
+        return registros
+
+    def ler(self, identificador):
+        if not REGEX_ID.match(identificador):
+            return None
+        try:
+            with open(os.path.join(self.diretorio, f'{identificador}.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def caminho_perfil(self, identificador):
+        registro = self.ler(identificador)
+        if registro is None or not registro.get('arquivo'):
+            return None
+        caminho = os.path.join(self.diretorio, registro['arquivo'])
+        return caminho if os.path.exists(caminho) else None
+
+    def _gravar_atomico(self, caminho, conteudo):
+        temporario = f'{caminho}.tmp-{os.getpid()}-{threading.get_ident()}'
+        with open(temporario, 'wb') as f:
+            f.write(conteudo)
+        os.replace(temporario, caminho)
+
+    def _limitar(self):
+        registros = sorted(glob.glob(os.path.join(glob.escape(self.diretorio), '*.json')))
+        for caminho in registros[:max(0, len(registros) - self.max_itens)]:
+            base = caminho[:-len('.json')]
+            # Outro worker pode estar apagando o mesmo registro
+            for arquivo in (caminho, f'{base}.prof', f'{base}.folded'):
+                try:
+                    os.remove(arquivo)
+                except FileNotFoundError:
+                    pass
+
+
+class Perfilador:
+    """Perfil sob demanda das análises, e registro automático das requisições lentas.
+
+    Uma requisição é perfilada com cProfile se trouxer o cabeçalho X-Perfil com o
+    `token`, ou por sorteio, com probabilidade `taxa`. Com `limiar` (segundos), as
+    demais são vigiadas pelo Amostrador e, se passarem dele, gravadas com as pilhas
+    amostradas. Sem token, taxa nem limiar, `ativo` é falso e nada disso roda.
+    """
+
+    def __init__(self, diretorio, token=None, taxa=0.0, limiar=0.0, max_itens=50, intervalo=0.005):
+        self.token = token
+        self.taxa = taxa
+        self.limiar = limiar
+        self.diretorio = diretorio
+        self.ativo = bool(token) or taxa > 0 or limiar > 0
+        self.registro = RegistroPerfis(diretorio, max_itens) if self.ativo else None
+        self.amostrador = Amostrador(limiar, intervalo) if limiar > 0 else None
+
+    def autorizado(self, cabecalho):
+        return bool(self.token) and cabecalho is not None and hmac.compare_digest(cabecalho.encode('utf-8'), self.token.encode('utf-8'))
+
+    def iniciar(self, cabecalho):
+        """PerfilRequisicao da requisição atual, ou None se ela não deve ser perfilada nem vigiada"""
+        if self.autorizado(cabecalho):
+            motivo = 'cabecalho'
+        elif self.taxa > 0 and random.random() < self.taxa:
+            motivo = 'amostra'
+        elif self.amostrador is not None:
+            motivo = None
+        else:
+            return None
+        perfil = PerfilRequisicao(motivo, time.perf_counter())
+        perfil.threads.add(threading.get_ident())
+        if self.amostrador is not None and motivo is None:
+            self.amostrador.vigiar(perfil)
+        return perfil
+
+    def envolver(self, perfil, funcao):
+        """`funcao` perfilada (ou vigiada) na thread em que rodar, que pode ser a do pool de análise"""
+        def funcao_perfilada(*args, **kwargs):
+            thread = threading.get_ident()
+            # Uma thread do pool só pertence à requisição enquanto roda a análise dela
+            emprestada = thread not in perfil.threads
+            if emprestada:
+                perfil.threads.add(thread)
+            try:
+                if perfil.motivo is None:
+                    return funcao(*args, **kwargs)
+                return self._com_cprofile(perfil, funcao, args, kwargs)
+            finally:
+                if emprestada:
+                    perfil.threads.discard(thread)
+        return funcao_perfilada
+
+    def _com_cprofile(self, perfil, funcao, args, kwargs):
+        perfilador = cProfile.Profile()
+        try:
+            perfilador.enable()
+        except ValueError:
+            # Outro profiler já ativo (ex.: rodando sob um depurador): segue sem perfil
+            return funcao(*args, **kwargs)
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            perfilador.disable()
+            with perfil._lock:
+                perfil.perfis.append(perfilador)
+
+    def finalizar(self, perfil, detalhes, duracao, tempos):
+        """Grava a requisição se foi perfilada ou passou do limiar; retorna o id do registro ou None"""
+        if self.amostrador is not None and perfil.motivo is None:
+            self.amostrador.liberar(perfil)
+        motivo = perfil.motivo or ('lenta' if self.limiar > 0 and duracao >= self.limiar else None)
+        if motivo is None:
+            return None
+        metadados = {
+            'quando': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'motivo': motivo,
+            'pid': os.getpid(),
+            **detalhes,
+            'caracteres': perfil.caracteres,
+            'duracao_ms': round(duracao * 1000, 2),
+            'tempos_ms': {etapa: round(valor * 1000, 2) for etapa, valor in tempos.items()}
+        }
+        conteudo = extensao = None
+        if perfil.perfis:
+            estatisticas = pstats.Stats(perfil.perfis[0])
+            for outro in perfil.perfis[1:]:
+                estatisticas.add(outro)
+            saida = io.StringIO()
+            estatisticas.stream = saida
+            estatisticas.sort_stats('cumulative').print_stats(LINHAS_RESUMO)
+            metadados['perfil'] = 'cprofile'
+            metadados['resumo'] = saida.getvalue()
+            conteudo, extensao = _pstats_bytes(estatisticas), 'prof'
+        elif perfil.pilhas:
+            metadados['perfil'] = 'amostras'
+            metadados['amostras'] = sum(perfil.pilhas.values())
+            metadados['resumo'] = _resumo_pilhas(perfil.pilhas)
+            conteudo = ''.join(f'{pilha} {n}\n' for pilha, n in perfil.pilhas.most_common()).encode('utf-8')
+            extensao = 'folded'
+        try:
+            identificador = self.registro.gravar(metadados, conteudo, extensao)
+        except OSError as e:
+            print(f"⚠️  Não foi possível gravar o perfil: {e}")
+            return None
+        metricas.incrementar('detector_perfis_total', motivo=motivo)
+        return identificador
+
+
+def _pstats_bytes(estatisticas):
+    # O mesmo conteúdo de Stats.dump_stats, que só grava em arquivo: abre com pstats, snakeviz etc.
+    return marshal.dumps(estatisticas.stats)
+
+
+def _resumo_pilhas(pilhas):
+    """Funções em que as amostras caíram (folha da pilha) e em cuja pilha apareceram, em %"""
+    total = sum(pilhas.values())
+    proprias, inclusivas = Counter(), Counter()
+    for pilha, n in pilhas.items():
+        funcoes = pilha.split(';')
+        proprias[funcoes[-1]] += n
+        for funcao in set(funcoes):
+            inclusivas[funcao] += n
+    linhas = [f'{total} amostras', '', f"{'própria':>8} {'inclusiva':>9}  função"]
+    for funcao, n in inclusivas.most_common(LINHAS_RESUMO):
+        linhas.append(f'{proprias[funcao] / total:>7.1%} {n / total:>9.1%}  {funcao}')
+    return '\n'.join(linhas) + '\n'
+
+
+def perfilador_do_ambiente():
+    return Perfilador(
+        os.environ.get('PERFIL_DIR') or os.path.join(tempfile.gettempdir(), 'detector-perfis'),
+        token=os.environ.get('PERFIL_TOKEN') or None,
+        taxa=float(os.environ.get('PERFIL_TAXA', 0)),
+        limiar=float(os.environ.get('PERFIL_LENTAS_MS', 0)) / 1000,
+        max_itens=int(os.environ.get('PERFIL_MAX', 50)),
+        intervalo=float(os.environ.get('PERFIL_INTERVALO_MS', 5)) / 1000
+    )
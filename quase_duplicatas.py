@@ -0,0 +1,381 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from hashes import misturar
+
+PERMUTACOES = 64
+BANDAS = 16
+TAMANHO_SHINGLE = 3
+# Depois de um erro do SQLite, o índice fica desligado por este tempo antes de tentar de novo
+ESPERA_APOS_ERRO = 30.0
+_BITS_BALDE = 6
+_PESOS_SHINGLE = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9][:TAMANHO_SHINGLE], dtype=np.uint64)
+# Passo somado a cada balde percorrido ao preencher baldes vazios
+_PASSO_DENSIFICACAO = np.uint32(0x9E3779B9)
+
+
+def assinatura_minhash(contexto):
+    """Assinatura MinHash (uint32 x PERMUTACOES) dos shingles de palavras do texto.
+
+    Usa as mesmas palavras de tokenizacao_simples. Em vez de PERMUTACOES funções de
+    hash, cada shingle passa por um hash só: os bits altos escolhem um de PERMUTACOES
+    baldes e o menor valor de cada balde é uma posição da assinatura ("one permutation
+    hashing"); baldes vazios, comuns em textos curtos, copiam o próximo balde cheio.
+    O custo fica em uma ordenação dos shingles. O hash de cada palavra é estável entre
+    processos (crc32), então assinaturas gravadas por um worker valem para todos.
+    Devolve None para textos sem palavras.
+    """
+    if not contexto.palavras:
+        return None
+    # Cada palavra distinta é codificada e passa pelo crc32 uma vez só
+    hashes_distintas = {palavra: zlib.crc32(palavra.encode()) for palavra in set(contexto.palavras)}
+    hashes_palavras = np.fromiter(map(hashes_distintas.__getitem__, contexto.palavras),
+                                  dtype=np.uint64, count=len(contexto.palavras))
+
+    tamanho = min(TAMANHO_SHINGLE, len(hashes_palavras))
+    with np.errstate(over='ignore'):
+        shingles = np.zeros(len(hashes_palavras) - tamanho + 1, dtype=np.uint64)
+        for i in range(tamanho):
+            shingles += hashes_palavras[i:len(hashes_palavras) - tamanho + 1 + i] * _PESOS_SHINGLE[i]
+        shingles = np.sort(misturar(shingles))
+
+    baldes = shingles >> np.uint64(64 - _BITS_BALDE)
+    primeiros = np.searchsorted(baldes, np.arange(PERMUTACOES, dtype=np.uint64))
+    cheios = primeiros < len(shingles)
+    cheios[cheios] = baldes[primeiros[cheios]] == np.arange(PERMUTACOES)[cheios]
+    assinatura = np.zeros(PERMUTACOES, dtype=np.uint32)
+    assinatura[cheios] = (shingles[primeiros[cheios]] >> np.uint64(64 - _BITS_BALDE - 32)).astype(np.uint32)
+
+    indices_cheios = np.flatnonzero(cheios)
+    if len(indices_cheios) < PERMUTACOES:
+        # Cada balde vazio copia o próximo cheio (circularmente), somando o passo por distância
+        proximo = np.searchsorted(indices_cheios, np.arange(PERMUTACOES)) % len(indices_cheios)
+        distancia = (indices_cheios[proximo] - np.arange(PERMUTACOES)) % PERMUTACOES
+        vazios = ~cheios
+        with np.errstate(over='ignore'):
+            assinatura[vazios] = assinatura[indices_cheios[proximo[vazios]]] + _PASSO_DENSIFICACAO * distancia[vazios].astype(np.uint32)
+    return assinatura
+
+
+def chaves_bandas(assinatura):
+    """Um inteiro de 64 bits com sinal por banda; textos parecidos coincidem em ao menos uma banda"""
+    linhas = PERMUTACOES // BANDAS
+    return [
+        int.from_bytes(hashlib.blake2b(assinatura[b * linhas:(b + 1) * linhas].tobytes(), digest_size=8).digest(),
+                       'little', signed=True)
+        for b in range(BANDAS)
+    ]
+
+
+def similaridade(assinatura, outra):
+    """Estimativa do índice de Jaccard entre os conjuntos de shingles"""
+    return float(np.count_nonzero(assinatura == outra)) / PERMUTACOES
+
+
+def _prefixo_comum(a, b):
+    # Busca binária comparando fatias: as comparações rodam em C
+    baixo, alto = 0, min(len(a), len(b))
+    while baixo < alto:
+        meio = (baixo + alto + 1) // 2
+        if a[baixo:meio] == b[baixo:meio]:
+            baixo = meio
+        else:
+            alto = meio - 1
+    return baixo
+
+
+def _sufixo_comum(a, b, limite):
+    baixo, alto = 0, min(len(a), len(b)) - limite
+    while baixo < alto:
+        meio = (baixo + alto + 1) // 2
+        if a[len(a) - meio:len(a) - baixo] == b[len(b) - meio:len(b) - baixo]:
+            baixo = meio
+        else:
+            alto = meio - 1
+    return baixo
+
+
+def reaproveitar_ocorrencias(casador, antigo, ocorrencias, novo, novo_lower, fracao_maxima=0.5):
+    """Ocorrências do casador em `novo` a partir das de um texto parecido já analisado.
+
+    O trecho alterado é o que sobra entre o maior prefixo e o maior sufixo comuns.
+    Ocorrências que, com os caracteres de fronteira, ficam inteiras no prefixo ou no
+    sufixo são copiadas (as do sufixo, deslocadas); só uma janela em volta da
+    alteração passa pelo casador de novo. O resultado é o mesmo de varrer o texto
+    inteiro. Devolve (ocorrencias, (inicio, fim) da janela reanalisada), ou None se a
+    alteração passar de `fracao_maxima` do texto e não compensar.
+    """
+    if len(novo_lower) != len(novo):
+        return None
+    a = _prefixo_comum(antigo, novo)
+    s = _sufixo_comum(antigo, novo, a)
+    fim_antigo, fim_novo = len(antigo) - s, len(novo) - s
+    maior_padrao = max((len(frase) for frase in casador.origens), default=0)
+    inicio_janela = max(0, a - maior_padrao - 2)
+    fim_janela = min(len(novo), fim_novo + maior_padrao + 2)
+    if fim_janela - inicio_janela > fracao_maxima * len(novo):
+        return None
+
+    deslocamento = fim_novo - fim_antigo
+    mantidas = [o for o in ocorrencias if o[1] < a]
+    mantidas += [(inicio + deslocamento, fim + deslocamento, categoria, indice)
+                 for inicio, fim, categoria, indice in ocorrencias if inicio - 1 >= fim_antigo]
+    # Da janela, só valem as ocorrências que tocam a alteração: as demais já foram copiadas,
+    # e as das pontas da janela poderiam ter passado na fronteira por causa do corte
+    for inicio, fim, categoria, indice in casador.encontrar(novo_lower[inicio_janela:fim_janela]):
+        inicio, fim = inicio + inicio_janela, fim + inicio_janela
+        if not (fim < a or inicio - 1 >= fim_novo):
+            mantidas.append((inicio, fim, categoria, indice))
+    return mantidas, (inicio_janela, fim_janela)
+
+
+def _codificar_ocorrencias(ocorrencias):
+    # Nomes das categorias em JSON na primeira linha e a matriz (inicio, fim, categoria, indice) comprimida
+    categorias = sorted({categoria for _, _, categoria, _ in ocorrencias})
+    codigos = {categoria: i for i, categoria in enumerate(categorias)}
+    matriz = np.array([(inicio, fim, codigos[categoria], indice) for inicio, fim, categoria, indice in ocorrencias],
+                      dtype=np.int64).reshape(-1, 4)
+    return json.dumps(categorias).encode('utf-8') + b'\n' + zlib.compress(matriz.tobytes(), 1)
+
+
+def _decodificar_ocorrencias(dados):
+    cabecalho, corpo = dados.split(b'\n', 1)
+    categorias = json.loads(cabecalho)
+    return [(inicio, fim, categorias[codigo], indice)
+            for inicio, fim, codigo, indice in np.frombuffer(zlib.decompress(corpo), dtype=np.int64).reshape(-1, 4).tolist()]
+
+
+class IndiceQuaseDuplicatas:
+    """Índice de textos já analisados para achar quase duplicatas em tempo sublinear.
+
+    Cada texto vira uma assinatura MinHash dos shingles de palavras, dividida em
+    bandas (LSH): só textos que coincidem em alguma banda são comparados, e um
+    candidato vale se a similaridade estimada passar de `limiar`. Cada entrada guarda
+    o texto comprimido, as ocorrências do casador (para reanalisar só o trecho que
+    mudou) e a probabilidade dada ao texto, que `aproximar` permite reaproveitar. O
+    índice fica em um arquivo SQLite compartilhado entre os workers, limitado em
+    entradas e em bytes (sai quem foi usado há mais tempo); os totais ficam na tabela
+    `totais` para que cada gravação não precise percorrer o índice inteiro.
+    """
+
+    def __init__(self, caminho=None, limiar=0.9, max_entradas=100000, max_bytes=512 * 1024 * 1024,
+                 max_caracteres=200000, max_candidatos=32, aproximar=True):
+        self.caminho = caminho
+        self.limiar = limiar
+        self.aproximar = aproximar
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.max_caracteres = max_caracteres
+        self.max_candidatos = max_candidatos
+
+        self._lock = threading.Lock()
+        self._conexao = None
+        self._pid = None
+        self._indisponivel_ate = 0.0
+
+    @property
+    def ativo(self):
+        return self.caminho is not None
+
+    def buscar(self, assinatura, versao):
+        """Entrada mais parecida acima do limiar, como dict com id, similaridade, texto, ocorrências e decisão.
+
+        `decisao` é o (prob_ia, confianca) dado ao texto encontrado, ou None em entradas
+        gravadas sem ela.
+        """
+        bandas = [parametro for par in enumerate(chaves_bandas(assinatura)) for parametro in par]
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                if conexao is None:
+                    return None
+                candidatos = {}
+                # Uma consulta só para todas as bandas; o SQLite usa o índice em cada termo do OR
+                for (entrada,) in conexao.execute(
+                        f'SELECT entrada FROM bandas WHERE {" OR ".join(["(banda = ? AND valor = ?)"] * BANDAS)}', bandas):
+                    candidatos[entrada] = candidatos.get(entrada, 0) + 1
+                if not candidatos:
+                    return None
+
+                # Quem coincide em mais bandas tende a ser mais parecido
+                ids = sorted(candidatos, key=candidatos.get, reverse=True)[:self.max_candidatos]
+                melhor = None
+                for entrada, chave, bytes_assinatura in conexao.execute(
+                        f'SELECT id, chave, assinatura FROM entradas WHERE versao = ? AND id IN ({",".join("?" * len(ids))})',
+                        (versao, *ids)):
+                    valor = similaridade(assinatura, np.frombuffer(bytes_assinatura, dtype=np.uint32))
+                    if valor >= self.limiar and (melhor is None or valor > melhor[2]):
+                        melhor = (entrada, chave, valor)
+                if melhor is None:
+                    return None
+
+                entrada, chave, valor = melhor
+                texto, ocorrencias, probabilidade, confianca = conexao.execute(
+                    'SELECT texto, ocorrencias, probabilidade, confianca FROM entradas WHERE id = ?', (entrada,)).fetchone()
+                with conexao:
+                    conexao.execute('UPDATE entradas SET acessado = ? WHERE id = ?', (time.time(), entrada))
+                return {
+                    'id': chave,
+                    'similaridade': valor,
+                    'texto': zlib.decompress(texto).decode('utf-8', 'surrogatepass'),
+                    'ocorrencias': _decodificar_ocorrencias(ocorrencias),
+                    'decisao': (probabilidade, confianca) if probabilidade is not None else None
+                }
+            except (sqlite3.Error, zlib.error, ValueError) as e:
+                # Sem o índice, o texto é analisado do zero
+                self._indisponivel(e)
+                return None
+
+    def adicionar(self, texto, assinatura, ocorrencias, versao, decisao=None):
+        """Guarda um texto analisado e a sua decisão (prob_ia, confianca); textos repetidos só têm o acesso renovado"""
+        if len(texto) > self.max_caracteres:
+            return
+        texto_utf8 = texto.encode('utf-8', 'surrogatepass')
+        chave = hashlib.sha256(texto_utf8).hexdigest()
+        agora = time.time()
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                if conexao is None:
+                    return
+                with conexao:
+                    existente = conexao.execute(
+                        'SELECT id FROM entradas WHERE chave = ? AND versao = ?', (chave, versao)).fetchone()
+                    if existente is not None:
+                        conexao.execute('UPDATE entradas SET acessado = ? WHERE id = ?', (agora, existente[0]))
+                        return
+                    texto_comprimido = zlib.compress(texto_utf8, 1)
+                    ocorrencias_comprimidas = _codificar_ocorrencias(ocorrencias)
+                    tamanho = len(texto_comprimido) + len(ocorrencias_comprimidas) + assinatura.nbytes
+                    probabilidade, confianca = decisao if decisao is not None else (None, None)
+                    entrada = conexao.execute(
+                        'INSERT INTO entradas (chave, versao, assinatura, texto, ocorrencias, criado, acessado, tamanho, '
+                        'probabilidade, confianca) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (chave, versao, assinatura.tobytes(), texto_comprimido, ocorrencias_comprimidas, agora, agora, tamanho,
+                         probabilidade, confianca)
+                    ).lastrowid
+                    conexao.executemany(
+                        'INSERT INTO bandas (banda, valor, entrada) VALUES (?, ?, ?)',
+                        [(banda, valor, entrada) for banda, valor in enumerate(chaves_bandas(assinatura))]
+                    )
+                    conexao.execute('UPDATE totais SET entradas = entradas + 1, bytes = bytes + ?', (tamanho,))
+                    self._limitar(conexao)
+            except sqlite3.Error as e:
+                # O texto só não fica guardado; a resposta já saiu da análise normal
+                self._indisponivel(e)
+
+    def estatisticas(self):
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                if conexao is None:
+                    return {'entradas': None, 'bytes': None, 'limiar': self.limiar, 'indisponivel': True}
+                entradas, tamanho = conexao.execute('SELECT entradas, bytes FROM totais').fetchone()
+            except sqlite3.Error as e:
+                self._indisponivel(e)
+                return {'entradas': None, 'bytes': None, 'limiar': self.limiar, 'indisponivel': True}
+        return {'entradas': entradas, 'bytes': tamanho, 'limiar': self.limiar}
+
+    def limpar_versoes_antigas(self, versoes):
+        """Remove entradas gravadas com léxicos fora de `versoes` (um por idioma): as ocorrências delas não valem mais"""
+        if not self.ativo:
+            return
+        versoes = list(versoes)
+        marcadores = ','.join('?' * len(versoes))
+        with self._lock:
+            try:
+                conexao = self._conectar()
+                if conexao is None:
+                    return
+                with conexao:
+                    conexao.execute(f'DELETE FROM bandas WHERE entrada IN (SELECT id FROM entradas WHERE versao NOT IN ({marcadores}))', versoes)
+                    conexao.execute(f'DELETE FROM entradas WHERE versao NOT IN ({marcadores})', versoes)
+                    # Raro (subida e troca de léxico): aproveita para acertar os totais de uma vez
+                    self._recontar(conexao)
+            except sqlite3.Error as e:
+                self._indisponivel(e)
+
+    @staticmethod
+    def _recontar(conexao):
+        conexao.execute('UPDATE totais SET entradas = (SELECT COUNT(*) FROM entradas), '
+                        'bytes = (SELECT COALESCE(SUM(tamanho), 0) FROM entradas)')
+
+    def _limitar(self, conexao):
+        entradas, total = conexao.execute('SELECT entradas, bytes FROM totais').fetchone()
+        if entradas <= self.max_entradas and total <= self.max_bytes:
+            return
+        # Remove as usadas há mais tempo até caber nos limites
+        removidas, bytes_removidos = 0, 0
+        while entradas - removidas > self.max_entradas or total - bytes_removidos > self.max_bytes:
+            antigas = conexao.execute('SELECT id, tamanho FROM entradas ORDER BY acessado LIMIT 64').fetchall()
+            if not antigas:
+                break
+            for entrada, tamanho in antigas:
+                if entradas - removidas <= self.max_entradas and total - bytes_removidos <= self.max_bytes:
+                    break
+                conexao.execute('DELETE FROM bandas WHERE entrada = ?', (entrada,))
+                conexao.execute('DELETE FROM entradas WHERE id = ?', (entrada,))
+                removidas += 1
+                bytes_removidos += tamanho
+        conexao.execute('UPDATE totais SET entradas = entradas - ?, bytes = bytes - ?', (removidas, bytes_removidos))
+
+    def _indisponivel(self, erro):
+        print(f"⚠️  Índice de quase duplicatas indisponível por {ESPERA_APOS_ERRO:.0f} s: {erro}")
+        self._conexao = None
+        self._indisponivel_ate = time.monotonic() + ESPERA_APOS_ERRO
+
+    def _conectar(self):
+        """Conexão com o índice, ou None logo depois de um erro; pode levantar sqlite3.Error"""
+        if time.monotonic() < self._indisponivel_ate:
+            return None
+        # Conexões SQLite não sobrevivem ao fork do gunicorn: reabre uma por processo
+        if self._conexao is None or self._pid != os.getpid():
+            self._conexao = None
+            conexao = sqlite3.connect(self.caminho, timeout=5, check_same_thread=False)
+            conexao.execute('PRAGMA journal_mode=WAL')
+            conexao.execute('PRAGMA synchronous=NORMAL')
+            with conexao:
+                # Os workers sobem juntos: o esquema é criado (ou atualizado) por um de cada vez
+                conexao.execute('BEGIN IMMEDIATE')
+                conexao.execute(
+                    'CREATE TABLE IF NOT EXISTS entradas ('
+                    'id INTEGER PRIMARY KEY AUTOINCREMENT, chave TEXT NOT NULL, versao TEXT NOT NULL, '
+                    'assinatura BLOB NOT NULL, texto BLOB NOT NULL, ocorrencias BLOB NOT NULL, '
+                    'criado REAL NOT NULL, acessado REAL NOT NULL, tamanho INTEGER NOT NULL, '
+                    'probabilidade REAL, confianca REAL)'
+                )
+                conexao.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_entradas_chave ON entradas (chave, versao)')
+                conexao.execute('CREATE INDEX IF NOT EXISTS idx_entradas_acessado ON entradas (acessado)')
+                conexao.execute('CREATE TABLE IF NOT EXISTS bandas (banda INTEGER NOT NULL, valor INTEGER NOT NULL, entrada INTEGER NOT NULL)')
+                conexao.execute('CREATE INDEX IF NOT EXISTS idx_bandas_valor ON bandas (banda, valor)')
+                conexao.execute('CREATE INDEX IF NOT EXISTS idx_bandas_entrada ON bandas (entrada)')
+                # Índices gravados antes da decisão guardada ganham as colunas vazias
+                colunas = {coluna for _, coluna, *_ in conexao.execute('PRAGMA table_info(entradas)')}
+                for coluna in ('probabilidade', 'confianca'):
+                    if coluna not in colunas:
+                        conexao.execute(f'ALTER TABLE entradas ADD COLUMN {coluna} REAL')
+                conexao.execute('CREATE TABLE IF NOT EXISTS totais (entradas INTEGER NOT NULL, bytes INTEGER NOT NULL)')
+                if conexao.execute('SELECT COUNT(*) FROM totais').fetchone()[0] == 0:
+                    conexao.execute('INSERT INTO totais VALUES (0, 0)')
+                    self._recontar(conexao)
+            self._conexao = conexao
+            self._pid = os.getpid()
+        return self._conexao
+
+
+def indice_do_ambiente():
+    return IndiceQuaseDuplicatas(
+        caminho=os.environ.get('DUPLICATAS_SQLITE') or None,
+        limiar=float(os.environ.get('DUPLICATAS_LIMIAR', 0.9)),
+        max_entradas=int(os.environ.get('DUPLICATAS_MAX_ITENS', 100000)),
+        max_bytes=int(float(os.environ.get('DUPLICATAS_MAX_MB', 512)) * 1024 * 1024),
+        max_caracteres=int(os.environ.get('DUPLICATAS_MAX_CARACTERES', 200000)),
+        aproximar=os.environ.get('DUPLICATAS_APROXIMAR', '1') != '0'
+    )
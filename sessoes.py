@@ -0,0 +1,394 @@
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from analise import ContextoAnalise
+from lexicos import CARACTERES_IDENTIFICACAO
+from ngramas import features_de_frases
+
+
+class DocumentoIncremental:
+    """Documento de uma sessão de edição, reanalisado só onde o texto mudou.
+
+    O texto é dividido em segmentos: cada um vai do início de uma frase até o início
+    da seguinte (a última vai até o fim do texto). Cada segmento guarda suas
+    ocorrências de padrões, contagens de palavras e a linha de features da frase, e
+    o documento guarda os totais. Uma edição reanalisa apenas os segmentos vizinhos
+    ao trecho alterado e ajusta os totais, então o custo depende do tamanho da edição
+    e das frases em volta, não do documento (fora a cópia do texto em si).
+    """
+
+    def __init__(self, detector, texto):
+        self.detector = detector
+        self.versao = 0
+        self.versao_detector = detector.versao
+        self.lock = threading.Lock()
+        self._reiniciar(texto)
+
+    def _reiniciar(self, texto):
+        # O léxico fica fixo entre edições; aplicar troca de léxico se o idioma do começo mudar
+        self.lexico = self.detector.lexico_para(texto[:CARACTERES_IDENTIFICACAO].lower())
+        self.texto = ''
+        self.inicios = np.zeros(0, dtype=np.int64)
+        self.segmentos = []
+        self.tokens_prefixo = 0
+        self.contagem_palavras = Counter()
+        self.num_palavras = 0
+        self.soma_comprimentos = 0
+        self.palavras_longas = 0
+        self.tokens_espaco = 0
+        self.marcadores = Counter()
+        self.termos_por_categoria = Counter()
+        # Frases novas ainda sem probabilidade: vão ao modelo junto com o documento
+        self._pendentes = []
+        self._substituir(0, 0, texto)
+
+    def aplicar(self, edicoes, max_caracteres=None):
+        """Aplica edições {'inicio', 'fim', 'texto'} em sequência, cada uma sobre o texto
+        resultante da anterior. Retorna o trecho (inicio, fim) do texto final que foi reanalisado.
+
+        Todas são validadas antes de qualquer mudança: uma edição inválida não deixa o
+        documento pela metade.
+        """
+        comprimento = len(self.texto)
+        for edicao in edicoes:
+            if not isinstance(edicao, dict):
+                raise ValueError('Cada edição precisa de "inicio" e "fim" inteiros e "texto" string.')
+            inicio, fim, texto = edicao.get('inicio'), edicao.get('fim'), edicao.get('texto', '')
+            if type(inicio) is not int or type(fim) is not int or not isinstance(texto, str):
+                raise ValueError('Cada edição precisa de "inicio" e "fim" inteiros e "texto" string.')
+            if not 0 <= inicio <= fim <= comprimento:
+                raise ValueError(f'Edição fora do texto: [{inicio}, {fim}) em {comprimento} caracteres.')
+            comprimento += len(texto) - (fim - inicio)
+        if max_caracteres is not None and comprimento > max_caracteres:
+            raise ValueError(f'Documento muito grande para uma sessão. Máximo {max_caracteres} caracteres.')
+
+        alterado = None
+        for edicao in edicoes:
+            regiao = self._substituir(edicao['inicio'], edicao['fim'], edicao.get('texto', ''))
+            alterado = _unir(alterado, *regiao)
+        if self.detector.lexico_para(self.texto[:CARACTERES_IDENTIFICACAO].lower()) is not self.lexico:
+            # Outro idioma: todas as ocorrências e marcadores mudam
+            self._reiniciar(self.texto)
+            alterado = (0, len(self.texto))
+        self.versao += 1
+        return alterado or (0, 0)
+
+    def _substituir(self, inicio, fim, novo):
+        # Região reanalisada: do segmento anterior ao que contém `inicio` (o separador dele pode
+        # ter mudado) até o início do segundo segmento depois do que contém `fim`
+        n = len(self.segmentos)
+        primeiro = int(np.searchsorted(self.inicios, inicio, side='left')) - 1
+        primeiro = max(primeiro, 0)
+        ultimo = int(np.searchsorted(self.inicios, fim, side='right')) + 1
+        ultimo = min(ultimo, n)
+        regiao_inicio = int(self.inicios[primeiro]) if primeiro > 0 else 0
+        regiao_fim = int(self.inicios[ultimo]) if ultimo < n else len(self.texto)
+        delta = len(novo) - (fim - inicio)
+
+        for segmento in self.segmentos[primeiro:ultimo]:
+            self._somar(segmento, -1)
+        if primeiro == 0:
+            self.tokens_espaco -= self.tokens_prefixo
+
+        self.texto = self.texto[:inicio] + novo + self.texto[fim:]
+        inicios_novos, segmentos_novos = self._analisar_regiao(regiao_inicio, regiao_fim + delta)
+
+        for segmento in segmentos_novos:
+            self._somar(segmento, 1)
+        self.segmentos[primeiro:ultimo] = segmentos_novos
+        self.inicios = np.concatenate([self.inicios[:primeiro], inicios_novos, self.inicios[ultimo:] + delta])
+        return regiao_inicio, regiao_fim, regiao_fim + delta
+
+    def _analisar_regiao(self, regiao_inicio, regiao_fim):
+        detector = self.detector
+        texto_regiao = self.texto[regiao_inicio:regiao_fim]
+        contexto = ContextoAnalise(texto_regiao, self.lexico)
+        spans = contexto.spans_frases
+        inicios = [inicio for inicio, _ in spans]
+
+        if regiao_inicio == 0:
+            # Espaços (e pontuação solta) antes da primeira frase não pertencem a nenhum segmento
+            self.tokens_prefixo = len(texto_regiao[:inicios[0] if inicios else len(texto_regiao)].split())
+            self.tokens_espaco += self.tokens_prefixo
+
+        segmentos = [{'fim_frase': fim - inicio, 'ocorrencias': [], 'palavras': Counter()} for inicio, fim in spans]
+        for start, end, categoria, indice in self.lexico.casador.encontrar(contexto.texto_lower):
+            k = bisect_right(inicios, start) - 1
+            segmentos[k]['ocorrencias'].append((start - inicios[k], end - inicios[k], categoria, indice))
+
+        if contexto.palavras:
+            posicoes, _ = contexto.spans_palavras
+            for k, palavra in zip(np.searchsorted(inicios, posicoes, side='right') - 1, contexto.palavras):
+                segmentos[k]['palavras'][palavra] += 1
+
+        matriz = detector.extrair_features_frases(contexto)
+        if detector.ngramas is not None and detector.ngramas.idioma == self.lexico.idioma:
+            for segmento, estatisticas in zip(segmentos, zip(*detector.ngramas.estatisticas_frases(contexto))):
+                segmento['ngramas'] = estatisticas
+        marcadores = self.lexico.palavras_formais + self.lexico.palavras_informais
+        for k, (segmento, (inicio, fim)) in enumerate(zip(segmentos, spans)):
+            proximo = inicios[k + 1] if k + 1 < len(inicios) else len(texto_regiao)
+            frase_lower = contexto.texto_lower[inicio:fim]
+            comprimentos = [len(p) * n for p, n in segmento['palavras'].items()]
+            segmento['num_palavras'] = sum(segmento['palavras'].values())
+            segmento['soma_comprimentos'] = sum(comprimentos)
+            segmento['palavras_longas'] = sum(n for p, n in segmento['palavras'].items() if len(p) > 6)
+            segmento['tokens_espaco'] = len(texto_regiao[inicio:proximo].split())
+            segmento['marcadores'] = frozenset(p for p in marcadores if p in frase_lower)
+            segmento['features'] = matriz[k]
+            segmento['ai_probability'] = None
+            self._pendentes.append(segmento)
+        return np.array(inicios, dtype=np.int64) + regiao_inicio, segmentos
+
+    def _somar(self, segmento, sinal):
+        if sinal > 0:
+            self.contagem_palavras.update(segmento['palavras'])
+        else:
+            self.contagem_palavras.subtract(segmento['palavras'])
+            for palavra in segmento['palavras']:
+                if self.contagem_palavras[palavra] <= 0:
+                    del self.contagem_palavras[palavra]
+        self.num_palavras += sinal * segmento['num_palavras']
+        self.soma_comprimentos += sinal * segmento['soma_comprimentos']
+        self.palavras_longas += sinal * segmento['palavras_longas']
+        self.tokens_espaco += sinal * segmento['tokens_espaco']
+        for marcador in segmento['marcadores']:
+            self.marcadores[marcador] += sinal
+        for _, _, categoria, _ in segmento['ocorrencias']:
+            self.termos_por_categoria[categoria] += sinal
+
+    def features(self):
+        """Features do documento inteiro, iguais às de extrair_features, a partir dos totais"""
+        detector = self.detector
+        if len(self.texto) > 5000:
+            # Textos longos usam uma amostra de tamanho fixo: recalcular custa o mesmo sempre
+            return [float(v) for v in detector.extrair_features(self.texto, ContextoAnalise(self.texto, self.lexico)).values()]
+
+        n = self.num_palavras
+        num_frases = len(self.segmentos)
+        formal = sum(1 for p in self.lexico.palavras_formais if self.marcadores[p] > 0)
+        informal = sum(1 for p in self.lexico.palavras_informais if self.marcadores[p] > 0)
+        features = [float(len(self.texto)), float(n), float(num_frases)]
+        if n:
+            features += [
+                self.soma_comprimentos / n,
+                n / num_frases,
+                len(self.contagem_palavras) / n,
+                self.palavras_longas / n
+            ]
+        else:
+            features += [0.0, 0.0, 0.0, 0.0]
+        features.append((formal - informal) / n if n > 0 else 0.0)
+        if detector.ngramas is not None and detector.ngramas.idioma != self.lexico.idioma:
+            features += detector.ngramas.features_neutras.values()
+        elif detector.ngramas is not None:
+            # Somas inteiras por frase: o mesmo resultado de extrair_features, em qualquer ordem
+            por_frase = np.array([segmento['ngramas'] for segmento in self.segmentos], dtype=float).reshape(-1, 3)
+            features += features_de_frases(*por_frase.T)
+        return features
+
+    def estatisticas_deteccao(self):
+        total = sum(self.termos_por_categoria.values())
+        return {
+            'total_termos': total,
+            'termos_por_tipo': {
+                self.detector.regras_padroes[categoria]['tipo']: self.termos_por_categoria[categoria]
+                for categoria in self.detector.regras_padroes if self.termos_por_categoria[categoria] > 0
+            },
+            'densidade_termos': total / self.tokens_espaco if self.tokens_espaco else 0
+        }
+
+    def ocorrencias(self, inicio=0, fim=None):
+        """Ocorrências, em posições do texto, dos segmentos que começam em [inicio, fim)"""
+        fim = len(self.texto) if fim is None else fim
+        primeiro = int(np.searchsorted(self.inicios, inicio, side='left'))
+        ultimo = int(np.searchsorted(self.inicios, fim, side='left'))
+        for k in range(primeiro, ultimo):
+            base = int(self.inicios[k])
+            for start, end, categoria, indice in self.segmentos[k]['ocorrencias']:
+                yield start + base, end + base, categoria, indice
+
+    def frases(self, inicio=0, fim=None):
+        fim = len(self.texto) if fim is None else fim
+        primeiro = int(np.searchsorted(self.inicios, inicio, side='left'))
+        ultimo = int(np.searchsorted(self.inicios, fim, side='left'))
+        return [
+            (int(self.inicios[k]), int(self.inicios[k]) + self.segmentos[k]['fim_frase'], self.segmentos[k]['ai_probability'])
+            for k in range(primeiro, ultimo)
+        ]
+
+    def probabilidade(self):
+        """(prob_ia, confianca) do documento, com a mesma regra de texto curto do predict.
+
+        As frases reanalisadas desde a última chamada vão na mesma matriz, em uma só
+        chamada ao modelo.
+        """
+        pendentes, self._pendentes = self._pendentes, []
+        linhas = [segmento['features'] for segmento in pendentes]
+        curto = len(self.texto.strip()) < 20
+        if not curto:
+            linhas.insert(0, self.features())
+        if not linhas:
+            return 0.5, 0.1
+        probabilidades = self.detector.probabilidades_matriz(np.array(linhas, dtype=float))
+        for segmento, (prob_ia, _) in zip(pendentes, probabilidades[0 if curto else 1:]):
+            segmento['ai_probability'] = prob_ia
+        return (0.5, 0.1) if curto else probabilidades[0]
+
+    def resultado_trecho(self, inicio, fim):
+        """Resposta de uma edição: probabilidade e estatísticas do documento, mais termos,
+        destaque e frases só do trecho reanalisado"""
+        detector = self.detector
+        prob_ia, confianca = self.probabilidade()
+        termos = detector.montar_termos(self.texto, self.ocorrencias(inicio, fim))
+        termos_trecho = [{**t, 'posicao': (t['posicao'][0] - inicio, t['posicao'][1] - inicio)} for t in termos]
+        return {
+            'ai_probability': round(prob_ia, 3),
+            'human_probability': round(1 - prob_ia, 3),
+            'confidence': round(confianca, 2),
+            'text_analyzed_length': len(self.texto),
+            'estatisticas_deteccao': self.estatisticas_deteccao(),
+            'trecho': {
+                'inicio': inicio,
+                'fim': fim,
+                'termos_suspeitos': termos,
+                'texto_destacado': detector.gerar_texto_destacado(self.texto[inicio:fim], termos_trecho),
+                'frases': [
+                    {'inicio': a, 'fim': b, 'ai_probability': round(p, 3)} for a, b, p in self.frases(inicio, fim)
+                ]
+            }
+        }
+
+    def resultado_completo(self):
+        """O mesmo resultado de predict(texto, por_frase=True), montado a partir dos segmentos"""
+        detector = self.detector
+        if len(self.texto.strip()) < 20:
+            return detector.resultado_neutro(self.texto)
+        prob_ia, confianca = self.probabilidade()
+        termos = detector.montar_termos(self.texto, self.ocorrencias())
+        analise = {
+            'contexto': ContextoAnalise(self.texto, self.lexico),
+            'termos_suspeitos': termos,
+            'texto_destacado': detector.gerar_texto_destacado(self.texto, termos)
+        }
+        resultado = detector.montar_resultado(self.texto, analise, prob_ia, confianca)
+        resultado['frases'], resultado['paragrafos'] = detector.mapa_de_calor(
+            analise, [p for _, _, p in self.frases()]
+        )
+        return resultado
+
+
+def _unir(alterado, regiao_inicio, regiao_fim_antigo, regiao_fim):
+    """Junta o trecho já alterado (em posições antigas) com a região de uma nova edição"""
+    if alterado is None:
+        return regiao_inicio, regiao_fim
+    inicio, fim = alterado
+    delta = regiao_fim - regiao_fim_antigo
+    if inicio >= regiao_fim_antigo:
+        inicio += delta
+    if fim >= regiao_fim_antigo:
+        fim += delta
+    elif fim > regiao_inicio:
+        fim = regiao_fim
+    return min(inicio, regiao_inicio), max(fim, regiao_fim)
+
+
+class GerenciadorSessoes:
+    """Sessões de edição em memória, com limite de quantidade, de tamanho e expiração.
+
+    Cada documento ocupa cerca de 25 bytes por caractere (texto, contagens e features
+    por frase); `max_caracteres_total` limita a soma de todas as sessões, descartando
+    as usadas há mais tempo.
+
+    As sessões ficam no processo que as criou: com vários workers do gunicorn, use
+    roteamento fixo por sessão ou um worker com threads. Uma sessão que não existe
+    mais (expirada, removida pelo LRU ou em outro worker) responde 404, e o cliente
+    cria outra enviando o texto inteiro.
+    """
+
+    def __init__(self, max_sessoes=256, max_caracteres=200000, max_caracteres_total=4000000, ttl=900):
+        self.max_sessoes = max_sessoes
+        self.max_caracteres = max_caracteres
+        self.max_caracteres_total = max_caracteres_total
+        self.ttl = ttl
+        self._sessoes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def criar(self, detector, texto):
+        if len(texto) > self.max_caracteres:
+            raise ValueError(f'Documento muito grande para uma sessão. Máximo {self.max_caracteres} caracteres.')
+        documento = DocumentoIncremental(detector, texto)
+        identificador = secrets.token_urlsafe(12)
+        with self._lock:
+            self._expirar()
+            self._sessoes[identificador] = (time.time(), documento)
+            self._limitar()
+        return identificador, documento
+
+    def obter(self, identificador):
+        agora = time.time()
+        with self._lock:
+            item = self._sessoes.get(identificador)
+            if item is None:
+                return None
+            if agora - item[0] > self.ttl:
+                del self._sessoes[identificador]
+                return None
+            self._sessoes[identificador] = (agora, item[1])
+            self._sessoes.move_to_end(identificador)
+            return item[1]
+
+    def remover(self, identificador):
+        with self._lock:
+            return self._sessoes.pop(identificador, None) is not None
+
+    def editar(self, documento, edicoes):
+        """Aplica as edições na sessão (chamar com documento.lock); retorna o trecho reanalisado"""
+        if documento.versao_detector != documento.detector.versao:
+            # Modelo ou léxico trocados: os segmentos guardados não valem mais
+            documento.versao_detector = documento.detector.versao
+            documento._reiniciar(documento.texto)
+        trecho = documento.aplicar(edicoes, self.max_caracteres)
+        with self._lock:
+            self._limitar()
+        return trecho
+
+    def estatisticas(self):
+        with self._lock:
+            self._expirar()
+            return {
+                'sessoes': len(self._sessoes),
+                'caracteres': sum(len(documento.texto) for _, documento in self._sessoes.values()),
+                'max_sessoes': self.max_sessoes,
+                'ttl': self.ttl
+            }
+
+    def _limitar(self):
+        # A sessão mais recente (a que acabou de ser criada ou editada) nunca é descartada
+        total = sum(len(documento.texto) for _, documento in self._sessoes.values())
+        while len(self._sessoes) > 1 and (len(self._sessoes) > self.max_sessoes or total > self.max_caracteres_total):
+            _, (_, documento) = self._sessoes.popitem(last=False)
+            total -= len(documento.texto)
+
+    def _expirar(self):
+        agora = time.time()
+        while self._sessoes:
+            identificador, (acessado, _) = next(iter(self._sessoes.items()))
+            if agora - acessado <= self.ttl:
+                break
+            del self._sessoes[identificador]
+
+
+def sessoes_do_ambiente():
+    return GerenciadorSessoes(
+        max_sessoes=int(os.environ.get('SESSOES_MAX', 256)),
+        max_caracteres=int(os.environ.get('SESSAO_MAX_CARACTERES', 200000)),
+        max_caracteres_total=int(os.environ.get('SESSOES_MAX_CARACTERES', 4000000)),
+        ttl=float(os.environ.get('SESSOES_TTL', 900))
+    )
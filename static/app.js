@@ -0,0 +1,379 @@
+document.getElementById('textInput').addEventListener('input', function() {
+    const text = this.value;
+    const chars = text.length;
+    const words = text.trim() ? text.trim().split(/\s+/).length : 0;
+    const sentences = text.split(/[.!?]+/).length - 1;
+    document.getElementById('textStats').innerHTML =
+        `Caracteres: ${chars} | Palavras: ${words} | Frases: ${sentences}`;
+    agendarSessao();
+});
+
+// Sessão de edição: só o trecho alterado vai para o servidor a cada pausa na digitação
+let sessao = null;
+let versaoSessao = 0;
+let textoSessao = '';
+let sincronizando = false;
+let timerSessao = null;
+
+function agendarSessao() {
+    clearTimeout(timerSessao);
+    timerSessao = setTimeout(sincronizarSessao, 300);
+}
+
+function pontosDeCodigo(texto) {
+    // O servidor conta caracteres Unicode; o JavaScript, unidades UTF-16
+    return texto.length - (texto.match(/[\uD800-\uDBFF]/g) || []).length;
+}
+
+function calcularEdicao(antigo, novo) {
+    let inicio = 0;
+    while (inicio < antigo.length && inicio < novo.length && antigo[inicio] === novo[inicio]) inicio++;
+    if (inicio > 0 && /[\uD800-\uDBFF]/.test(novo[inicio - 1])) inicio--;
+    let sufixo = 0;
+    while (sufixo < antigo.length - inicio && sufixo < novo.length - inicio &&
+           antigo[antigo.length - 1 - sufixo] === novo[novo.length - 1 - sufixo]) sufixo++;
+    if (sufixo > 0 && /[\uDC00-\uDFFF]/.test(novo[novo.length - sufixo])) sufixo--;
+    const inicioCp = pontosDeCodigo(antigo.slice(0, inicio));
+    return {
+        inicio: inicioCp,
+        fim: inicioCp + pontosDeCodigo(antigo.slice(inicio, antigo.length - sufixo)),
+        texto: novo.slice(inicio, novo.length - sufixo)
+    };
+}
+
+async function sincronizarSessao() {
+    if (sincronizando) {
+        agendarSessao();
+        return;
+    }
+    const texto = document.getElementById('textInput').value;
+    if (sessao && texto === textoSessao) return;
+
+    sincronizando = true;
+    try {
+        const response = sessao
+            ? await fetch(`/api/sessoes/${sessao}/edicoes`, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({versao: versaoSessao, edicoes: [calcularEdicao(textoSessao, texto)]})
+            })
+            : await fetch('/api/sessoes', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({text: texto})
+            });
+        const data = await response.json();
+
+        if (!data.success) {
+            // Sessão expirada ou fora de sincronia: recomeça com o texto inteiro
+            if (sessao) {
+                sessao = null;
+                agendarSessao();
+            }
+            return;
+        }
+        sessao = data.sessao;
+        versaoSessao = data.versao;
+        textoSessao = texto;
+
+        const stats = data.result.estatisticas_deteccao || {};
+        document.getElementById('liveStats').textContent = texto.trim().length < 20
+            ? '🤖 Análise ao vivo: texto muito curto'
+            : `🤖 Análise ao vivo: ${Math.round(data.result.ai_probability * 100)}% IA | ${stats.total_termos || 0} termos suspeitos`;
+    } catch (error) {
+        document.getElementById('liveStats').textContent = '🤖 Análise ao vivo indisponível';
+    } finally {
+        sincronizando = false;
+    }
+}
+
+// Últimas respostas de /api/detect por corpo enviado: com o mesmo texto e o mesmo modelo,
+// o servidor responde 304 ao If-None-Match e o resultado guardado é reaproveitado
+const respostasAnteriores = new Map();
+const MAX_RESPOSTAS_ANTERIORES = 20;
+
+async function detectarCondicional(corpo) {
+    const anterior = respostasAnteriores.get(corpo);
+    const headers = {'Content-Type': 'application/json'};
+    if (anterior) headers['If-None-Match'] = anterior.etag;
+    const response = await fetch('/api/detect', {method: 'POST', headers: headers, body: corpo});
+    if (response.status === 304 && anterior) return anterior.data;
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    respostasAnteriores.delete(corpo);
+    if (data.success && etag) {
+        respostasAnteriores.set(corpo, {etag: etag, data: data});
+        if (respostasAnteriores.size > MAX_RESPOSTAS_ANTERIORES) {
+            respostasAnteriores.delete(respostasAnteriores.keys().next().value);
+        }
+    }
+    return data;
+}
+
+async function analyzeText() {
+    const text = document.getElementById('textInput').value.trim();
+    const resultDiv = document.getElementById('result');
+    const button = document.getElementById('analyzeBtn');
+
+    if (text.length < 20) {
+        resultDiv.innerHTML = '<p style="color: red;">⚠️ Texto muito curto (mínimo 20 caracteres)</p>';
+        return;
+    }
+
+    button.disabled = true;
+    button.textContent = 'Analisando...';
+    resultDiv.innerHTML = '<p>⏳ Analisando texto e identificando padrões suspeitos...</p>';
+
+    try {
+        const data = await detectarCondicional(JSON.stringify({text: text, por_frase: true, formato: 'compacto'}));
+
+        if (data.success) {
+            const result = expandirResultado(text, data.result, data.tipos);
+            const aiProb = Math.round(result.ai_probability * 100);
+            const humanProb = Math.round(result.human_probability * 100);
+            const confidence = Math.round(result.confidence * 100);
+
+            let color = '#64748b';
+            let veredito = 'Indeterminado';
+            if (aiProb > 70) {
+                color = '#ef4444';
+                veredito = 'Provavelmente IA';
+            } else if (humanProb > 70) {
+                color = '#10b981';
+                veredito = 'Provavelmente Humano';
+            }
+
+            let relatorioHTML = gerarRelatorioDetalhado(result);
+
+            resultDiv.innerHTML = `
+                <div style="text-align: center; margin-bottom: 20px;">
+                    <h3 style="color: ${color}">${veredito}</h3>
+                    <p>🤖 Probabilidade de IA: <strong style="font-size: 1.2em;">${aiProb}%</strong></p>
+                    <p>👤 Probabilidade Humana: <strong style="font-size: 1.2em;">${humanProb}%</strong></p>
+                    <p>📊 Confiança da análise: ${confidence}%</p>
+                </div>
+                ${gerarMapaDeCalor(text, result)}
+                ${relatorioHTML}
+            `;
+        } else {
+            resultDiv.innerHTML = `<p style="color: red;">❌ Erro: ${data.error}</p>`;
+        }
+    } catch (error) {
+        resultDiv.innerHTML = '<p style="color: red;">❌ Erro de conexão. Tente novamente.</p>';
+    } finally {
+        button.disabled = false;
+        button.textContent = 'Analisar Texto';
+    }
+}
+
+function escapeHtml(texto) {
+    return texto.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+function escapeAtributo(texto) {
+    return escapeHtml(texto).replace(/"/g, '&quot;').replace(/'/g, '&#x27;');
+}
+
+// As posições da API contam caracteres Unicode; Array.from separa o texto do mesmo jeito
+function trecho(chars, inicio, fim) {
+    return chars.slice(inicio, fim).join('');
+}
+
+function colunasParaLista(colunas) {
+    if (!colunas) return undefined;
+    return colunas.inicio.map((inicio, i) => ({
+        inicio: inicio, fim: colunas.fim[i], ai_probability: colunas.ai_probability[i]
+    }));
+}
+
+function expandirResultado(text, compacto, tipos) {
+    // Reconstrói termo, contexto, justificativa e destaque a partir das posições do formato compacto
+    const chars = Array.from(text);
+    const termos = compacto.termos.inicio.map((inicio, i) => {
+        const fim = compacto.termos.fim[i];
+        const tipo = compacto.termos.tipo[i];
+        const margem = tipos.margem_contexto[tipo];
+        return {
+            termo: trecho(chars, inicio, fim),
+            tipo: tipos.nome[tipo],
+            justificativa: tipos.justificativa[tipo],
+            contexto: trecho(chars, Math.max(0, inicio - margem), Math.min(chars.length, fim + margem)),
+            posicao: [inicio, fim]
+        };
+    });
+    return {
+        ...compacto,
+        termos_suspeitos: termos,
+        texto_destacado: gerarTextoDestacado(chars, termos),
+        frases: colunasParaLista(compacto.frases),
+        paragrafos: colunasParaLista(compacto.paragrafos)
+    };
+}
+
+function gerarTextoDestacado(chars, termos) {
+    // Mesma regra do servidor: termos sobrepostos viram um único span
+    const ordenados = [...termos].sort((a, b) => a.posicao[0] - b.posicao[0] || b.posicao[1] - a.posicao[1]);
+    let html = '';
+    let cursor = 0;
+    let grupo = [];
+    let grupoFim = 0;
+    const renderizarGrupo = () => {
+        const inicio = grupo[0].posicao[0];
+        if (cursor < inicio) html += escapeHtml(trecho(chars, cursor, inicio));
+        const justificativas = [...new Set(grupo.map(t => t.justificativa))];
+        html += `<span class="termo-suspeito" data-tipo="${escapeAtributo(grupo[0].tipo)}" title="${escapeAtributo(justificativas.join(' | '))}">`;
+        html += escapeHtml(trecho(chars, inicio, grupoFim)) + '</span>';
+        cursor = grupoFim;
+    };
+    for (const termo of ordenados) {
+        const [inicio, fim] = termo.posicao;
+        if (grupo.length && inicio < grupoFim) {
+            grupo.push(termo);
+            grupoFim = Math.max(grupoFim, fim);
+            continue;
+        }
+        if (grupo.length) renderizarGrupo();
+        grupo = [termo];
+        grupoFim = fim;
+    }
+    if (grupo.length) renderizarGrupo();
+    return html + escapeHtml(trecho(chars, cursor, chars.length));
+}
+
+function corCalor(prob) {
+    // Verde (humano) a vermelho (IA), mais opaco quanto mais longe de 50%
+    const alfa = (0.15 + Math.abs(prob - 0.5) * 0.9).toFixed(2);
+    return prob >= 0.5 ? `rgba(239, 68, 68, ${alfa})` : `rgba(16, 185, 129, ${alfa})`;
+}
+
+function gerarMapaDeCalor(text, result) {
+    const frases = result.frases || [];
+    if (frases.length === 0) {
+        return '';
+    }
+
+    const chars = Array.from(text);
+    let html = '';
+    let cursor = 0;
+    frases.forEach(frase => {
+        const prob = Math.round(frase.ai_probability * 100);
+        html += escapeHtml(trecho(chars, cursor, frase.inicio));
+        html += `<span class="frase-calor" style="background-color: ${corCalor(frase.ai_probability)}" title="IA: ${prob}%">`;
+        html += escapeHtml(trecho(chars, frase.inicio, frase.fim)) + '</span>';
+        cursor = frase.fim;
+    });
+    html += escapeHtml(trecho(chars, cursor, chars.length));
+
+    const paragrafos = (result.paragrafos || []).map((p, i) =>
+        `<span class="legenda-item">§${i + 1}: ${Math.round(p.ai_probability * 100)}%</span>`
+    ).join('');
+
+    return `
+        <div class="relatorio-termos">
+            <h4>🌡️ Mapa de calor por frase</h4>
+            <div class="legenda">
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: ${corCalor(0.95)};"></div>
+                    <span>Provavelmente IA</span>
+                </div>
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: ${corCalor(0.05)};"></div>
+                    <span>Provavelmente Humano</span>
+                </div>
+                ${paragrafos}
+            </div>
+            <div class="mapa-calor">${html}</div>
+        </div>
+    `;
+}
+
+function gerarRelatorioDetalhado(result) {
+    const termos = result.termos_suspeitos || [];
+
+    if (termos.length === 0) {
+        return `
+            <div class="relatorio-termos">
+                <h4>✅ Nenhum padrão suspeito detectado</h4>
+                <p>O texto não apresenta os padrões típicos de IA analisados.</p>
+            </div>
+        `;
+    }
+
+    // Agrupar termos por tipo
+    const termosPorTipo = {};
+    termos.forEach(termo => {
+        if (!termosPorTipo[termo.tipo]) {
+            termosPorTipo[termo.tipo] = [];
+        }
+        termosPorTipo[termo.tipo].push(termo);
+    });
+
+    // Gerar HTML para cada tipo
+    let tiposHTML = '';
+    for (const [tipo, termosTipo] of Object.entries(termosPorTipo)) {
+        let termosHTML = termosTipo.map(termo => `
+            <div class="termo-item">
+                <strong>"${escapeHtml(termo.termo)}"</strong> - ${termo.justificativa}
+                <br><small>Contexto: "...${escapeHtml(termo.contexto)}..."</small>
+            </div>
+        `).join('');
+
+        const tipoLabel = {
+            'expressao_formal': 'Expressões Formais',
+            'conectivo_complexo': 'Conectivos Complexos',
+            'voz_passiva': 'Voz Passiva',
+            'superlativo': 'Superlativos'
+        }[tipo] || tipo;
+
+        tiposHTML += `
+            <div class="tipo-termo">
+                <h5>${tipoLabel} (${termosTipo.length} ocorrências)</h5>
+                ${termosHTML}
+            </div>
+        `;
+    }
+
+    return `
+        <div class="relatorio-termos">
+            <h4>🔍 Relatório de Análise Detalhada</h4>
+            <p><strong>${termos.length} termos/padrões suspeitos detectados</strong></p>
+
+            <div class="legenda">
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: #fef2f2; border: 1px solid #ef4444;"></div>
+                    <span>Expressões Formais</span>
+                </div>
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: #faf5ff; border: 1px solid #8b5cf6;"></div>
+                    <span>Conectivos Complexos</span>
+                </div>
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: #ecfeff; border: 1px solid #06b6d4;"></div>
+                    <span>Voz Passiva</span>
+                </div>
+                <div class="legenda-item">
+                    <div class="legenda-cor" style="background-color: #fffbeb; border: 1px solid #f59e0b;"></div>
+                    <span>Superlativos</span>
+                </div>
+            </div>
+
+            <div class="texto-destacado">
+                <h5>Texto com termos destacados:</h5>
+                <div>${result.texto_destacado}</div>
+            </div>
+
+            <div style="margin-top: 20px;">
+                <h5>📋 Detalhamento dos padrões detectados:</h5>
+                ${tiposHTML}
+            </div>
+        </div>
+    `;
+}
+
+// Exemplo de texto para teste
+document.getElementById('textInput').value = `É importante destacar que a implementação de estratégias eficazes requer uma abordagem sistemática e coordenada. Considerando os fatores mencionados anteriormente, pode-se inferir que a solução proposta apresenta viabilidade técnica e operacional. Observa-se que os resultados obtidos são extremamente significativos e demonstram claramente a eficácia da metodologia empregada.
+
+Por outro lado, quando fui ao mercado hoje, o padeiro foi muito simpático comigo. Ele me deu um café e a gente conversou um pouco sobre o time de futebol. Achei bem legal isso, sabe?`;
+
+document.getElementById('textInput').dispatchEvent(new Event('input'));
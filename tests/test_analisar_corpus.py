@@ -0,0 +1,87 @@
+import argparse
+import json
+
+import numpy as np
+import pytest
+
+import analisar_corpus
+from analisar_corpus import EscritorColunas, EscritorJsonl, analisar, ler_colunas
+
+N_DOCUMENTOS = 23
+
+
+def _entrada(tmp_path):
+    caminho = tmp_path / 'corpus.jsonl'
+    with open(caminho, 'w', encoding='utf-8') as f:
+        for i in range(N_DOCUMENTOS):
+            texto = f'Documento {i}: é importante ressaltar que o texto {i} serve de teste para a retomada.'
+            f.write(json.dumps({'id': f'doc{i}', 'text': texto}, ensure_ascii=False) + '\n')
+    return str(caminho)
+
+
+def _args(entrada, saida, formato):
+    return argparse.Namespace(
+        entrada=entrada, saida=saida, formato=formato, termos=False, modelo='nao_existe.pkl',
+        jobs=1, bloco=4, extensao='.txt', checkpoint=0.0, do_zero=False
+    )
+
+
+def _ids(saida, formato):
+    if formato == 'colunas':
+        return ler_colunas(saida)['ids']
+    with open(saida, encoding='utf-8') as f:
+        return [json.loads(linha)['id'] for linha in f]
+
+
+@pytest.mark.parametrize('formato, escritor', [('jsonl', EscritorJsonl), ('colunas', EscritorColunas)])
+def test_interrupcao_entre_gravar_e_registrar_nao_duplica_bloco(tmp_path, monkeypatch, formato, escritor):
+    entrada = _entrada(tmp_path)
+    saida = str(tmp_path / ('saida.jsonl' if formato == 'jsonl' else 'saida'))
+    escrever = escritor.escrever
+    chamadas = []
+
+    def escrever_e_interromper(self, registros):
+        # O bloco vai para o disco e o Ctrl+C chega antes do progresso ser atualizado
+        escrever(self, registros)
+        chamadas.append(len(registros))
+        if len(chamadas) == 3:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(escritor, 'escrever', escrever_e_interromper)
+    with pytest.raises(SystemExit) as saiu:
+        analisar(_args(entrada, saida, formato))
+    assert saiu.value.code == 130
+    with open(f'{saida}.checkpoint.json') as f:
+        assert json.load(f)['documentos'] == 8
+
+    monkeypatch.setattr(escritor, 'escrever', escrever)
+    analisar(_args(entrada, saida, formato))
+    assert _ids(saida, formato) == [f'doc{i}' for i in range(N_DOCUMENTOS)]
+
+    referencia = str(tmp_path / ('referencia.jsonl' if formato == 'jsonl' else 'referencia'))
+    analisar(_args(entrada, referencia, formato))
+    if formato == 'colunas':
+        obtido, esperado = ler_colunas(saida), ler_colunas(referencia)
+        for nome in esperado:
+            np.testing.assert_array_equal(obtido[nome], esperado[nome])
+    else:
+        with open(saida, 'rb') as a, open(referencia, 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_checkpoint_periodico_acompanha_a_saida(tmp_path, monkeypatch):
+    entrada = _entrada(tmp_path)
+    saida = str(tmp_path / 'saida.jsonl')
+    gravados = []
+    gravar = analisar_corpus.gravar_checkpoint
+
+    def gravar_e_conferir(caminho, checkpoint):
+        gravar(caminho, checkpoint)
+        with open(saida, 'rb') as f:
+            conteudo = f.read(checkpoint['tamanhos'][saida])
+        gravados.append((checkpoint['documentos'], conteudo.count(b'\n')))
+
+    monkeypatch.setattr(analisar_corpus, 'gravar_checkpoint', gravar_e_conferir)
+    analisar(_args(entrada, saida, 'jsonl'))
+    assert gravados and all(documentos == linhas for documentos, linhas in gravados)
+    assert gravados[-1][0] == N_DOCUMENTOS
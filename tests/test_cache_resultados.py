@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import cache_resultados
+from cache_resultados import CacheResultados
+
+
+def test_chave_aceita_surrogate_solto():
+    chave = CacheResultados.chave('texto com \ud800 solto', 'v1')
+    assert chave != CacheResultados.chave('texto com  solto', 'v1')
+    assert chave == CacheResultados.chave('texto com \ud800 solto', 'v1')
+
+
+def test_detect_com_surrogate_solto_nao_da_500():
+    import app
+    cliente = app.app.test_client()
+    resposta = cliente.post('/api/detect', json={'text': 'Um texto suficientemente longo com \ud800 no meio.'})
+    assert resposta.status_code == 200
+    assert resposta.get_json()['success']
+
+
+def test_sqlite_indisponivel_usa_so_a_memoria(tmp_path):
+    corrompido = tmp_path / 'cache.db'
+    corrompido.write_bytes(b'isto nao e um banco sqlite' * 100)
+    for caminho in (str(corrompido), str(tmp_path / 'nao_existe' / 'cache.db')):
+        cache = CacheResultados(caminho_sqlite=caminho)
+        chave = cache.chave('texto', 'v1')
+        assert cache.obter(chave) is None
+        cache.guardar(chave, {'ok': True}, 'v1')
+        assert cache.obter(chave) == {'ok': True}
+        assert 'compartilhado' not in cache.estatisticas()
+        cache.limpar_versoes_antigas('v2')
+
+
+def test_surrogate_solto_com_sqlite(tmp_path):
+    cache = CacheResultados(caminho_sqlite=str(tmp_path / 'cache.db'))
+    chave = cache.chave('a \ud800', 'v1')
+    cache.guardar(chave, {'texto': 'a \ud800'}, 'v1')
+    assert cache.obter(chave) == {'texto': 'a \ud800'}
+
+
+def test_limite_de_memoria_em_bytes_utf8():
+    resultado = {'texto': 'ação é útil' * 20}
+    tamanho = len(json.dumps(resultado, ensure_ascii=False).encode('utf-8'))
+    assert tamanho > len(json.dumps(resultado, ensure_ascii=False))
+    cache = CacheResultados(max_bytes=tamanho)
+    cache.guardar('a', resultado)
+    assert cache.estatisticas()['bytes_memoria'] == tamanho
+    cache.guardar('b', resultado)
+    assert cache.obter('a') is None
+    assert cache.estatisticas()['bytes_memoria'] == tamanho
+    # Um valor que cabe em caracteres mas não em bytes não entra
+    pequeno = CacheResultados(max_bytes=tamanho - 1)
+    pequeno.guardar('a', resultado)
+    assert pequeno.obter('a') is None
+
+
+def _total_real(caminho):
+    with sqlite3.connect(caminho) as conexao:
+        return conexao.execute('SELECT COALESCE(SUM(tamanho), 0) FROM resultados').fetchone()[0]
+
+
+def test_total_de_bytes_compartilhado_acompanha_as_escritas(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'cache.db')
+    agora = [1000.0]
+    monkeypatch.setattr(cache_resultados.time, 'time', lambda: agora[0])
+    cache = CacheResultados(max_itens=0, caminho_sqlite=caminho, max_bytes_sqlite=2000, ttl=100)
+
+    def total():
+        return cache.estatisticas()['compartilhado']['bytes']
+
+    for i in range(40):
+        cache.guardar(f'k{i}', {'texto': 'ção' * (i % 7 + 5)}, 'v1' if i % 2 else 'v2')
+        assert total() == _total_real(caminho) <= 2000
+    # Substituição da mesma chave
+    cache.guardar('k39', {'texto': 'outro'}, 'v1')
+    assert total() == _total_real(caminho)
+    cache.limpar_versoes_antigas('v1')
+    assert total() == _total_real(caminho) > 0
+    # Expiração na leitura e na escrita seguinte
+    agora[0] += 200
+    assert cache.obter('k39') is None
+    assert total() == _total_real(caminho)
+    cache.guardar('novo', {'texto': 'x'}, 'v1')
+    assert total() == _total_real(caminho) == len(json.dumps({'texto': 'x'}).encode('utf-8'))
+
+
+def test_total_de_bytes_de_arquivo_antigo(tmp_path):
+    caminho = str(tmp_path / 'cache.db')
+    cache = CacheResultados(max_itens=0, caminho_sqlite=caminho)
+    cache.guardar('a', {'texto': 'ação'}, 'v1')
+    with sqlite3.connect(caminho) as conexao:
+        conexao.execute("DELETE FROM contadores WHERE nome = 'bytes'")
+    novo = CacheResultados(max_itens=0, caminho_sqlite=caminho)
+    assert novo.estatisticas()['compartilhado']['bytes'] == _total_real(caminho) > 0
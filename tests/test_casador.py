@@ -0,0 +1,83 @@
+import random
+import re
+
+import pytest
+
+from analise import ContextoAnalise
+from app import AIDetectorComRelatorio
+from casador import CasadorPadroes
+
+detector = AIDetectorComRelatorio(carregar_modelo=False)
+LEXICOS = detector.lexicos.atual().lexicos
+
+
+def termos_por_padrao(texto, lexico):
+    """O laço original: um re.finditer por padrão, categoria a categoria"""
+    texto_lower = texto.lower()
+    termos = []
+    for categoria, regra in detector.regras_padroes.items():
+        for frase in lexico.padroes_ia.get(categoria, []):
+            padrao = r'\b' + frase + r'\b' if regra['fronteira_palavra'] else frase
+            for match in re.finditer(padrao, texto_lower):
+                start, end = match.span()
+                margem = regra['margem_contexto']
+                termos.append({
+                    'termo': texto[start:end],
+                    'tipo': regra['tipo'],
+                    'justificativa': regra['justificativa'],
+                    'contexto': texto[max(0, start-margem):min(len(texto), end+margem)],
+                    'posicao': (start, end)
+                })
+    return termos
+
+
+def _bordas(frase):
+    """Sufixos da frase que também são prefixos: repetir a frase a partir deles cria sobreposição"""
+    return [k for k in range(1, len(frase)) if frase[:k] == frase[-k:]]
+
+
+def textos_de_teste(lexico):
+    frases = [frase for frases in lexico.padroes_ia.values() for frase in frases]
+    return [
+        # Cada frase isolada, com maiúsculas
+        '. '.join(frase.capitalize() for frase in frases) + '.',
+        # Frases coladas: prefixos umas das outras, sobreposições entre padrões e fronteiras que falham
+        ''.join(frases),
+        ' '.join(frases),
+        # A mesma frase sobreposta a si mesma
+        ' '.join(frase + frase[k:] for frase in frases for k in _bordas(frase)),
+        # Dentro de palavras maiores
+        ' '.join(f'x{frase}x super{frase} {frase}mente' for frase in frases),
+        'É importante ressaltar que, significativamente, é fundamental destacar que foi realizado um estudo '
+        'extremamente relevante. Além disso, no entanto, portanto, foi observado que foram analisados.',
+        'İstanbul é importante ressaltar ÉÉ importante',
+        ''
+    ]
+
+
+@pytest.mark.parametrize('idioma', sorted(LEXICOS))
+def test_casador_igual_ao_finditer_por_padrao(idioma):
+    lexico = LEXICOS[idioma]
+    for texto in textos_de_teste(lexico):
+        obtido = detector.analisar_termos_suspeitos(texto, ContextoAnalise(texto, lexico))
+        assert obtido == termos_por_padrao(texto, lexico), texto[:80]
+
+
+def test_casador_com_padroes_sobrepostos_aleatorios():
+    padroes = {
+        'livre': ['ab', 'abc', 'bc', 'aba', 'a a', 'b'],
+        'fronteira': ['b', 'abc', 'c a', 'aa', 'ab']
+    }
+    casador = CasadorPadroes(padroes, ['fronteira'])
+    gerador = random.Random(7)
+    for _ in range(300):
+        texto = ''.join(gerador.choice('abc ') for _ in range(gerador.randint(0, 40)))
+        esperado = sorted(
+            (match.start(), match.end(), categoria, indice)
+            for categoria, frases in padroes.items()
+            for indice, frase in enumerate(frases)
+            for match in re.finditer(r'\b' + re.escape(frase) + r'\b' if categoria == 'fronteira' else re.escape(frase), texto)
+        )
+        obtido = list(casador.encontrar(texto))
+        assert [o[0] for o in obtido] == sorted(o[0] for o in obtido)
+        assert sorted(obtido) == esperado, texto
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from floresta import FlorestaCompilada, amostras_de_paridade, verificar_paridade
+
+
+def _modelo(semente=0):
+    gerador = np.random.default_rng(semente)
+    X = gerador.normal(size=(400, 8))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + gerador.normal(scale=0.5, size=400) > 0).astype(int)
+    return RandomForestClassifier(n_estimators=15, max_depth=8, random_state=semente).fit(X, y)
+
+
+def _amostras(floresta):
+    # Linhas sobre os thresholds (onde float32 e float64 poderiam divergir) e linhas comuns
+    return np.vstack([amostras_de_paridade(floresta, n=300), np.random.default_rng(1).normal(size=(200, 8)) * 3])
+
+
+def test_paridade_em_lote_e_por_linha():
+    modelo = _modelo()
+    floresta = FlorestaCompilada(modelo)
+    X = _amostras(floresta)
+    np.testing.assert_allclose(floresta.predict_proba(X), modelo.predict_proba(X), rtol=0, atol=1e-12)
+    assert verificar_paridade(modelo, floresta, X)
+    for linha in X[:50]:
+        np.testing.assert_allclose(floresta.predict_proba(linha), modelo.predict_proba(linha[np.newaxis, :]), rtol=0, atol=1e-12)
+
+
+def test_paridade_depois_de_salvar_e_abrir_por_mmap(tmp_path):
+    modelo = _modelo(semente=3)
+    FlorestaCompilada(modelo).salvar(str(tmp_path / 'floresta'))
+    carregada = FlorestaCompilada.carregar(str(tmp_path / 'floresta'))
+    assert isinstance(carregada.threshold, np.memmap)
+    X = _amostras(carregada)
+    np.testing.assert_allclose(carregada.predict_proba(X), modelo.predict_proba(X), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(carregada.predict_proba(X[0]), modelo.predict_proba(X[:1]), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(carregada.classes_, modelo.classes_)
+
+
+def test_features_erradas():
+    floresta = FlorestaCompilada(_modelo())
+    with pytest.raises(ValueError):
+        floresta.predict_proba(np.zeros((2, 5)))
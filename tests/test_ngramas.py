@@ -0,0 +1,29 @@
+import numpy as np
+
+from construir_ngramas import contar_bloco, salvar_tabelas
+from ngramas import NOMES_FEATURES_NGRAMAS, TabelasNgramas
+
+TEXTOS = ['o gato subiu no telhado. o cachorro ficou no quintal.', 'o gato dormiu no sofá da sala.']
+
+
+def _tabelas(diretorio, **metadados):
+    unigramas, bigramas = contar_bloco(TEXTOS)
+    salvar_tabelas(str(diretorio), (*unigramas, *bigramas),
+                   {'total_unigramas': int(unigramas[1].sum()), **metadados})
+    return TabelasNgramas(str(diretorio))
+
+
+def test_tabelas_sem_idioma_sao_do_portugues(tmp_path):
+    assert _tabelas(tmp_path / 'ng').idioma == 'pt'
+    assert _tabelas(tmp_path / 'en', idioma='en').idioma == 'en'
+
+
+def test_features_neutras(tmp_path):
+    tabelas = _tabelas(tmp_path / 'ng')
+    neutras = tabelas.features_neutras
+    assert list(neutras) == list(NOMES_FEATURES_NGRAMAS)
+    contagens = tabelas.unigramas_contagens
+    probabilidades = (contagens + 1) / (tabelas.total_unigramas + tabelas.vocabulario + 1)
+    esperada = -np.sum(contagens / tabelas.total_unigramas * np.log(probabilidades))
+    assert np.isclose(neutras['log_perplexidade'], esperada)
+    assert neutras['explosividade'] == 0.0 and neutras['fracao_desconhecidas'] == 0.0
@@ -0,0 +1,85 @@
+import numpy as np
+
+from analise import ContextoAnalise
+from quase_duplicatas import IndiceQuaseDuplicatas, assinatura_minhash
+
+TEXTO = ' '.join(f'palavra{i} do texto de teste' for i in range(80))
+
+
+def test_sqlite_indisponivel_vira_nenhuma_quase_duplicata(tmp_path):
+    corrompido = tmp_path / 'indice.db'
+    corrompido.write_bytes(b'isto nao e um banco sqlite' * 100)
+    assinatura = assinatura_minhash(ContextoAnalise(TEXTO))
+    for caminho in (str(corrompido), str(tmp_path / 'nao_existe' / 'indice.db')):
+        indice = IndiceQuaseDuplicatas(caminho)
+        indice.adicionar(TEXTO, assinatura, [], 'v1')
+        assert indice.buscar(assinatura, 'v1') is None
+        assert indice.estatisticas()['indisponivel']
+        indice.limpar_versoes_antigas(['v1'])
+
+
+def test_surrogate_solto_no_indice(tmp_path):
+    indice = IndiceQuaseDuplicatas(str(tmp_path / 'indice.db'))
+    texto = TEXTO + ' \ud800'
+    assinatura = assinatura_minhash(ContextoAnalise(texto))
+    indice.adicionar(texto, assinatura, [(0, 8, 'expressoes_formais', 0)], 'v1')
+    encontrado = indice.buscar(assinatura, 'v1')
+    assert encontrado['texto'] == texto
+    assert encontrado['ocorrencias'] == [(0, 8, 'expressoes_formais', 0)]
+    assert np.isclose(encontrado['similaridade'], 1.0)
+
+
+def test_totais_acompanham_gravacoes_e_remocoes(tmp_path):
+    indice = IndiceQuaseDuplicatas(str(tmp_path / 'indice.db'), max_entradas=3)
+    for i in range(5):
+        texto = f'{TEXTO} variante{i}'
+        indice.adicionar(texto, assinatura_minhash(ContextoAnalise(texto)), [], 'v1', (0.5, 0.6))
+    conexao = indice._conectar()
+    entradas, tamanho = conexao.execute('SELECT COUNT(*), SUM(tamanho) FROM entradas').fetchone()
+    assert entradas == 3
+    assert indice.estatisticas() == {'entradas': 3, 'bytes': tamanho, 'limiar': indice.limiar}
+    indice.limpar_versoes_antigas(['v2'])
+    assert indice.estatisticas()['entradas'] == 0
+
+
+def test_decisao_guardada_e_indice_antigo_sem_ela(tmp_path):
+    import sqlite3
+    caminho = str(tmp_path / 'indice.db')
+    # Índice gravado antes das colunas de decisão e da tabela de totais
+    antigo = sqlite3.connect(caminho)
+    antigo.execute('CREATE TABLE entradas (id INTEGER PRIMARY KEY AUTOINCREMENT, chave TEXT NOT NULL, versao TEXT NOT NULL, '
+                   'assinatura BLOB NOT NULL, texto BLOB NOT NULL, ocorrencias BLOB NOT NULL, '
+                   'criado REAL NOT NULL, acessado REAL NOT NULL, tamanho INTEGER NOT NULL)')
+    antigo.commit()
+    antigo.close()
+
+    indice = IndiceQuaseDuplicatas(caminho)
+    assinatura = assinatura_minhash(ContextoAnalise(TEXTO))
+    indice.adicionar(TEXTO, assinatura, [], 'v1', (0.812, 0.81))
+    assert indice.buscar(assinatura, 'v1')['decisao'] == (0.812, 0.81)
+    outro = TEXTO + ' sem decisao'
+    indice.adicionar(outro, assinatura_minhash(ContextoAnalise(outro)), [], 'v2')
+    assert indice.buscar(assinatura_minhash(ContextoAnalise(outro)), 'v2')['decisao'] is None
+    assert indice.estatisticas()['entradas'] == 2
+
+
+def test_quase_copia_reaproveita_a_decisao(tmp_path, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'quase_duplicatas', IndiceQuaseDuplicatas(str(tmp_path / 'indice.db')))
+    original = ' '.join(f'Além disso, é importante ressaltar que o parágrafo {i} serve de teste.' for i in range(60))
+    copia = original.replace('parágrafo 30 serve de teste', 'parágrafo 30 serve de exemplo')
+
+    primeiro = app.predict_com_quase_duplicatas(original)
+    assert 'quase_duplicata' not in primeiro
+    resultado = app.predict_com_quase_duplicatas(copia)
+    assert resultado['quase_duplicata']['reanalise'] == 'aproximada'
+    assert resultado['ai_probability'] == primeiro['ai_probability']
+    # Termos, destaque e contagens são os do texto novo
+    completo = app.detector.predict(copia)
+    for campo in ('termos_suspeitos', 'texto_destacado', 'estatisticas_deteccao', 'text_analyzed_length'):
+        assert resultado[campo] == completo[campo]
+
+    monkeypatch.setattr(app.quase_duplicatas, 'aproximar', False)
+    exato = app.predict_com_quase_duplicatas(copia)
+    assert exato['quase_duplicata']['reanalise'] == 'parcial'
+    assert {k: v for k, v in exato.items() if k != 'quase_duplicata'} == completo
@@ -0,0 +1,98 @@
+import pytest
+
+import app as servidor
+from sessoes import DocumentoIncremental
+
+TEXTO = ' '.join(
+    f'É importante ressaltar que o parágrafo {i} aborda diversos aspectos do tema. '
+    f'Além disso, vale destacar que a gente achou isso legal demais, né?'
+    for i in range(12)
+)
+
+EDICOES = [
+    # Troca no meio de uma frase
+    [{'inicio': 10, 'fim': 20, 'texto': 'fundamental observar'}],
+    # Apaga uma frase inteira e junta as vizinhas
+    [{'inicio': 76, 'fim': 143, 'texto': ''}],
+    # Insere frases novas no começo e no fim, na mesma chamada
+    [{'inicio': 0, 'fim': 0, 'texto': 'Em suma, portanto, o texto começa aqui. '},
+     {'inicio': 0, 'fim': 0, 'texto': 'Outra frase. '}],
+    # Edição que atravessa o limite de duas frases
+    [{'inicio': 60, 'fim': 90, 'texto': 'e termina. Depois disso'}],
+]
+
+
+def _aplicar(texto, edicoes):
+    for edicao in edicoes:
+        texto = texto[:edicao['inicio']] + edicao['texto'] + texto[edicao['fim']:]
+    return texto
+
+
+def test_edicoes_incrementais_igualam_predict_por_frase():
+    detector = servidor.detector
+    documento = DocumentoIncremental(detector, TEXTO)
+    texto = TEXTO
+    assert documento.resultado_completo() == detector.predict(texto, por_frase=True)
+    for edicoes in EDICOES + [None]:
+        # A última troca o fim do texto, seja qual for o tamanho depois das anteriores
+        edicoes = edicoes or [{'inicio': len(texto) - 5, 'fim': len(texto), 'texto': ' fim.'}]
+        inicio, fim = documento.aplicar(edicoes)
+        texto = _aplicar(texto, edicoes)
+        assert documento.texto == texto
+        assert 0 <= inicio <= fim <= len(texto)
+        assert documento.resultado_completo() == detector.predict(texto, por_frase=True)
+
+
+def test_edicao_invalida_nao_altera_o_documento():
+    documento = DocumentoIncremental(servidor.detector, TEXTO)
+    with pytest.raises(ValueError):
+        documento.aplicar([{'inicio': 0, 'fim': 5, 'texto': 'x'}, {'inicio': 0, 'fim': len(TEXTO) + 10, 'texto': ''}])
+    assert documento.texto == TEXTO
+    assert documento.versao == 0
+
+
+@pytest.fixture
+def cliente():
+    servidor.app.config['TESTING'] = True
+    return servidor.app.test_client()
+
+
+def test_sessao_pela_api_e_conflito_de_versao(cliente):
+    resposta = cliente.post('/api/sessoes', json={'text': TEXTO})
+    assert resposta.status_code == 201
+    sessao, versao = resposta.get_json()['sessao'], resposta.get_json()['versao']
+
+    edicao = {'inicio': 10, 'fim': 20, 'texto': 'fundamental observar'}
+    resposta = cliente.post(f'/api/sessoes/{sessao}/edicoes', json={'edicoes': [edicao], 'versao': versao})
+    assert resposta.status_code == 200
+    assert resposta.get_json()['versao'] == versao + 1
+
+    # Um segundo cliente com a versão antiga não sobrescreve a edição
+    resposta = cliente.post(f'/api/sessoes/{sessao}/edicoes', json={'edicoes': [edicao], 'versao': versao})
+    assert resposta.status_code == 409
+    assert resposta.get_json()['versao'] == versao + 1
+
+    resposta = cliente.get(f'/api/sessoes/{sessao}')
+    texto = _aplicar(TEXTO, [edicao])
+    assert resposta.get_json()['text'] == texto
+    assert resposta.get_json()['result'] == servidor.detector.predict(texto, por_frase=True)
+    assert cliente.delete(f'/api/sessoes/{sessao}').status_code == 200
+
+
+def test_erro_inesperado_na_sessao_vira_json_500(cliente, monkeypatch):
+    sessao = cliente.post('/api/sessoes', json={'text': TEXTO}).get_json()['sessao']
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError('falha simulada')
+
+    monkeypatch.setattr(DocumentoIncremental, 'resultado_completo', falhar)
+    monkeypatch.setattr(DocumentoIncremental, 'resultado_trecho', falhar)
+    respostas = [
+        cliente.post('/api/sessoes', json={'text': TEXTO}),
+        cliente.post(f'/api/sessoes/{sessao}/edicoes', json={'edicoes': [{'inicio': 0, 'fim': 0, 'texto': 'A'}]}),
+        cliente.get(f'/api/sessoes/{sessao}')
+    ]
+    for resposta in respostas:
+        assert resposta.status_code == 500
+        assert resposta.is_json
+        assert 'falha simulada' in resposta.get_json()['error']
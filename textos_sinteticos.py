@@ -0,0 +1,50 @@
+"""Textos sintéticos em português para o benchmark e o teste de carga.
+
+Não importa o app: o gerador de carga só precisa dos padrões do léxico, lidos
+direto do JSON, sem carregar Flask, modelo ou caches.
+"""
+import functools
+import json
+import os
+import random
+
+PALAVRAS_NEUTRAS = (
+    'o a os as um uma de do da em no na para com por que se mais muito quando depois antes '
+    'escola aluno professor cidade governo projeto pesquisa dados resultado tempo ano dia '
+    'trabalho sistema processo forma parte grupo caso ponto problema questão exemplo lugar '
+    'fez tem era foi vai pode deve está estava ficou disse achou viu levou trouxe começou '
+    'grande pequeno novo antigo bom ruim melhor importante simples claro longo rápido'
+).split()
+PALAVRAS_INFORMAIS = 'tipo assim ok bem acho tá né cara legal massa demais'.split()
+
+
+@functools.lru_cache(maxsize=None)
+def padroes_do_lexico():
+    """Padrões de IA do léxico do idioma padrão (LEXICOS_DIR e LEXICO_PADRAO, como no app)"""
+    diretorio = os.environ.get('LEXICOS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicos')
+    with open(os.path.join(diretorio, f"{os.environ.get('LEXICO_PADRAO', 'pt')}.json"), encoding='utf-8') as f:
+        dados = json.load(f)
+    return tuple(frase.lower() for frases in dados['padroes_ia'].values() for frase in frases)
+
+
+def gerar_texto(n_palavras, densidade, semente):
+    """Texto em português com uma fração `densidade` de posições ocupadas por padrões de IA"""
+    rng = random.Random(semente)
+    padroes = padroes_do_lexico()
+    frases, frase = [], []
+    for _ in range(n_palavras):
+        sorteio = rng.random()
+        if sorteio < densidade:
+            frase.append(rng.choice(padroes))
+        elif sorteio < densidade + 0.03:
+            frase.append(rng.choice(PALAVRAS_INFORMAIS))
+        else:
+            frase.append(rng.choice(PALAVRAS_NEUTRAS))
+        if len(frase) >= rng.randint(8, 25):
+            texto = ' '.join(frase)
+            frases.append(texto[0].upper() + texto[1:] + rng.choice('..!?'))
+            frase = []
+    if frase:
+        texto = ' '.join(frase)
+        frases.append(texto[0].upper() + texto[1:] + '.')
+    return ' '.join(frases)
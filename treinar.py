@@ -0,0 +1,235 @@
+"""Treina o modelo offline e grava o artefato lido pelo app.
+
+Uso:
+    python treinar.py                                # conjunto de exemplos embutido
+    python treinar.py --corpus corpus.jsonl --jobs 8 # corpus rotulado (JSONL ou CSV)
+    python treinar.py --corpus corpus.jsonl --ngramas ngramas/  # com as features de n-gramas
+
+O corpus é lido em streaming, as features são extraídas em paralelo com
+`extrair_features` e gravadas em disco; um novo treino com o mesmo corpus e o
+mesmo léxico reaproveita a matriz gravada sem recalcular nada.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+
+from app import AIDetectorComRelatorio, CAMINHO_MODELO
+from ngramas import TabelasNgramas
+
+CAMPOS_TEXTO = ('text', 'texto')
+CAMPOS_ROTULO = ('label', 'rotulo', 'ia')
+ROTULOS = {
+    '1': 1, 'ia': 1, 'ai': 1, 'true': 1, 'sim': 1,
+    '0': 0, 'humano': 0, 'human': 0, 'false': 0, 'nao': 0, 'não': 0
+}
+
+_detector_worker = None
+
+
+def ler_corpus(caminho):
+    """Gera (texto, rótulo) de um arquivo JSONL ou CSV sem carregá-lo inteiro"""
+    if caminho.endswith('.csv'):
+        csv.field_size_limit(sys.maxsize)
+        with open(caminho, newline='', encoding='utf-8') as f:
+            for registro in csv.DictReader(f):
+                yield from _par_texto_rotulo(registro)
+    else:
+        with open(caminho, encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    yield from _par_texto_rotulo(json.loads(linha))
+
+
+def _par_texto_rotulo(registro):
+    texto = next((registro[c] for c in CAMPOS_TEXTO if registro.get(c)), None)
+    rotulo = next((registro[c] for c in CAMPOS_ROTULO if registro.get(c) is not None), None)
+    if texto is None or rotulo is None:
+        return
+    rotulo = ROTULOS.get(str(rotulo).strip().lower())
+    if rotulo is not None:
+        yield texto, rotulo
+
+
+def _em_blocos(iteravel, tamanho):
+    bloco = []
+    for item in iteravel:
+        bloco.append(item)
+        if len(bloco) == tamanho:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+
+def _iniciar_worker(diretorio_ngramas):
+    global _detector_worker
+    _detector_worker = AIDetectorComRelatorio(carregar_modelo=False)
+    _detector_worker.ngramas = TabelasNgramas(diretorio_ngramas) if diretorio_ngramas else None
+
+
+def _extrair(texto):
+    return list(_detector_worker.extrair_features(texto).values())
+
+
+def chave_cache(caminho_corpus, detector):
+    h = hashlib.sha256()
+    with open(caminho_corpus, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    h.update(detector.versao_lexico.encode('utf-8'))
+    h.update(json.dumps(list(detector.extrair_features('').keys())).encode('utf-8'))
+    if detector.ngramas is not None:
+        h.update(detector.ngramas.versao.encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def extrair_matriz(caminho_corpus, detector, diretorio_cache, jobs, tamanho_bloco):
+    """Retorna (X, y) como memmaps; a memória usada não depende do tamanho do corpus"""
+    os.makedirs(diretorio_cache, exist_ok=True)
+    chave = chave_cache(caminho_corpus, detector)
+    base = os.path.join(diretorio_cache, chave)
+    n_features = len(detector.extrair_features(''))
+
+    if os.path.exists(f'{base}.json'):
+        with open(f'{base}.json') as f:
+            n_linhas = json.load(f)['linhas']
+        print(f"♻️  Reaproveitando {n_linhas} linhas de features de {base}.*")
+    else:
+        inicio = time.perf_counter()
+        n_linhas = 0
+        sufixo = f'.tmp-{os.getpid()}'
+        with open(f'{base}.X{sufixo}', 'wb') as arquivo_X, open(f'{base}.y{sufixo}', 'wb') as arquivo_y, \
+                ProcessPoolExecutor(max_workers=jobs, initializer=_iniciar_worker,
+                                    initargs=(detector.ngramas.diretorio if detector.ngramas is not None else None,)) as pool:
+            for bloco in _em_blocos(ler_corpus(caminho_corpus), tamanho_bloco):
+                textos = [texto for texto, _ in bloco]
+                linhas = list(pool.map(_extrair, textos, chunksize=max(1, len(textos) // (jobs * 4))))
+                np.asarray(linhas, dtype=np.float64).tofile(arquivo_X)
+                np.asarray([rotulo for _, rotulo in bloco], dtype=np.int8).tofile(arquivo_y)
+                n_linhas += len(bloco)
+                decorrido = time.perf_counter() - inicio
+                print(f"⚙️  {n_linhas} textos ({n_linhas / decorrido:.0f}/s)", flush=True)
+        os.replace(f'{base}.X{sufixo}', f'{base}.X.f64')
+        os.replace(f'{base}.y{sufixo}', f'{base}.y.i8')
+        with open(f'{base}.json', 'w') as f:
+            json.dump({'linhas': n_linhas, 'features': n_features, 'corpus': os.path.abspath(caminho_corpus)}, f)
+
+    if n_linhas == 0:
+        raise SystemExit('Corpus sem nenhum texto rotulado')
+    X = np.memmap(f'{base}.X.f64', dtype=np.float64, mode='r', shape=(n_linhas, n_features))
+    y = np.memmap(f'{base}.y.i8', dtype=np.int8, mode='r', shape=(n_linhas,))
+    return X, y, chave
+
+
+def separar_validacao(n_linhas, fracao, semente):
+    embaralhado = np.random.default_rng(semente).permutation(n_linhas)
+    n_validacao = int(round(n_linhas * fracao))
+    return np.sort(embaralhado[n_validacao:]), np.sort(embaralhado[:n_validacao])
+
+
+def copiar_linhas(X, indices, caminho, tamanho_bloco):
+    """Copia as linhas `indices` de X, em blocos, para um memmap float32 contíguo em `caminho`.
+
+    O fit e o predict_proba do sklearn convertem X para float32; com as linhas já
+    contíguas e nesse tipo, eles leem o memmap direto em vez de copiar a matriz para
+    a memória, como X[indices] faria.
+    """
+    saida = np.memmap(caminho, dtype=np.float32, mode='w+', shape=(len(indices), X.shape[1]))
+    for inicio in range(0, len(indices), tamanho_bloco):
+        saida[inicio:inicio + tamanho_bloco] = X[indices[inicio:inicio + tamanho_bloco]]
+    saida.flush()
+    return saida
+
+
+def avaliar(modelo, X, y):
+    proba = modelo.predict_proba(X)[:, list(modelo.classes_).index(1)]
+    previsto = (proba >= 0.5).astype(int)
+    metricas = {
+        'amostras': int(len(y)),
+        'acuracia': float(accuracy_score(y, previsto)),
+        'precisao': float(precision_score(y, previsto, zero_division=0)),
+        'revocacao': float(recall_score(y, previsto, zero_division=0)),
+        'f1': float(f1_score(y, previsto, zero_division=0))
+    }
+    if len(set(y.tolist())) == 2:
+        metricas['roc_auc'] = float(roc_auc_score(y, proba))
+    return metricas
+
+
+def treinar_corpus(detector, args):
+    X, y, chave = extrair_matriz(args.corpus, detector, args.cache_dir, args.jobs, args.bloco)
+    treino, validacao = separar_validacao(len(y), args.validacao, args.semente)
+    base = os.path.join(args.cache_dir, f'{chave}.{os.getpid()}')
+    X_treino = copiar_linhas(X, treino, f'{base}.treino.f32', args.bloco)
+    X_validacao = copiar_linhas(X, validacao, f'{base}.validacao.f32', args.bloco)
+
+    try:
+        print(f"🔧 Treinando com {len(treino)} textos ({len(validacao)} para validação)...")
+        inicio = time.perf_counter()
+        modelo = RandomForestClassifier(
+            n_estimators=args.arvores, max_depth=args.profundidade,
+            n_jobs=args.jobs, random_state=args.semente
+        )
+        modelo.fit(X_treino, y[treino])
+        print(f"✅ Modelo treinado em {time.perf_counter() - inicio:.1f} s")
+
+        # Inferência do app é sequencial, então o artefato não carrega n_jobs
+        modelo.set_params(n_jobs=None)
+        metricas = avaliar(modelo, X_validacao, y[validacao]) if len(validacao) else {}
+    finally:
+        del X_treino, X_validacao
+        os.remove(f'{base}.treino.f32')
+        os.remove(f'{base}.validacao.f32')
+    if metricas:
+        print(f"📊 Validação: {json.dumps(metricas, ensure_ascii=False)}")
+
+    detector.model = modelo
+    detector.is_trained = True
+    return {
+        'corpus': {'arquivo': os.path.abspath(args.corpus), 'chave_features': chave, 'textos': int(len(y))},
+        'parametros': {'arvores': args.arvores, 'profundidade': args.profundidade, 'validacao': args.validacao, 'semente': args.semente},
+        'metricas_validacao': metricas
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Treina o detector e grava o artefato do modelo')
+    parser.add_argument('--saida', default=CAMINHO_MODELO, help='caminho do .pkl (metadados e floresta ficam ao lado)')
+    parser.add_argument('--corpus', help='JSONL ou CSV com campos text/texto e label/rotulo (1 = IA, 0 = humano)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='processos para features e threads para o fit')
+    parser.add_argument('--bloco', type=int, default=10000, help='textos lidos do corpus por vez')
+    parser.add_argument('--cache-dir', default='.cache_features', help='onde guardar as matrizes de features')
+    parser.add_argument('--validacao', type=float, default=0.2, help='fração separada para validação')
+    parser.add_argument('--arvores', type=int, default=50)
+    parser.add_argument('--profundidade', type=int, default=None)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--ngramas', default=os.environ.get('NGRAMAS_DIR'),
+                        help='tabelas de construir_ngramas.py; acrescenta as features de n-gramas (padrão: NGRAMAS_DIR)')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    detector = AIDetectorComRelatorio(caminho_modelo=args.saida, carregar_modelo=False)
+    detector.ngramas = TabelasNgramas(args.ngramas) if args.ngramas else None
+    if args.corpus:
+        metadados = treinar_corpus(detector, args)
+    else:
+        detector.treinar_modelo()
+        metadados = {}
+    if not detector.is_trained:
+        raise SystemExit(1)
+
+    meta = detector.salvar_modelo(metadados=metadados)
+    print(f"💾 Modelo {meta['versao']} salvo em {args.saida} ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()